@@ -0,0 +1,170 @@
+import asyncio
+import math
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from starlette.responses import JSONResponse
+
+from . import metrics
+
+
+class AdmissionRejected(Exception):
+    """The request would exceed an admission limit."""
+
+    def __init__(self, reason: str, retry_after: int) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+# ---------------------------------------------------------------------------
+# AdmissionController — bounded in-flight OCR work
+# ---------------------------------------------------------------------------
+class AdmissionController:
+    """Bound how many OCR requests are in the service and how many bytes they carry.
+
+    At most `max_active` admitted requests run at once; up to `max_queued`
+    more wait for a slot. A request that would exceed either count, or push
+    the bytes held by admitted requests past `max_bytes`, is rejected at
+    once instead of waiting. A request is always admitted when nothing else
+    is in flight, however large it is. Once an admitted request learns what
+    it really holds (a download, rendered pages), it charges that through
+    `reserve`.
+
+    Used from the event loop only, so the counters need no lock.
+    """
+
+    def __init__(self, max_active: int, max_queued: int, max_bytes: int) -> None:
+        self._max_active = max(1, max_active)
+        self._max_queued = max(0, max_queued)
+        self._max_bytes = max_bytes
+        self._slots = asyncio.Semaphore(self._max_active)
+        self._active = 0
+        self._queued = 0
+        self._bytes = 0
+        # Moving average of how long a request holds its slot; drives Retry-After
+        self._hold_seconds = 1.0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def admit(self, nbytes: int) -> AsyncIterator[None]:
+        """Hold a run slot for the duration of the block; raise AdmissionRejected if full."""
+        if self._active + self._queued >= self._max_active + self._max_queued:
+            self._reject("queue_full")
+        if self._bytes > 0 and self._bytes + nbytes > self._max_bytes:
+            self._reject("bytes")
+        self._queued += 1
+        self._bytes += nbytes
+        self._update_gauges()
+        waiting = True
+        try:
+            start = time.perf_counter()
+            await self._slots.acquire()
+            waiting = False
+            self._queued -= 1
+            self._active += 1
+            self._update_gauges()
+            metrics.ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - start)
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                self._active -= 1
+                self._slots.release()
+                self._hold_seconds = 0.9 * self._hold_seconds + 0.1 * (time.perf_counter() - start)
+        finally:
+            if waiting:
+                self._queued -= 1
+            self._bytes -= nbytes
+            self._update_gauges()
+
+    @asynccontextmanager
+    async def reserve(self, nbytes: int) -> AsyncIterator[None]:
+        """Charge an admitted request `nbytes` more for the duration of the block.
+
+        Raises AdmissionRejected if that would push in-flight bytes past
+        `max_bytes`, unless the caller is the only request in the service.
+        """
+        if self._active + self._queued > 1 and self._bytes + nbytes > self._max_bytes:
+            self._reject("bytes")
+        self._bytes += nbytes
+        self._update_gauges()
+        try:
+            yield
+        finally:
+            self._bytes -= nbytes
+            self._update_gauges()
+
+    def stats(self) -> dict:
+        return {
+            "active": self._active,
+            "queued": self._queued,
+            "inflight_bytes": self._bytes,
+            "rejected": self.rejected,
+        }
+
+    def _reject(self, reason: str) -> None:
+        self.rejected += 1
+        metrics.ADMISSION_REJECTED.labels(reason).inc()
+        # Time for the requests ahead to drain through the run slots
+        ahead = self._queued + self._active
+        retry_after = math.ceil(self._hold_seconds * ahead / self._max_active)
+        raise AdmissionRejected(reason, min(60, max(1, retry_after)))
+
+    def _update_gauges(self) -> None:
+        metrics.ADMISSION_ACTIVE.set(self._active)
+        metrics.ADMISSION_QUEUED.set(self._queued)
+        metrics.ADMISSION_INFLIGHT_BYTES.set(self._bytes)
+
+
+def rejection_response(e: AdmissionRejected) -> JSONResponse:
+    return JSONResponse(
+        {"detail": f"Server busy ({e.reason}), retry later"},
+        status_code=429,
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+# ---------------------------------------------------------------------------
+# AdmissionMiddleware — admit before the body is read
+# ---------------------------------------------------------------------------
+class AdmissionMiddleware:
+    """ASGI middleware admitting requests under `path_prefix` through a controller.
+
+    Admission happens before the endpoint reads the body, so queued requests
+    hold no image data. A request is charged its Content-Length, or
+    `unknown_size` when it has none. The slot is held until the response has
+    been sent, streamed responses included. Rejections get a 429 with
+    Retry-After. Paths in `exclude` are passed through; their endpoints
+    admit their own units of work.
+    """
+
+    def __init__(
+        self,
+        app,
+        controller: AdmissionController,
+        path_prefix: str,
+        unknown_size: int,
+        exclude: frozenset[str] = frozenset(),
+    ) -> None:
+        self.app = app
+        self._controller = controller
+        self._path_prefix = path_prefix
+        self._unknown_size = unknown_size
+        self._exclude = exclude
+
+    async def __call__(self, scope, receive, send) -> None:
+        path = scope.get("path", "")
+        if scope["type"] != "http" or not path.startswith(self._path_prefix) or path in self._exclude:
+            await self.app(scope, receive, send)
+            return
+        nbytes = self._unknown_size
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit():
+                nbytes = int(value)
+        try:
+            async with self._controller.admit(nbytes):
+                await self.app(scope, receive, send)
+        except AdmissionRejected as e:
+            await rejection_response(e)(scope, receive, send)
@@ -0,0 +1,122 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------------------------------
+# DetectionBatcher — coalesces concurrent DEIM calls into batched runs
+# ---------------------------------------------------------------------------
+class DetectionBatcher:
+    """Gather detection requests arriving within `window_ms` into one `detect_batch` call.
+
+    Exposes the same `detect()` / `classes` surface as DEIM, so engine replicas
+    can use it in place of their own detector. Requests whose caller stops
+    waiting (see `wait`) before their batch is formed are left out of it.
+    """
+
+    def __init__(self, detector, window_ms: float, max_batch: int) -> None:
+        self._detector = detector
+        self._window = window_ms / 1000.0
+        self._max_batch = max(1, max_batch)
+        self._queue: queue.Queue[tuple[np.ndarray, Future] | None] = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="deim-batcher", daemon=True)
+        self._thread.start()
+
+    @property
+    def classes(self) -> dict:
+        return self._detector.classes
+
+    @property
+    def max_batch(self) -> int:
+        return self._max_batch
+
+    @property
+    def input_width(self) -> int:
+        return self._detector.input_width
+
+    @property
+    def input_height(self) -> int:
+        return self._detector.input_height
+
+    def submit(self, img_np: np.ndarray) -> Future:
+        future: Future = Future()
+        self._queue.put((img_np, future))
+        return future
+
+    def detect(self, img_np: np.ndarray, cancel=None) -> list[dict]:
+        return self.wait([self.submit(img_np)], cancel)[0]
+
+    @staticmethod
+    def wait(futures: list[Future], cancel=None, poll_interval: float = 0.05) -> list:
+        """Results of `futures`, in order.
+
+        With a CancelToken, its state is polled while waiting; once it fires,
+        the futures not yet taken into a batch are cancelled and
+        OCRCancelled is raised.
+        """
+        if cancel is None:
+            return [future.result() for future in futures]
+        results = []
+        for future in futures:
+            while True:
+                try:
+                    results.append(future.result(timeout=poll_interval))
+                    break
+                except FutureTimeoutError:
+                    if cancel.reason is not None:
+                        for pending in futures:
+                            pending.cancel()
+                        cancel.check()
+        return results
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    # ------------------------------------------------------------------
+    # Worker
+    # ------------------------------------------------------------------
+    def _collect(self, first: tuple[np.ndarray, Future]) -> tuple[list[tuple[np.ndarray, Future]], bool]:
+        """Wait up to the batching window for more requests. Returns (batch, stop)."""
+        batch = [first]
+        deadline = time.monotonic() + self._window
+        while len(batch) < self._max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch, stop = self._collect(item)
+            # Drop requests whose caller already gave up
+            batch = [(img, fut) for img, fut in batch if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self._detector.detect_batch([img for img, _ in batch])
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            logger.debug("DEIM batch of %d image(s)", len(batch))
+            for (_, fut), detections in zip(batch, results):
+                fut.set_result(detections)
@@ -0,0 +1,54 @@
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+
+# ---------------------------------------------------------------------------
+# BufferPool — reusable request body buffers
+# ---------------------------------------------------------------------------
+class BufferPool:
+    """Keep up to `max_buffers` bytearrays for reading request bodies into.
+
+    A borrowed buffer is at least the requested size and is reused by later
+    requests instead of being reallocated; when none is free, a one-off
+    buffer is allocated. Buffers larger than `max_buffer_bytes` are never
+    kept.
+    """
+
+    def __init__(self, max_buffers: int, max_buffer_bytes: int) -> None:
+        self._max_buffers = max_buffers
+        self._max_buffer_bytes = max_buffer_bytes
+        self._free: list[bytearray] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def borrow(self, size: int) -> Iterator[memoryview]:
+        """Yield a writable view of exactly `size` bytes."""
+        buf = self._take(size)
+        try:
+            yield memoryview(buf)[:size]
+        finally:
+            self._give(buf)
+
+    def _take(self, size: int) -> bytearray:
+        with self._lock:
+            # Smallest free buffer that fits, so big ones stay available
+            fits = [b for b in self._free if len(b) >= size]
+            if fits:
+                buf = min(fits, key=len)
+                self._free.remove(buf)
+                return buf
+        return bytearray(size)
+
+    def _give(self, buf: bytearray) -> None:
+        if len(buf) > self._max_buffer_bytes:
+            return
+        with self._lock:
+            if len(self._free) < self._max_buffers:
+                self._free.append(buf)
+            else:
+                # Keep the larger buffers
+                smallest = min(self._free, key=len)
+                if len(smallest) < len(buf):
+                    self._free.remove(smallest)
+                    self._free.append(buf)
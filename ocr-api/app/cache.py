@@ -0,0 +1,133 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------------------------------
+# ResultCache — content-addressed OCR results (memory LRU + optional SQLite)
+# ---------------------------------------------------------------------------
+class ResultCache:
+    """Cache OCR line lists by image content and engine configuration.
+
+    The memory tier is an LRU bounded by the serialized size of its entries.
+    When `disk_path` is set, entries are also written to a SQLite database
+    (bounded by `disk_max_entries`) that survives restarts; disk hits are
+    promoted back into memory.
+    """
+
+    def __init__(self, max_bytes: int, disk_path: str | None = None, disk_max_entries: int = 100_000) -> None:
+        self._max_bytes = max_bytes
+        self._entries: OrderedDict[str, tuple[list[dict], int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+        self._db: sqlite3.Connection | None = None
+        self._disk_max_entries = disk_max_entries
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            # WAL keeps commits cheap enough for the request path
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+            self._db.commit()
+            # Row count kept up to date by _disk_put, so puts never scan the table
+            (self._disk_entries,) = self._db.execute("SELECT COUNT(*) FROM results").fetchone()
+            logger.info("Result cache disk tier at %s", disk_path)
+
+    @staticmethod
+    def make_key(image_bytes: bytes, config: str) -> str:
+        h = hashlib.sha256(config.encode())
+        h.update(image_bytes)
+        return h.hexdigest()
+
+    def get(self, key: str) -> list[dict] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            value = self._disk_get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            lines = json.loads(value)
+            self._memory_put(key, lines, len(value.encode()))
+            return lines
+
+    def put(self, key: str, lines: list[dict]) -> None:
+        value = json.dumps(lines, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._memory_put(key, lines, len(value.encode()))
+            self._disk_put(key, value)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "entries": len(self._entries),
+                "size_bytes": self._bytes,
+            }
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    # ------------------------------------------------------------------
+    # Tiers (caller holds the lock)
+    # ------------------------------------------------------------------
+    def _memory_put(self, key: str, lines: list[dict], size: int) -> None:
+        if size > self._max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._entries[key] = (lines, size)
+        self._bytes += size
+        while self._bytes > self._max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+
+    def _disk_get(self, key: str) -> str | None:
+        if self._db is None:
+            return None
+        row = self._db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+        self._db.commit()
+        return row[0]
+
+    def _disk_put(self, key: str, value: str) -> None:
+        if self._db is None:
+            return
+        now = time.time()
+        cursor = self._db.execute("UPDATE results SET value = ?, accessed = ? WHERE key = ?", (value, now, key))
+        if cursor.rowcount == 0:
+            self._db.execute("INSERT INTO results (key, value, accessed) VALUES (?, ?, ?)", (key, value, now))
+            self._disk_entries += 1
+        if self._disk_entries > self._disk_max_entries:
+            cursor = self._db.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY accessed LIMIT ?)",
+                (self._disk_entries - self._disk_max_entries,),
+            )
+            self._disk_entries -= cursor.rowcount
+        self._db.commit()
@@ -0,0 +1,129 @@
+import io
+import math
+import threading
+from collections.abc import Iterator
+
+import numpy as np
+from PIL import Image
+
+# pdfium is not thread-safe, even across documents
+_PDFIUM_LOCK = threading.Lock()
+
+
+class DocumentError(ValueError):
+    """The upload is not a readable PDF or TIFF."""
+
+
+class DocumentTooLarge(DocumentError):
+    """A TIFF frame has more pixels than the page budget allows."""
+
+
+# ---------------------------------------------------------------------------
+# Document — lazily rendered pages of a PDF or multi-frame TIFF
+# ---------------------------------------------------------------------------
+class Document:
+    """Pages of an uploaded document, rendered one at a time on iteration.
+
+    PDF pages are rasterized at `dpi`, lowered for any page that would
+    exceed `max_pixels`; TIFF frames keep their own resolution, and a frame
+    above `max_pixels` rejects the whole document. Only the page currently
+    being produced is held here, so memory is bounded by what the consumer
+    keeps. `max_page_pixels` is the pixel count of the largest page as it
+    will be produced, known before anything is rendered.
+    """
+
+    def __init__(self, data: bytes, dpi: float, max_pixels: int) -> None:
+        self._data = data
+        self._dpi = dpi
+        self._max_pixels = max_pixels
+        if data[:5] == b"%PDF-":
+            self.kind = "pdf"
+            self.num_pages, self.max_page_pixels = self._scan_pdf()
+        else:
+            self.kind = "tiff"
+            self.num_pages, self.max_page_pixels = self._scan_tiff()
+
+    def iter_pages(self) -> Iterator[np.ndarray]:
+        """Yield every page as an RGB array."""
+        if self.kind == "pdf":
+            yield from self._iter_pdf()
+        else:
+            yield from self._iter_tiff()
+
+    # ------------------------------------------------------------------
+    # PDF
+    # ------------------------------------------------------------------
+    def _scan_pdf(self) -> tuple[int, int]:
+        """(page count, pixels of the largest rendered page) from the page sizes."""
+        import pypdfium2
+
+        with _PDFIUM_LOCK:
+            try:
+                pdf = pypdfium2.PdfDocument(self._data)
+            except pypdfium2.PdfiumError as e:
+                raise DocumentError(f"Invalid PDF: {e}") from e
+            try:
+                max_pixels = 0
+                for i in range(len(pdf)):
+                    width, height = pdf.get_page_size(i)
+                    scale = self._pdf_scale(width, height)
+                    max_pixels = max(max_pixels, math.ceil(width * scale) * math.ceil(height * scale))
+                return len(pdf), max_pixels
+            finally:
+                pdf.close()
+
+    def _iter_pdf(self) -> Iterator[np.ndarray]:
+        import pypdfium2
+
+        with _PDFIUM_LOCK:
+            pdf = pypdfium2.PdfDocument(self._data)
+        try:
+            for i in range(self.num_pages):
+                with _PDFIUM_LOCK:
+                    page = pdf[i]
+                    try:
+                        bitmap = page.render(scale=self._pdf_scale(*page.get_size()))
+                        img = bitmap.to_pil().convert("RGB")
+                    finally:
+                        page.close()
+                yield np.asarray(img)
+        finally:
+            with _PDFIUM_LOCK:
+                pdf.close()
+
+    def _pdf_scale(self, width: float, height: float) -> float:
+        """Render scale for a page of `width` x `height` pt: `dpi`, reduced to stay within `max_pixels`."""
+        scale = self._dpi / 72
+        pixels = width * height * scale * scale
+        if pixels > self._max_pixels:
+            scale *= math.sqrt(self._max_pixels / pixels)
+        return scale
+
+    # ------------------------------------------------------------------
+    # TIFF
+    # ------------------------------------------------------------------
+    def _scan_tiff(self) -> tuple[int, int]:
+        """(frame count, pixels of the largest frame), checking every frame's size from its header."""
+        try:
+            with Image.open(io.BytesIO(self._data)) as img:
+                if img.format != "TIFF":
+                    raise DocumentError(f"Unsupported document format: {img.format}")
+                num_frames = getattr(img, "n_frames", 1)
+                max_pixels = 0
+                for i in range(num_frames):
+                    img.seek(i)
+                    width, height = img.size
+                    if width * height > self._max_pixels:
+                        raise DocumentTooLarge(
+                            f"Frame {i + 1} is {width}x{height}, above the {self._max_pixels} pixel limit"
+                        )
+                    max_pixels = max(max_pixels, width * height)
+                return num_frames, max_pixels
+        except (OSError, Image.UnidentifiedImageError, Image.DecompressionBombError) as e:
+            raise DocumentError(f"Invalid TIFF: {e}") from e
+
+    def _iter_tiff(self) -> Iterator[np.ndarray]:
+        with Image.open(io.BytesIO(self._data)) as img:
+            for i in range(self.num_pages):
+                img.seek(i)
+                yield np.asarray(img.convert("RGB"))
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class FetchError(Exception):
+    """The image could not be downloaded."""
+
+
+class FetchTooLargeError(FetchError):
+    """The response body exceeds the size limit."""
+
+
+# ---------------------------------------------------------------------------
+# ImageFetcher — pooled, size-capped HTTP downloads
+# ---------------------------------------------------------------------------
+class ImageFetcher:
+    """Download images over one long-lived connection pool.
+
+    Connections are kept alive across requests, at most `max_per_host`
+    downloads run against any one host, and bodies are streamed so a
+    download is aborted as soon as it passes `max_bytes`. A host's limiter
+    only exists while downloads from it are running or waiting.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        max_connections: int = 64,
+        max_per_host: int = 8,
+        timeout: float = 30.0,
+    ) -> None:
+        self._max_bytes = max_bytes
+        self._max_per_host = max_per_host
+        # (scheme, host, port) -> [semaphore, downloads running or waiting]
+        self._hosts: dict[tuple[str, str, int | None], list] = {}
+        self._client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def fetch(self, url: str) -> bytes:
+        try:
+            parsed = httpx.URL(url)
+        except httpx.InvalidURL as e:
+            raise FetchError(f"Invalid URL: {e}") from e
+        host = (parsed.scheme, parsed.host, parsed.port)
+        entry = self._hosts.get(host)
+        if entry is None:
+            entry = self._hosts[host] = [asyncio.Semaphore(self._max_per_host), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                try:
+                    async with self._client.stream("GET", parsed) as resp:
+                        resp.raise_for_status()
+                        return await self._read_body(resp)
+                except httpx.HTTPError as e:
+                    raise FetchError(str(e)) from e
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._hosts[host]
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+    async def _read_body(self, resp: httpx.Response) -> bytes:
+        limit_mb = self._max_bytes // (1024 * 1024)
+        length = resp.headers.get("content-length")
+        if length is not None and length.isdigit() and int(length) > self._max_bytes:
+            raise FetchTooLargeError(f"Image exceeds {limit_mb} MB limit")
+        chunks: list[bytes] = []
+        size = 0
+        async for chunk in resp.aiter_bytes():
+            size += len(chunk)
+            if size > self._max_bytes:
+                raise FetchTooLargeError(f"Image exceeds {limit_mb} MB limit")
+            chunks.append(chunk)
+        return b"".join(chunks)
@@ -0,0 +1,292 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[bytes, dict], Awaitable[dict]]
+
+
+# ---------------------------------------------------------------------------
+# JobStore — durable job queue in SQLite
+# ---------------------------------------------------------------------------
+class JobStore:
+    """Queued uploads and their results, surviving restarts.
+
+    status: queued -> running -> done | failed. Jobs left running by a crash
+    are queued again on startup, unless they have already been started
+    `max_attempts` times: a payload that takes the process down is failed
+    instead of crashing it on every restart. The upload is dropped once a
+    job finishes; finished jobs are deleted after the result TTL.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3) -> None:
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, params TEXT NOT NULL, payload BLOB, "
+            "callback_url TEXT, status TEXT NOT NULL, created REAL NOT NULL, started REAL, "
+            "finished REAL, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        if "attempts" not in columns:
+            self._db.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created)")
+        abandoned = self._db.execute(
+            "UPDATE jobs SET status = 'failed', finished = ?, payload = NULL, "
+            "error = 'Interrupted ' || attempts || ' time(s), giving up' "
+            "WHERE status = 'running' AND attempts >= ?",
+            (time.time(), max_attempts),
+        ).rowcount
+        requeued = self._db.execute("UPDATE jobs SET status = 'queued', started = NULL WHERE status = 'running'").rowcount
+        self._db.commit()
+        if abandoned:
+            logger.warning("Failed %d job(s) interrupted %d times", abandoned, max_attempts)
+        if requeued:
+            logger.info("Requeued %d interrupted job(s)", requeued)
+
+    def enqueue(self, kind: str, payload: bytes, params: dict, callback_url: str | None = None) -> dict:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, params, payload, callback_url, status, created) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+                (job_id, kind, json.dumps(params), payload, callback_url, time.time()),
+            )
+            self._db.commit()
+        return self.get(job_id)
+
+    def claim(self) -> tuple[dict, bytes] | None:
+        """Mark the oldest queued job running and count the attempt; returns (job, payload) or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, payload FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE jobs SET status = 'running', started = ?, attempts = attempts + 1 WHERE id = ?",
+                (time.time(), row[0]),
+            )
+            self._db.commit()
+        return self.get(row[0]), row[1]
+
+    def release(self, job_id: str) -> None:
+        """Queue a running job again without counting its attempt, for a graceful shutdown."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'queued', started = NULL, attempts = MAX(attempts - 1, 0) "
+                "WHERE id = ? AND status = 'running'",
+                (job_id,),
+            )
+            self._db.commit()
+
+    def complete(self, job_id: str, result: dict) -> None:
+        self._finish(job_id, "done", result=json.dumps(result, ensure_ascii=False))
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._finish(job_id, "failed", error=error)
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, kind, params, callback_url, status, created, started, finished, result, error, attempts "
+                "FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "kind": row[1],
+            "params": json.loads(row[2]),
+            "callback_url": row[3],
+            "status": row[4],
+            "created": row[5],
+            "started": row[6],
+            "finished": row[7],
+            "result": json.loads(row[8]) if row[8] is not None else None,
+            "error": row[9],
+            "attempts": row[10],
+        }
+
+    def queued(self) -> int:
+        with self._lock:
+            (count,) = self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()
+        return count
+
+    def purge(self, ttl: float) -> int:
+        """Delete finished jobs older than `ttl` seconds."""
+        with self._lock:
+            count = self._db.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished < ?", (time.time() - ttl,)
+            ).rowcount
+            self._db.commit()
+        return count
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _finish(self, job_id: str, status: str, result: str | None = None, error: str | None = None) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, finished = ?, result = ?, error = ?, payload = NULL WHERE id = ?",
+                (status, time.time(), result, error, job_id),
+            )
+            self._db.commit()
+
+
+# ---------------------------------------------------------------------------
+# JobRunner — in-process workers draining the JobStore
+# ---------------------------------------------------------------------------
+class JobRunner:
+    """Asyncio worker tasks that process queued jobs with per-kind handlers.
+
+    `handlers` map a job kind to a coroutine taking (payload, params) and
+    returning the JSON result. When a job has a callback URL, its final state
+    is POSTed there; only hosts in `webhook_hosts` are accepted at submit time.
+    Webhooks are delivered by `webhook_workers` separate tasks, so a slow or
+    dead callback host never holds up OCR workers.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        handlers: dict[str, JobHandler],
+        num_workers: int,
+        result_ttl: float,
+        webhook_hosts: set[str],
+        webhook_workers: int = 4,
+        poll_interval: float = 1.0,
+    ) -> None:
+        self.store = store
+        self._handlers = handlers
+        self._num_workers = max(1, num_workers)
+        self._result_ttl = result_ttl
+        self._webhook_hosts = webhook_hosts
+        self._webhook_workers = max(1, webhook_workers)
+        self._poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        # (job id, callback URL) of finished jobs waiting for their webhook
+        self._webhooks: asyncio.Queue[tuple[str, str]] = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+        self._client: httpx.AsyncClient | None = None
+
+    def start(self) -> None:
+        self._client = httpx.AsyncClient(timeout=10)
+        self._tasks = [asyncio.create_task(self._work(), name=f"ocr-job-{i}") for i in range(self._num_workers)]
+        self._tasks += [
+            asyncio.create_task(self._deliver(), name=f"ocr-job-webhook-{i}") for i in range(self._webhook_workers)
+        ]
+        self._tasks.append(asyncio.create_task(self._purge(), name="ocr-job-purge"))
+        logger.info("Job queue started with %d worker(s)", self._num_workers)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def check_callback_url(self, url: str) -> None:
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or parts.hostname not in self._webhook_hosts:
+            raise ValueError(f"Callback host not allowed: {parts.hostname}")
+
+    async def submit(self, kind: str, payload: bytes, params: dict, callback_url: str | None = None) -> dict:
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if callback_url is not None:
+            self.check_callback_url(callback_url)
+        job = await asyncio.to_thread(self.store.enqueue, kind, payload, params, callback_url)
+        self._wakeup.set()
+        return job
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+    async def _work(self) -> None:
+        while True:
+            try:
+                claimed = await asyncio.to_thread(self.store.claim)
+            except sqlite3.Error:
+                logger.exception("Claiming a job failed")
+                await asyncio.sleep(self._poll_interval)
+                continue
+            if claimed is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self._poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            job, payload = claimed
+            try:
+                result = await self._handlers[job["kind"]](payload, job["params"])
+            except asyncio.CancelledError:
+                # Shutting down: hand the job to the next start without
+                # counting it, so only real crashes use up its attempts
+                try:
+                    self.store.release(job["id"])
+                except sqlite3.Error:
+                    logger.exception("Requeueing job %s failed", job["id"])
+                raise
+            except Exception as e:
+                detail = getattr(e, "detail", None) or str(e)
+                logger.warning("Job %s failed: %s", job["id"], detail)
+                finish, args = self.store.fail, (job["id"], str(detail))
+            else:
+                finish, args = self.store.complete, (job["id"], result)
+            try:
+                await asyncio.to_thread(finish, *args)
+            except sqlite3.Error:
+                # Left running: the job is retried after the next restart
+                logger.exception("Recording the outcome of job %s failed", job["id"])
+                continue
+            if job["callback_url"]:
+                self._webhooks.put_nowait((job["id"], job["callback_url"]))
+
+    async def _deliver(self) -> None:
+        while True:
+            job_id, url = await self._webhooks.get()
+            await self._notify(job_id, url)
+
+    async def _notify(self, job_id: str, url: str, attempts: int = 3) -> None:
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None or self._client is None:
+            return
+        job.pop("callback_url", None)
+        for attempt in range(attempts):
+            try:
+                resp = await self._client.post(url, json=job)
+                resp.raise_for_status()
+                return
+            except httpx.HTTPError as e:
+                logger.warning("Webhook for job %s failed (attempt %d/%d): %s", job_id, attempt + 1, attempts, e)
+                if attempt + 1 < attempts:
+                    await asyncio.sleep(2**attempt)
+
+    async def _purge(self) -> None:
+        while True:
+            try:
+                removed = await asyncio.to_thread(self.store.purge, self._result_ttl)
+            except sqlite3.Error:
+                logger.exception("Purging expired jobs failed")
+                removed = 0
+            if removed:
+                logger.info("Purged %d expired job(s)", removed)
+            await asyncio.sleep(min(self._result_ttl, 600))
@@ -1,13 +1,49 @@
 import asyncio
 import base64
+import functools
+import json
 import logging
-from contextlib import asynccontextmanager
+import os
+import tempfile
+import threading
+import time
+from collections.abc import AsyncIterator, Callable, Iterator
+from contextlib import asynccontextmanager, nullcontext
+from typing import Literal
 
-import httpx
-from fastapi import FastAPI, HTTPException, UploadFile
+import numpy as np
+from fastapi import Depends, FastAPI, Form, Header, HTTPException, Request, Response, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
+from PIL import Image
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
-from .ocr_engine import NdlOCREngine
-from .schemas import HealthResponse, OCRLine, OCRRequestBase64, OCRRequestURL, OCRResponse
+from . import metrics
+from .admission import AdmissionController, AdmissionMiddleware, AdmissionRejected, rejection_response
+
+from .buffers import BufferPool
+from .cache import ResultCache
+from .documents import Document, DocumentError, DocumentTooLarge
+from .fetch import FetchError, FetchTooLargeError, ImageFetcher
+from .jobs import JobRunner, JobStore
+from .ocr_engine import CancelToken, NdlOCREngine, OCRCancelled
+from .schemas import (
+    AdmissionStats,
+    CacheStats,
+    HealthResponse,
+    JobResponse,
+    OCRDocumentResponse,
+    OCRLine,
+    OCRPage,
+    OCRRequestBase64,
+    OCRRequestURL,
+    OCRRequestURLs,
+    OCRResponse,
+    OCRTrace,
+    OCRURLResult,
+    OCRURLsResponse,
+    ProbeResponse,
+)
+from .tracing import RequestTrace
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -15,33 +51,504 @@ logger = logging.getLogger(__name__)
 MAX_FILE_SIZE = 20 * 1024 * 1024  # 20 MB
 ALLOWED_CONTENT_TYPES = {"image/jpeg", "image/png", "image/bmp", "image/tiff", "image/webp"}
 
+# /ocr/raw: request bodies are read into pooled buffers
+MAX_RAW_FRAME_SIZE = int(float(os.environ.get("OCR_MAX_RAW_FRAME_MB", "64")) * 1024 * 1024)
+RAW_BUFFERS = int(os.environ.get("OCR_RAW_BUFFERS", "4"))
+RAW_PIXEL_CHANNELS = {"rgb": 3, "gray": 1}
+
+# Multi-page documents (PDF / multi-frame TIFF)
+ALLOWED_DOCUMENT_TYPES = {"application/pdf", "image/tiff"}
+MAX_DOCUMENT_SIZE = int(float(os.environ.get("OCR_MAX_DOCUMENT_MB", "50")) * 1024 * 1024)
+MAX_DOCUMENT_PAGES = int(os.environ.get("OCR_MAX_DOCUMENT_PAGES", "100"))
+DOCUMENT_DPI = float(os.environ.get("OCR_DOCUMENT_DPI", "150"))
+# Pixel budget per page: PDF pages render at a lower dpi to fit, larger TIFF frames are refused
+DOCUMENT_MAX_PIXELS = int(float(os.environ.get("OCR_DOCUMENT_MAX_MEGAPIXELS", "25")) * 1_000_000)
+DOCUMENT_DETECT_BATCH = int(os.environ.get("OCR_DOCUMENT_DETECT_BATCH", "4"))
+
+# Engine pool: independent detector+recognizer replicas served concurrently
+NUM_REPLICAS = int(os.environ.get("OCR_NUM_REPLICAS", "1"))
+INTRA_OP_THREADS = int(os.environ["OCR_INTRA_OP_THREADS"]) if "OCR_INTRA_OP_THREADS" in os.environ else None
+
+# Optimized ONNX graphs and parsed charset kept across restarts ("" = disabled)
+MODEL_CACHE_DIR = os.environ.get("OCR_MODEL_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ndlocr-lite-cache"))
+
+# Admission control for /ocr/*: requests holding a run slot, requests waiting
+# for one, and request bytes held by both; over the limit = immediate 429
+# (0 active = disabled)
+ADMISSION_MAX_ACTIVE = int(os.environ.get("OCR_MAX_ACTIVE_REQUESTS", str(2 * NUM_REPLICAS)))
+ADMISSION_MAX_QUEUED = int(os.environ.get("OCR_MAX_QUEUED_REQUESTS", str(8 * NUM_REPLICAS)))
+ADMISSION_MAX_BYTES = int(float(os.environ.get("OCR_MAX_INFLIGHT_MB", "256")) * 1024 * 1024)
+
+# Warm-up: synthetic pages and line crops through every model before /readyz
+# reports ready (0 rounds = ready as soon as the models are loaded)
+WARMUP_ROUNDS = int(os.environ.get("OCR_WARMUP_ROUNDS", "1"))
+
+# DEIM input sizes to load from deim-s-<size>x<size>.onnx (unset = all found);
+# with several, each image is detected at the smallest size it allows
+DETECTOR_SIZES = [int(s) for s in os.environ.get("OCR_DETECTOR_SIZES", "").split(",") if s.strip()] or None
+
+# Decode JPEGs reduced for detection and at line-height resolution for crops
+JPEG_DRAFT = os.environ.get("OCR_JPEG_DRAFT", "0").lower() in ("1", "true", "yes")
+
+# DEIM micro-batching across concurrent requests (0 ms window = disabled)
+DETECT_BATCH_WINDOW_MS = float(os.environ.get("OCR_DETECT_BATCH_WINDOW_MS", "0"))
+DETECT_MAX_BATCH = int(os.environ.get("OCR_DETECT_MAX_BATCH", "8"))
+
+# Result cache keyed by image bytes + model/threshold config (0 MB = disabled)
+CACHE_MAX_BYTES = int(float(os.environ.get("OCR_CACHE_MAX_MB", "64")) * 1024 * 1024)
+CACHE_DB_PATH = os.environ.get("OCR_CACHE_DB")  # optional SQLite disk tier
+
+# /ocr/url(s): shared connection pool, per-host limit and bounded batch prefetch
+URL_MAX_CONNECTIONS = int(os.environ.get("OCR_URL_MAX_CONNECTIONS", "64"))
+URL_MAX_PER_HOST = int(os.environ.get("OCR_URL_MAX_PER_HOST", "8"))
+URL_TIMEOUT = float(os.environ.get("OCR_URL_TIMEOUT_S", "30"))
+URL_BATCH_MAX = int(os.environ.get("OCR_URL_BATCH_MAX", "32"))
+URL_PREFETCH = int(os.environ.get("OCR_URL_PREFETCH", "4"))
+
+# Opt-in request tracing: ?trace=profile writes cProfile dumps here (unset = disabled)
+PROFILE_DIR = os.environ.get("OCR_PROFILE_DIR")
+
+# Asynchronous jobs: durable SQLite queue drained by in-process workers.
+# Disabled unless OCR_JOB_DB names the database file (or with 0 workers).
+JOB_DB_PATH = os.environ.get("OCR_JOB_DB")
+JOB_WORKERS = int(os.environ.get("OCR_JOB_WORKERS", str(NUM_REPLICAS)))
+JOB_MAX_ATTEMPTS = int(os.environ.get("OCR_JOB_MAX_ATTEMPTS", "3"))
+JOB_MAX_QUEUED = int(os.environ.get("OCR_JOB_MAX_QUEUED", "1000"))
+JOB_RESULT_TTL = float(os.environ.get("OCR_JOB_RESULT_TTL_S", "86400"))
+JOB_WEBHOOK_HOSTS = {
+    h.strip() for h in os.environ.get("OCR_JOB_WEBHOOK_HOSTS", "localhost,127.0.0.1,::1").split(",") if h.strip()
+}
+
 engine = NdlOCREngine()
+raw_buffers = BufferPool(RAW_BUFFERS, MAX_RAW_FRAME_SIZE)
+admission = (
+    AdmissionController(ADMISSION_MAX_ACTIVE, ADMISSION_MAX_QUEUED, ADMISSION_MAX_BYTES)
+    if ADMISSION_MAX_ACTIVE > 0
+    else None
+)
+cache: ResultCache | None = None
+fetcher: ImageFetcher | None = None
+jobs: JobRunner | None = None
+ready = asyncio.Event()  # set once the engine is warmed up
+warmup_task: asyncio.Task | None = None
+
+
+async def _warm_up() -> None:
+    try:
+        await asyncio.to_thread(engine.warm_up, WARMUP_ROUNDS, detect_batch_sizes=(DOCUMENT_DETECT_BATCH,))
+    except Exception:
+        logger.exception("Warm-up failed; /readyz stays unready")
+        return
+    ready.set()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    engine.initialize()
+    global cache, fetcher, jobs, warmup_task
+    engine.initialize(
+        num_replicas=NUM_REPLICAS,
+        intra_op_threads=INTRA_OP_THREADS,
+        detect_batch_window_ms=DETECT_BATCH_WINDOW_MS,
+        detect_max_batch=DETECT_MAX_BATCH,
+        jpeg_draft=JPEG_DRAFT,
+        model_cache_dir=MODEL_CACHE_DIR or None,
+        detector_sizes=DETECTOR_SIZES,
+    )
+    if PROFILE_DIR:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+    if CACHE_MAX_BYTES > 0 or CACHE_DB_PATH:
+        cache = ResultCache(CACHE_MAX_BYTES, disk_path=CACHE_DB_PATH)
+    fetcher = ImageFetcher(
+        MAX_FILE_SIZE, max_connections=URL_MAX_CONNECTIONS, max_per_host=URL_MAX_PER_HOST, timeout=URL_TIMEOUT
+    )
+    if JOB_DB_PATH and JOB_WORKERS > 0:
+        jobs = JobRunner(
+            JobStore(JOB_DB_PATH, max_attempts=JOB_MAX_ATTEMPTS),
+            {"image": _run_image_job, "document": _run_document_job},
+            num_workers=JOB_WORKERS,
+            result_ttl=JOB_RESULT_TTL,
+            webhook_hosts=JOB_WEBHOOK_HOSTS,
+        )
+        jobs.start()
+    # Warm up in the background so /livez answers meanwhile
+    if WARMUP_ROUNDS > 0:
+        warmup_task = asyncio.create_task(_warm_up())
+    else:
+        ready.set()
     yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+    if jobs is not None:
+        await jobs.stop()
+        jobs.store.close()
+    await fetcher.close()
+    engine.close()
+    if cache is not None:
+        cache.close()
 
 
 app = FastAPI(title="Japanese OCR API", version="2.0.0", lifespan=lifespan)
+metrics.register_cache(lambda: cache)
+if admission is not None:
+    # Bodies without Content-Length are charged the document size limit.
+    # /ocr/urls admits every URL of the batch separately instead.
+    app.add_middleware(
+        AdmissionMiddleware,
+        controller=admission,
+        path_prefix="/ocr/",
+        unknown_size=MAX_DOCUMENT_SIZE,
+        exclude=frozenset({"/ocr/urls"}),
+    )
+
+
+@app.exception_handler(OCRCancelled)
+async def ocr_cancelled(request: Request, exc: OCRCancelled):
+    if exc.reason == CancelToken.DEADLINE_EXCEEDED:
+        return JSONResponse({"detail": "OCR deadline exceeded"}, status_code=504)
+    # Nobody reads this; 499 (client closed request) keeps it apart in access logs
+    return JSONResponse({"detail": "Client disconnected"}, status_code=499)
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected):
+    return rejection_response(exc)
+
+
+@app.exception_handler(Image.DecompressionBombError)
+async def decompression_bomb(request: Request, exc: Image.DecompressionBombError):
+    return JSONResponse({"detail": f"Image too large: {exc}"}, status_code=400)
+
+
+class InFlightMiddleware:
+    """ASGI middleware counting requests in REQUESTS_IN_FLIGHT until their
+    response has been sent, streamed bodies included, and stamping their
+    arrival time. Probe and metrics paths are not counted."""
+
+    EXCLUDE = frozenset({"/metrics", "/livez", "/readyz"})
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope.get("path", "") in self.EXCLUDE:
+            await self.app(scope, receive, send)
+            return
+        # Request deadlines (X-OCR-Timeout-Ms) count from here, admission wait included
+        scope.setdefault("state", {})["arrived"] = time.monotonic()
+        metrics.REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            metrics.REQUESTS_IN_FLIGHT.dec()
+
+
+# Added last so it wraps admission
+app.add_middleware(InFlightMiddleware)
 
 
 # ------------------------------------------------------------------
 # Helpers
 # ------------------------------------------------------------------
 def _lines_to_response(raw: list[dict]) -> OCRResponse:
-    return OCRResponse(
-        lines=[
-            OCRLine(
-                text=r["text"],
-                confidence=r["confidence"],
-                box=r["box"],
-                is_vertical=r["is_vertical"],
+    with metrics.STAGE_SECONDS.labels("serialize").time():
+        return OCRResponse(
+            lines=[
+                OCRLine(
+                    text=r["text"],
+                    confidence=r["confidence"],
+                    box=r["box"],
+                    is_vertical=r["is_vertical"],
+                )
+                for r in raw
+            ]
+        )
+
+
+def _request_trace(
+    trace: Literal["timing", "profile"] | None = None,
+    x_ocr_trace: Literal["timing", "profile"] | None = Header(None),
+) -> RequestTrace | None:
+    """Opt-in tracing, requested with ?trace= or the X-OCR-Trace header."""
+    mode = trace or x_ocr_trace
+    if mode is None:
+        return None
+    if mode == "profile":
+        if not PROFILE_DIR:
+            raise HTTPException(400, "Profiling is disabled (OCR_PROFILE_DIR is not set)")
+        return RequestTrace(PROFILE_DIR)
+    return RequestTrace()
+
+
+def _detector_size(
+    detector_size: int | None = None,
+    x_ocr_detector_size: int | None = Header(None),
+) -> int | None:
+    """Optional DEIM input size override, given as ?detector_size= or the X-OCR-Detector-Size header."""
+    size = detector_size or x_ocr_detector_size
+    if size is not None and size not in engine.detector_sizes:
+        raise HTTPException(400, f"detector_size must be one of {engine.detector_sizes}")
+    return size
+
+
+def _cancel_token(request: Request, x_ocr_timeout_ms: float | None = Header(None)) -> CancelToken:
+    """Cancellation for one request, with the deadline from the X-OCR-Timeout-Ms header."""
+    if x_ocr_timeout_ms is None:
+        return CancelToken()
+    if x_ocr_timeout_ms <= 0:
+        raise HTTPException(400, "X-OCR-Timeout-Ms must be positive")
+    arrived = getattr(request.state, "arrived", time.monotonic())
+    return CancelToken(deadline=arrived + x_ocr_timeout_ms / 1000)
+
+
+@asynccontextmanager
+async def _cancel_on_disconnect(request: Request, cancel: CancelToken) -> AsyncIterator[None]:
+    """Cancel `cancel` if the client goes away while the block runs.
+
+    Only for use once the request body has been read: the watcher consumes
+    the remaining ASGI receive messages.
+    """
+
+    async def watch() -> None:
+        while (await request.receive())["type"] != "http.disconnect":
+            pass
+        cancel.cancel("client_disconnected")
+
+    watcher = asyncio.create_task(watch())
+    try:
+        yield
+    finally:
+        watcher.cancel()
+
+
+def _with_trace(response: OCRResponse | OCRDocumentResponse, trace: RequestTrace | None):
+    if trace is not None:
+        response.trace = OCRTrace(**trace.to_dict())
+    return response
+
+
+async def _predict(
+    data: bytes | memoryview,
+    frame: np.ndarray | None = None,
+    key_suffix: str = "",
+    trace: RequestTrace | None = None,
+    cancel: CancelToken | None = None,
+    detector_size: int | None = None,
+) -> list[dict]:
+    """Run OCR, answering repeat uploads of the same image from the cache.
+
+    `data` is the encoded image, or the pixels of `frame` when a decoded
+    frame is given (its shape then goes into `key_suffix`). Traced requests
+    bypass the cache so that every stage is measured.
+    """
+    image = data if frame is None else frame
+    run = functools.partial(engine.predict, cancel=cancel, detector_size=detector_size)
+    if trace is not None:
+        return await asyncio.to_thread(trace.run, run, image)
+    if cache is None:
+        return await asyncio.to_thread(run, image)
+    if detector_size is not None:
+        key_suffix += f"|detector={detector_size}"
+    key = ResultCache.make_key(data, engine.config_fingerprint + key_suffix)
+    lines = await asyncio.to_thread(cache.get, key)
+    if lines is None:
+        lines = await asyncio.to_thread(run, image)
+        await asyncio.to_thread(cache.put, key, lines)
+    return lines
+
+
+async def _read_body_into(request: Request, view: memoryview) -> int:
+    """Copy the request body into `view`; returns the number of bytes read."""
+    size = 0
+    async for chunk in request.stream():
+        end = size + len(chunk)
+        if end > len(view):
+            raise HTTPException(413, "Request body exceeds the declared size")
+        view[size:end] = chunk
+        size = end
+    return size
+
+
+@asynccontextmanager
+async def _reserve(nbytes: int):
+    """Charge the admitted request `nbytes` more while the block runs (no-op without admission)."""
+    if admission is None:
+        yield
+        return
+    async with admission.reserve(nbytes):
+        yield
+
+
+@asynccontextmanager
+async def _admit(nbytes: int):
+    """Admit one unit of work from an endpoint the admission middleware skips."""
+    if admission is None:
+        yield
+        return
+    async with admission.admit(nbytes):
+        yield
+
+
+async def _predict_document(
+    data: bytes,
+    dpi: float,
+    trace: RequestTrace | None = None,
+    cancel: CancelToken | None = None,
+    detector_size: int | None = None,
+    admitted: bool = False,
+) -> list[dict]:
+    """Run OCR on every page of a PDF/TIFF, with the same caching as `_predict`.
+
+    With `admitted`, the pixels of the pages in flight are charged to the
+    request's admission once the page sizes are known.
+    """
+    key = None
+    if cache is not None and trace is None:
+        suffix = f"|document|dpi={dpi}" + (f"|detector={detector_size}" if detector_size is not None else "")
+        key = ResultCache.make_key(data, engine.config_fingerprint + suffix)
+        pages = await asyncio.to_thread(cache.get, key)
+        if pages is not None:
+            return pages
+
+    try:
+        document = await asyncio.to_thread(Document, data, dpi, DOCUMENT_MAX_PIXELS)
+    except DocumentTooLarge as e:
+        raise HTTPException(413, str(e))
+    except DocumentError as e:
+        raise HTTPException(400, str(e))
+    if document.num_pages > MAX_DOCUMENT_PAGES:
+        raise HTTPException(413, f"Document exceeds {MAX_DOCUMENT_PAGES} pages")
+    pages_in_flight = min(document.num_pages, engine.document_pages_in_flight(DOCUMENT_DETECT_BATCH))
+    async with _reserve(pages_in_flight * document.max_page_pixels * 3) if admitted else nullcontext():
+        if trace is not None:
+            return await asyncio.to_thread(
+                trace.run,
+                engine.predict_document,
+                trace.timed(document.iter_pages(), "render"),
+                detect_batch=DOCUMENT_DETECT_BATCH,
+                cancel=cancel,
+                detector_size=detector_size,
             )
-            for r in raw
+        pages = await asyncio.to_thread(
+            engine.predict_document,
+            document.iter_pages(),
+            detect_batch=DOCUMENT_DETECT_BATCH,
+            cancel=cancel,
+            detector_size=detector_size,
+        )
+    if key is not None:
+        await asyncio.to_thread(cache.put, key, pages)
+    return pages
+
+
+async def _run_image_job(data: bytes, params: dict) -> dict:
+    return {"lines": await _predict(data)}
+
+
+async def _run_document_job(data: bytes, params: dict) -> dict:
+    return {"pages": await _predict_document(data, params["dpi"])}
+
+
+async def _iterate_in_thread(make_iter: Callable[[], Iterator[dict]]) -> AsyncIterator[dict]:
+    """Drive a blocking iterator in a worker thread, yielding its items here.
+
+    If the consumer stops early (e.g. the client disconnected), the iterator
+    is closed after its next item so the engine replica is released.
+    """
+    loop = asyncio.get_running_loop()
+    items: asyncio.Queue[tuple[str, object]] = asyncio.Queue()
+    stop = threading.Event()
+
+    def run() -> None:
+        it = make_iter()
+        try:
+            for item in it:
+                loop.call_soon_threadsafe(items.put_nowait, ("item", item))
+                if stop.is_set():
+                    break
+        except Exception as e:
+            loop.call_soon_threadsafe(items.put_nowait, ("error", e))
+            return
+        finally:
+            it.close()
+        loop.call_soon_threadsafe(items.put_nowait, ("end", None))
+
+    worker = asyncio.ensure_future(asyncio.to_thread(run))
+    try:
+        while True:
+            kind, value = await items.get()
+            if kind == "end":
+                break
+            if kind == "error":
+                raise value
+            yield value
+    finally:
+        stop.set()
+        await worker
+
+
+async def _stream_events(data: bytes, cancel: CancelToken, detector_size: int | None = None) -> AsyncIterator[dict]:
+    """OCR events for one image; cached results are replayed as one burst.
+
+    Lines with empty text get no "line" event on either path, so a client
+    sees the same events whether or not the result was cached.
+    """
+    suffix = f"|detector={detector_size}" if detector_size is not None else ""
+    key = ResultCache.make_key(data, engine.config_fingerprint + suffix) if cache is not None else None
+    lines = await asyncio.to_thread(cache.get, key) if cache is not None else None
+    if lines is not None:
+        layout = [
+            {"index": i, "confidence": r["confidence"], "box": r["box"], "is_vertical": r["is_vertical"]}
+            for i, r in enumerate(lines)
         ]
-    )
+        yield {"event": "layout", "lines": layout}
+        for i, r in enumerate(lines):
+            if r["text"]:
+                yield {"event": "line", "index": i, "text": r["text"], "tier": None}
+        yield {"event": "done", "num_lines": len(lines)}
+        return
+
+    layout: list[dict] = []
+    texts: dict[int, str] = {}
+    async for event in _iterate_in_thread(lambda: engine.predict_stream(data, cancel=cancel, detector_size=detector_size)):
+        if event["event"] == "layout":
+            layout = event["lines"]
+        elif event["event"] == "line":
+            if not event["text"]:
+                continue
+            texts[event["index"]] = event["text"]
+        elif event["event"] == "done" and cache is not None:
+            lines = [
+                {
+                    "text": texts.get(r["index"], ""),
+                    "confidence": r["confidence"],
+                    "box": r["box"],
+                    "is_vertical": r["is_vertical"],
+                }
+                for r in layout
+            ]
+            await asyncio.to_thread(cache.put, key, lines)
+        yield event
+
+
+async def _encode_stream(
+    request: Request, data: bytes, fmt: str, cancel: CancelToken, detector_size: int | None = None
+) -> AsyncIterator[str]:
+    try:
+        async with _cancel_on_disconnect(request, cancel):
+            async for event in _stream_events(data, cancel, detector_size):
+                payload = json.dumps(event, ensure_ascii=False)
+                yield f"event: {event['event']}\ndata: {payload}\n\n" if fmt == "sse" else payload + "\n"
+    except OCRCancelled as e:
+        payload = json.dumps({"event": "error", "detail": e.reason}, ensure_ascii=False)
+        yield f"event: error\ndata: {payload}\n\n" if fmt == "sse" else payload + "\n"
+    except Exception as e:
+        # Headers are already sent; report the failure in-band
+        logger.exception("Streaming OCR failed")
+        payload = json.dumps({"event": "error", "detail": str(e)}, ensure_ascii=False)
+        yield f"event: error\ndata: {payload}\n\n" if fmt == "sse" else payload + "\n"
+    finally:
+        # Also reached when the server closes the stream early; stop the engine
+        cancel.cancel("client_disconnected")
 
 
 # ------------------------------------------------------------------
@@ -53,42 +560,276 @@ async def health():
         status="ok",
         model="ndlocr-lite",
         device=engine.device,
+        replicas=engine.num_replicas,
+        ready=ready.is_set(),
+        cache=CacheStats(**cache.stats()) if cache is not None else None,
+        admission=AdmissionStats(**admission.stats()) if admission is not None else None,
     )
 
 
-@app.post("/ocr/file", response_model=OCRResponse)
-async def ocr_file(file: UploadFile):
+@app.get("/livez", response_model=ProbeResponse)
+async def livez():
+    """Liveness: the process is up and its event loop is responsive."""
+    return ProbeResponse(status="ok")
+
+
+@app.get("/readyz", response_model=ProbeResponse)
+async def readyz(response: Response):
+    """Readiness: 503 until the models are loaded and warmed up."""
+    if ready.is_set():
+        return ProbeResponse(status="ready")
+    response.status_code = 503
+    failed = warmup_task is not None and warmup_task.done()
+    return ProbeResponse(status="warm_up_failed" if failed else "warming_up")
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.post("/ocr/file", response_model=OCRResponse, response_model_exclude_none=True)
+async def ocr_file(
+    request: Request,
+    file: UploadFile,
+    request_trace: RequestTrace | None = Depends(_request_trace),
+    cancel: CancelToken = Depends(_cancel_token),
+    detector_size: int | None = Depends(_detector_size),
+):
+    if file.content_type and file.content_type not in ALLOWED_CONTENT_TYPES:
+        raise HTTPException(400, f"Unsupported content type: {file.content_type}")
+    data = await file.read()
+    if len(data) > MAX_FILE_SIZE:
+        raise HTTPException(413, "File exceeds 20 MB limit")
+    async with _cancel_on_disconnect(request, cancel):
+        lines = await _predict(data, trace=request_trace, cancel=cancel, detector_size=detector_size)
+    return _with_trace(_lines_to_response(lines), request_trace)
+
+
+@app.post("/ocr/raw", response_model=OCRResponse, response_model_exclude_none=True)
+async def ocr_raw(
+    request: Request,
+    x_image_width: int | None = Header(None),
+    x_image_height: int | None = Header(None),
+    x_pixel_format: Literal["rgb", "gray"] | None = Header(None),
+    request_trace: RequestTrace | None = Depends(_request_trace),
+    cancel: CancelToken = Depends(_cancel_token),
+    detector_size: int | None = Depends(_detector_size),
+):
+    """OCR an ``application/octet-stream`` body without multipart or base64.
+
+    The body is an encoded image (JPEG, PNG, ...), or, when the
+    X-Image-Width / X-Image-Height / X-Pixel-Format headers are set, a raw
+    8-bit frame of exactly width × height × channels bytes in row order.
+    """
+    # The buffer is sized from Content-Length, which admission also charges,
+    # so a body has to declare its real size before anything is allocated
+    length = request.headers.get("content-length")
+    if length is None or not length.isdigit():
+        raise HTTPException(411, "Content-Length is required")
+    size = int(length)
+    raw = x_pixel_format is not None
+    if raw:
+        if x_image_width is None or x_image_height is None or x_image_width <= 0 or x_image_height <= 0:
+            raise HTTPException(400, "Raw frames need positive X-Image-Width and X-Image-Height headers")
+        channels = RAW_PIXEL_CHANNELS[x_pixel_format]
+        frame_size = x_image_width * x_image_height * channels
+        if frame_size > MAX_RAW_FRAME_SIZE:
+            raise HTTPException(413, f"Body exceeds {MAX_RAW_FRAME_SIZE // (1024 * 1024)} MB limit")
+        if size != frame_size:
+            raise HTTPException(400, f"Expected {frame_size} bytes of image data")
+    elif size > MAX_FILE_SIZE:
+        raise HTTPException(413, f"Body exceeds {MAX_FILE_SIZE // (1024 * 1024)} MB limit")
+
+    with raw_buffers.borrow(size) as view:
+        if await _read_body_into(request, view) != size:
+            raise HTTPException(400, f"Expected {size} bytes of image data")
+        async with _cancel_on_disconnect(request, cancel):
+            if not raw:
+                lines = await _predict(view, trace=request_trace, cancel=cancel, detector_size=detector_size)
+            else:
+                frame = np.frombuffer(view, dtype=np.uint8).reshape(x_image_height, x_image_width, channels)
+                suffix = f"|raw={x_pixel_format}:{x_image_width}x{x_image_height}"
+                lines = await _predict(
+                    view,
+                    frame=frame,
+                    key_suffix=suffix,
+                    trace=request_trace,
+                    cancel=cancel,
+                    detector_size=detector_size,
+                )
+    return _with_trace(_lines_to_response(lines), request_trace)
+
+
+@app.post("/ocr/stream")
+async def ocr_stream(
+    request: Request,
+    file: UploadFile,
+    format: Literal["ndjson", "sse"] = "ndjson",
+    cancel: CancelToken = Depends(_cancel_token),
+    detector_size: int | None = Depends(_detector_size),
+):
+    """Stream the layout, then each line's text as its recognizer tier finishes.
+
+    Events (one JSON object per NDJSON line, or per SSE message):
+    ``layout`` (boxes in reading order), ``line`` (index, text, tier; only
+    for lines with text), ``done``, or ``error``.
+    """
     if file.content_type and file.content_type not in ALLOWED_CONTENT_TYPES:
         raise HTTPException(400, f"Unsupported content type: {file.content_type}")
     data = await file.read()
     if len(data) > MAX_FILE_SIZE:
         raise HTTPException(413, "File exceeds 20 MB limit")
-    lines = await asyncio.to_thread(engine.predict, data)
-    return _lines_to_response(lines)
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(_encode_stream(request, data, format, cancel, detector_size), media_type=media_type)
+
+
+@app.post("/ocr/document", response_model=OCRDocumentResponse, response_model_exclude_none=True)
+async def ocr_document(
+    request: Request,
+    file: UploadFile,
+    dpi: float | None = None,
+    request_trace: RequestTrace | None = Depends(_request_trace),
+    cancel: CancelToken = Depends(_cancel_token),
+    detector_size: int | None = Depends(_detector_size),
+):
+    """OCR a PDF or multi-frame TIFF; PDF pages are rendered at `dpi`."""
+    if file.content_type and file.content_type not in ALLOWED_DOCUMENT_TYPES:
+        raise HTTPException(400, f"Unsupported content type: {file.content_type}")
+    dpi = DOCUMENT_DPI if dpi is None else dpi
+    if not 36 <= dpi <= 600:
+        raise HTTPException(400, "dpi must be between 36 and 600")
+    data = await file.read()
+    if len(data) > MAX_DOCUMENT_SIZE:
+        raise HTTPException(413, f"File exceeds {MAX_DOCUMENT_SIZE // (1024 * 1024)} MB limit")
+
+    async with _cancel_on_disconnect(request, cancel):
+        pages = await _predict_document(
+            data, dpi, trace=request_trace, cancel=cancel, detector_size=detector_size, admitted=True
+        )
+    with metrics.STAGE_SECONDS.labels("serialize").time():
+        response = OCRDocumentResponse(pages=[OCRPage(**p) for p in pages])
+    return _with_trace(response, request_trace)
 
 
-@app.post("/ocr/base64", response_model=OCRResponse)
-async def ocr_base64(req: OCRRequestBase64):
+@app.post("/ocr/base64", response_model=OCRResponse, response_model_exclude_none=True)
+async def ocr_base64(
+    request: Request,
+    req: OCRRequestBase64,
+    request_trace: RequestTrace | None = Depends(_request_trace),
+    cancel: CancelToken = Depends(_cancel_token),
+    detector_size: int | None = Depends(_detector_size),
+):
     try:
         data = base64.b64decode(req.image)
     except Exception:
         raise HTTPException(400, "Invalid base64 data")
     if len(data) > MAX_FILE_SIZE:
         raise HTTPException(413, "Image exceeds 20 MB limit")
-    lines = await asyncio.to_thread(engine.predict, data)
-    return _lines_to_response(lines)
+    async with _cancel_on_disconnect(request, cancel):
+        lines = await _predict(data, trace=request_trace, cancel=cancel, detector_size=detector_size)
+    return _with_trace(_lines_to_response(lines), request_trace)
 
 
-@app.post("/ocr/url", response_model=OCRResponse)
-async def ocr_url(req: OCRRequestURL):
+@app.post("/ocr/url", response_model=OCRResponse, response_model_exclude_none=True)
+async def ocr_url(
+    request: Request,
+    req: OCRRequestURL,
+    request_trace: RequestTrace | None = Depends(_request_trace),
+    cancel: CancelToken = Depends(_cancel_token),
+    detector_size: int | None = Depends(_detector_size),
+):
+    async with _cancel_on_disconnect(request, cancel):
+        try:
+            data = await fetcher.fetch(req.url)
+        except FetchTooLargeError as e:
+            raise HTTPException(413, str(e))
+        except FetchError as e:
+            raise HTTPException(400, f"Failed to fetch image: {e}")
+        cancel.check()
+        # The request was admitted for its JSON body; the download is what it really holds
+        async with _reserve(len(data)):
+            lines = await _predict(data, trace=request_trace, cancel=cancel, detector_size=detector_size)
+    return _with_trace(_lines_to_response(lines), request_trace)
+
+
+@app.post("/ocr/urls", response_model=OCRURLsResponse)
+async def ocr_urls(request: Request, req: OCRRequestURLs, cancel: CancelToken = Depends(_cancel_token)):
+    """OCR a batch of image URLs; failures are reported per URL.
+
+    Up to OCR_URL_PREFETCH images are downloaded ahead of the engine, so
+    fetching overlaps with OCR while memory stays bounded. Each URL is
+    admitted as a request of its own, charged the download size limit; a
+    URL turned away by admission gets a per-URL error.
+    """
+    if len(req.urls) > URL_BATCH_MAX:
+        raise HTTPException(413, f"Batch exceeds {URL_BATCH_MAX} URLs")
+    slots = asyncio.Semaphore(URL_PREFETCH)
+
+    async def run(url: str) -> OCRURLResult:
+        async with slots:
+            cancel.check()
+            try:
+                async with _admit(MAX_FILE_SIZE):
+                    try:
+                        data = await fetcher.fetch(url)
+                    except FetchError as e:
+                        return OCRURLResult(url=url, error=f"Failed to fetch image: {e}")
+                    try:
+                        lines = await _predict(data, cancel=cancel)
+                    except OCRCancelled:
+                        raise
+                    except Exception as e:
+                        logger.exception("OCR failed for %s", url)
+                        return OCRURLResult(url=url, error=f"OCR failed: {e}")
+            except AdmissionRejected as e:
+                return OCRURLResult(url=url, error=f"Server busy ({e.reason}), retry later")
+        return OCRURLResult(url=url, lines=_lines_to_response(lines).lines)
+
+    async with _cancel_on_disconnect(request, cancel):
+        results = await asyncio.gather(*(run(url) for url in req.urls))
+    return OCRURLsResponse(results=results)
+
+
+@app.post("/jobs", response_model=JobResponse, status_code=202)
+async def create_job(file: UploadFile, callback_url: str | None = Form(None), dpi: float | None = None):
+    """Queue an image, PDF or multi-frame TIFF for OCR; poll `GET /jobs/{id}`.
+
+    PDFs and TIFFs are processed as documents (result: ``pages``), other
+    images as single pages (result: ``lines``). When `callback_url` is given,
+    the finished job is POSTed to it.
+    """
+    if jobs is None:
+        raise HTTPException(503, "Job queue is disabled")
+    data = await file.read()
+    if file.content_type in ALLOWED_DOCUMENT_TYPES or (not file.content_type and data[:5] == b"%PDF-"):
+        dpi = DOCUMENT_DPI if dpi is None else dpi
+        if not 36 <= dpi <= 600:
+            raise HTTPException(400, "dpi must be between 36 and 600")
+        if len(data) > MAX_DOCUMENT_SIZE:
+            raise HTTPException(413, f"File exceeds {MAX_DOCUMENT_SIZE // (1024 * 1024)} MB limit")
+        kind, params = "document", {"dpi": dpi}
+    elif not file.content_type or file.content_type in ALLOWED_CONTENT_TYPES:
+        if len(data) > MAX_FILE_SIZE:
+            raise HTTPException(413, "File exceeds 20 MB limit")
+        kind, params = "image", {}
+    else:
+        raise HTTPException(400, f"Unsupported content type: {file.content_type}")
+
+    if await asyncio.to_thread(jobs.store.queued) >= JOB_MAX_QUEUED:
+        raise HTTPException(503, "Job queue is full", headers={"Retry-After": "30"})
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            resp = await client.get(req.url)
-            resp.raise_for_status()
-    except httpx.HTTPError as e:
-        raise HTTPException(400, f"Failed to fetch image: {e}")
-    data = resp.content
-    if len(data) > MAX_FILE_SIZE:
-        raise HTTPException(413, "Image exceeds 20 MB limit")
-    lines = await asyncio.to_thread(engine.predict, data)
-    return _lines_to_response(lines)
+        job = await jobs.submit(kind, data, params, callback_url=callback_url)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return JobResponse(**job)
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    if jobs is None:
+        raise HTTPException(503, "Job queue is disabled")
+    job = await asyncio.to_thread(jobs.store.get, job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found or expired")
+    return JobResponse(**job)
@@ -0,0 +1,78 @@
+from collections.abc import Callable
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from .cache import ResultCache
+
+# ---------------------------------------------------------------------------
+# Engine and request metrics (process-wide; exposed by GET /metrics)
+# ---------------------------------------------------------------------------
+STAGE_SECONDS = Histogram(
+    "ocr_stage_seconds",
+    "Time spent per OCR stage (decode, replica_wait, detect, layout, reading_order, crop, "
+    "recognize_30/50/100, response, serialize)",
+    ["stage"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+LINES_RECOGNIZED = Counter(
+    "ocr_lines_recognized_total",
+    "Lines whose text was settled by each recognizer tier",
+    ["tier"],
+)
+CASCADE_ESCALATIONS = Counter(
+    "ocr_cascade_escalations_total",
+    "Lines passed on to a larger recognizer because the smaller one filled up",
+    ["from_tier", "to_tier"],
+)
+DETECTOR_SIZE = Counter(
+    "ocr_detector_size_total",
+    "Single images detected at each DEIM input size",
+    ["size"],
+)
+REQUESTS_IN_FLIGHT = Gauge("ocr_requests_in_flight", "HTTP requests currently being handled")
+ADMISSION_ACTIVE = Gauge("ocr_admission_active", "Admitted OCR requests holding a run slot")
+ADMISSION_QUEUED = Gauge("ocr_admission_queued", "Admitted OCR requests waiting for a run slot")
+ADMISSION_INFLIGHT_BYTES = Gauge("ocr_admission_inflight_bytes", "Request bytes held by admitted OCR requests")
+ADMISSION_WAIT_SECONDS = Histogram(
+    "ocr_admission_wait_seconds",
+    "Time admitted OCR requests waited for a run slot",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+ADMISSION_REJECTED = Counter(
+    "ocr_admission_rejected_total",
+    "OCR requests answered with 429 because the queue or the in-flight byte budget was full",
+    ["reason"],
+)
+
+
+def observe_stages(time_keeper) -> None:
+    """Add every duration recorded in a reading_order TimeKeeper to STAGE_SECONDS."""
+    for key in time_keeper.keys:
+        histogram = STAGE_SECONDS.labels(key)
+        for seconds in time_keeper.times[key]:
+            histogram.observe(seconds)
+
+
+class _CacheCollector:
+    """Expose ResultCache counters, read at scrape time."""
+
+    def __init__(self, get_cache: Callable[[], ResultCache | None]) -> None:
+        self._get_cache = get_cache
+
+    def collect(self):
+        cache = self._get_cache()
+        if cache is None:
+            return
+        stats = cache.stats()
+        lookups = CounterMetricFamily("ocr_cache_lookups", "Result cache lookups", labels=["result"])
+        lookups.add_metric(["hit"], stats["hits"])
+        lookups.add_metric(["miss"], stats["misses"])
+        yield lookups
+        yield CounterMetricFamily("ocr_cache_disk_hits", "Result cache hits served by the disk tier", value=stats["disk_hits"])
+        yield GaugeMetricFamily("ocr_cache_entries", "Entries in the memory tier", value=stats["entries"])
+        yield GaugeMetricFamily("ocr_cache_size_bytes", "Serialized size of the memory tier", value=stats["size_bytes"])
+
+
+def register_cache(get_cache: Callable[[], ResultCache | None]) -> None:
+    REGISTRY.register(_CacheCollector(get_cache))
@@ -1,14 +1,24 @@
 import io
+import json
 import logging
+import math
+import os
+import queue
+import re
 import sys
 import threading
-import xml.etree.ElementTree as ET
+import time
+from collections.abc import Iterable, Iterator
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 
 import numpy as np
 from PIL import Image
-from yaml import safe_load
+import yaml
+
+from . import metrics
+from .batching import DetectionBatcher
 
 # ---------------------------------------------------------------------------
 # Add ndlocr-lite/src to import path so we can use its modules directly
@@ -17,15 +27,66 @@ _NDLOCR_SRC = Path(__file__).resolve().parent.parent / "ndlocr-lite" / "src"
 if str(_NDLOCR_SRC) not in sys.path:
     sys.path.insert(0, str(_NDLOCR_SRC))
 
-sys.setrecursionlimit(5000)  # required by xy-cut reading order algorithm
-
 from deim import DEIM  # noqa: E402
-from ndl_parser import convert_to_xml_string3  # noqa: E402
+from page_model import Page, build_page  # noqa: E402
 from parseq import PARSEQ  # noqa: E402
-from reading_order.xy_cut.eval import eval_xml  # noqa: E402
+from pipeline import StagedPipeline  # noqa: E402
+from reading_order.utils.time import TimeKeeper  # noqa: E402
+from session_cache import model_sha256  # noqa: E402
 
 logger = logging.getLogger(__name__)
 
+# CPU recognizers run with intra_op_num_threads=1, so one batched
+# session.run per core and tier keeps every core busy.
+_PARSEQ_WORKERS = os.cpu_count() or 1
+
+
+# ---------------------------------------------------------------------------
+# Cancellation — checked between stages and recognizer batches
+# ---------------------------------------------------------------------------
+class OCRCancelled(Exception):
+    """OCR was abandoned before finishing; `reason` says why."""
+
+    def __init__(self, reason: str) -> None:
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CancelToken:
+    """Cooperative cancellation for one request.
+
+    Cancelled explicitly (e.g. when the client disconnects) or implicitly
+    once `deadline` (a time.monotonic() value) has passed. The engine calls
+    `check()` between stages and before each recognizer batch, so abandoned
+    work stops early; a stage that is already running finishes first.
+    """
+
+    DEADLINE_EXCEEDED = "deadline_exceeded"
+
+    def __init__(self, deadline: float | None = None) -> None:
+        self.deadline = deadline
+        self._reason: str | None = None
+        self._event = threading.Event()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self._event.is_set():
+            self._reason = reason
+            self._event.set()
+
+    @property
+    def reason(self) -> str | None:
+        if self._event.is_set():
+            return self._reason
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return self.DEADLINE_EXCEEDED
+        return None
+
+    def check(self) -> None:
+        """Raise OCRCancelled if the request was cancelled or its deadline passed."""
+        reason = self.reason
+        if reason is not None:
+            raise OCRCancelled(reason)
+
 
 # ---------------------------------------------------------------------------
 # RecogLine — thin wrapper used by cascade recognition (from ndlocr-lite)
@@ -41,8 +102,56 @@ class RecogLine:
         return self.idx < other.idx
 
 
-def _process_cascade(alllineobj, recognizer30, recognizer50, recognizer100):
-    """Cascade recognition: route lines to 30/50/100-char models."""
+def _read_tier(
+    executor: ThreadPoolExecutor,
+    num_workers: int,
+    recognizer: PARSEQ,
+    lineobjs: list[RecogLine],
+    cancel: CancelToken | None = None,
+) -> list[str]:
+    """Recognize one cascade tier with batched session runs spread over the executor.
+
+    The lines are split into one contiguous share per worker, and each worker
+    reads its share in slices of the model batch size. `cancel` is checked
+    before every slice, so a cancelled request stops after the session runs
+    already under way.
+    """
+    if not lineobjs:
+        return []
+    cancel = cancel or CancelToken()
+    imgs = [t.npimg for t in lineobjs]
+    batch_size = max(1, recognizer.max_batch_size)
+
+    def read_share(bounds: tuple[int, int]) -> list[str]:
+        start, stop = bounds
+        preds = []
+        for i in range(start, stop, batch_size):
+            cancel.check()
+            preds += recognizer.read_batch(imgs[i: min(i + batch_size, stop)])
+        return preds
+
+    share = -(-len(imgs) // max(1, num_workers))
+    shares = [(i, min(i + share, len(imgs))) for i in range(0, len(imgs), share)]
+    return [pred_str for result in executor.map(read_share, shares) for pred_str in result]
+
+
+def _cascade_tiers(
+    alllineobj,
+    recognizer30,
+    recognizer50,
+    recognizer100,
+    num_workers: int = _PARSEQ_WORKERS,
+    time_keeper: TimeKeeper | None = None,
+    cancel: CancelToken | None = None,
+) -> Iterator[tuple[int, list[RecogLine]]]:
+    """Cascade recognition: route lines to 30/50/100-char models.
+
+    Yields `(tier, lines)` as each tier finishes, with the lines whose
+    `pred_str` that tier settled (lines escalated to a larger model come later).
+    Tier run times go to `time_keeper` as recognize_30/50/100. Raises
+    OCRCancelled between batches once `cancel` fires.
+    """
+    time_keeper = time_keeper or TimeKeeper()
     targetdflist30: list[RecogLine] = []
     targetdflist50: list[RecogLine] = []
     targetdflist100: list[RecogLine] = []
@@ -55,211 +164,994 @@ def _process_cascade(alllineobj, recognizer30, recognizer50, recognizer100):
         else:
             targetdflist100.append(lineobj)
 
-    targetdflistall: list[RecogLine] = []
-    with ThreadPoolExecutor(thread_name_prefix="parseq") as executor:
+    with ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="parseq") as executor:
         # --- 30-char model ---
-        resultlines30: list[str] = []
-        if targetdflist30:
-            resultlines30 = list(executor.map(recognizer30.read, [t.npimg for t in targetdflist30]))
-        for i, lineobj in enumerate(targetdflist30):
-            pred_str = resultlines30[i]
+        with time_keeper.measure_time("recognize_30"):
+            resultlines30 = _read_tier(executor, num_workers, recognizer30, targetdflist30, cancel)
+        settled: list[RecogLine] = []
+        for lineobj, pred_str in zip(targetdflist30, resultlines30):
             if len(pred_str) >= 25:
                 targetdflist50.append(lineobj)
             else:
                 lineobj.pred_str = pred_str
-                targetdflistall.append(lineobj)
+                settled.append(lineobj)
+        metrics.LINES_RECOGNIZED.labels("30").inc(len(settled))
+        metrics.CASCADE_ESCALATIONS.labels("30", "50").inc(len(targetdflist30) - len(settled))
+        yield 30, settled
 
         # --- 50-char model ---
-        resultlines50: list[str] = []
-        if targetdflist50:
-            resultlines50 = list(executor.map(recognizer50.read, [t.npimg for t in targetdflist50]))
-        for i, lineobj in enumerate(targetdflist50):
-            pred_str = resultlines50[i]
+        with time_keeper.measure_time("recognize_50"):
+            resultlines50 = _read_tier(executor, num_workers, recognizer50, targetdflist50, cancel)
+        settled = []
+        for lineobj, pred_str in zip(targetdflist50, resultlines50):
             if len(pred_str) >= 45:
                 targetdflist100.append(lineobj)
             else:
                 lineobj.pred_str = pred_str
-                targetdflistall.append(lineobj)
+                settled.append(lineobj)
+        metrics.LINES_RECOGNIZED.labels("50").inc(len(settled))
+        metrics.CASCADE_ESCALATIONS.labels("50", "100").inc(len(targetdflist50) - len(settled))
+        yield 50, settled
 
         # --- 100-char model ---
-        resultlines100: list[str] = []
-        if targetdflist100:
-            resultlines100 = list(executor.map(recognizer100.read, [t.npimg for t in targetdflist100]))
-        for i, lineobj in enumerate(targetdflist100):
-            lineobj.pred_str = resultlines100[i]
-            targetdflistall.append(lineobj)
+        with time_keeper.measure_time("recognize_100"):
+            resultlines100 = _read_tier(executor, num_workers, recognizer100, targetdflist100, cancel)
+        for lineobj, pred_str in zip(targetdflist100, resultlines100):
+            lineobj.pred_str = pred_str
+        metrics.LINES_RECOGNIZED.labels("100").inc(len(targetdflist100))
+        yield 100, targetdflist100
+
 
+def _process_cascade(
+    alllineobj,
+    recognizer30,
+    recognizer50,
+    recognizer100,
+    num_workers: int = _PARSEQ_WORKERS,
+    time_keeper: TimeKeeper | None = None,
+    cancel: CancelToken | None = None,
+):
+    """Run every cascade tier; returns the texts ordered by line index."""
+    targetdflistall: list[RecogLine] = []
+    tiers = _cascade_tiers(
+        alllineobj, recognizer30, recognizer50, recognizer100, num_workers, time_keeper, cancel
+    )
+    for _, settled in tiers:
+        targetdflistall.extend(settled)
     targetdflistall.sort()
     return [t.pred_str for t in targetdflistall]
 
 
+# ---------------------------------------------------------------------------
+# Model files and detector thresholds (also part of the cache fingerprint)
+# ---------------------------------------------------------------------------
+# DEIM is exported at several square input sizes: deim-s-<size>x<size>.onnx
+_DEIM_MODEL_DIR = _NDLOCR_SRC / "model"
+_DEIM_MODEL_NAME = re.compile(r"deim-s-(\d+)x\1\.onnx")
+_PARSEQ30_MODEL = _NDLOCR_SRC / "model" / "parseq-ndl-16x256-30-tiny-192epoch-tegaki3.onnx"
+_PARSEQ50_MODEL = _NDLOCR_SRC / "model" / "parseq-ndl-16x384-50-tiny-146epoch-tegaki2.onnx"
+_PARSEQ100_MODEL = _NDLOCR_SRC / "model" / "parseq-ndl-16x768-100-tiny-165epoch-tegaki2.onnx"
+_DETECTOR_THRESHOLDS = {"score_threshold": 0.2, "conf_threshold": 0.25, "iou_threshold": 0.2}
+
+# PARSEQ reads 16 px high lines; reduced JPEG decodes keep 2x that for the resize
+_CROP_MIN_THICKNESS = 32
+
+# Smallest text line pitch (px at the detector input) a reduced detector
+# input size may leave; denser pages are detected at a larger size
+_MIN_LINE_PITCH = 16
+
+
+def _detector_models() -> dict[int, Path]:
+    """Exported DEIM models in the model directory, by input size (ascending)."""
+    models = {}
+    for path in _DEIM_MODEL_DIR.glob("deim-s-*x*.onnx"):
+        match = _DEIM_MODEL_NAME.fullmatch(path.name)
+        if match:
+            models[int(match[1])] = path
+    return dict(sorted(models.items()))
+
+
+# ---------------------------------------------------------------------------
+# Detector input size selection
+# ---------------------------------------------------------------------------
+def _box_mean(a: np.ndarray, radius: int) -> np.ndarray:
+    """Mean over a (2*radius+1)^2 window around every pixel, via an integral image."""
+    k = 2 * radius + 1
+    integral = np.pad(a, radius + 1, mode="edge").cumsum(axis=0).cumsum(axis=1)
+    sums = integral[k:, k:] - integral[:-k, k:] - integral[k:, :-k] + integral[:-k, :-k]
+    return sums[: a.shape[0], : a.shape[1]] / (k * k)
+
+
+def _estimate_line_pitch(img: np.ndarray, thumb_side: int = 512) -> float | None:
+    """Typical distance between text lines in px, or None if no period shows.
+
+    Works on a strided thumbnail. Ink is whatever is clearly darker than its
+    neighbourhood, so dark backgrounds and scanner borders do not count.
+    The rows and columns of the ink mask are summed into profiles, and the
+    first autocorrelation peak nearly as strong as the strongest one is a
+    line (or, across the lines, character) pitch. The smaller of the two
+    is returned, so vertical text is covered too.
+    """
+    stride = max(1, -(-max(img.shape[:2]) // thumb_side))
+    thumb = img[::stride, ::stride]
+    gray = thumb.mean(axis=2) if thumb.ndim == 3 else thumb.astype(np.float32)
+    ink = gray < _box_mean(gray, 8) - 16
+    if not ink.any():
+        return None
+    pitches = []
+    for profile in (ink.mean(axis=1), ink.mean(axis=0)):
+        centered = profile - profile.mean()
+        autocorr = np.correlate(centered, centered, "full")[len(centered) - 1:]
+        if len(autocorr) < 6 or autocorr[0] <= 0:
+            continue
+        autocorr /= autocorr[0]
+        inner = autocorr[1:-1]
+        peaks = np.flatnonzero((inner > autocorr[:-2]) & (inner >= autocorr[2:]) & (inner > 0.2)) + 1
+        # At least three periods must fit, or it is page layout rather than text
+        peaks = peaks[(peaks >= 2) & (peaks <= len(autocorr) // 3)]
+        if len(peaks):
+            strong = peaks[autocorr[peaks] >= 0.8 * autocorr[peaks].max()]
+            pitches.append(float(strong[0] * stride))
+    return min(pitches) if pitches else None
+
+
+def _select_detector_size(img: np.ndarray, sizes: list[int]) -> int:
+    """Smallest of `sizes` (ascending) that detects `img` without losing its text.
+
+    A size is enough when the image is no larger than it (a bigger input
+    only upsamples), or when the estimated line pitch still spans
+    _MIN_LINE_PITCH px after resizing to it. Without a pitch estimate the
+    largest size is used.
+    """
+    if len(sizes) == 1:
+        return sizes[0]
+    max_side = max(img.shape[:2])
+    pitch = _estimate_line_pitch(img) if max_side > sizes[0] else None
+    for size in sizes[:-1]:
+        if max_side <= size or (pitch is not None and pitch * size / max_side >= _MIN_LINE_PITCH):
+            return size
+    return sizes[-1]
+
+
+# ---------------------------------------------------------------------------
+# Image decoding helpers
+# ---------------------------------------------------------------------------
+class _BufferReader(io.RawIOBase):
+    """Read-only file over a bytes-like object, so PIL decodes from a
+    memoryview without the whole-buffer copy io.BytesIO would make."""
+
+    def __init__(self, buf: bytes | memoryview) -> None:
+        self._view = memoryview(buf).cast("B")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else min(len(self._view), self._pos + size)
+        data = self._view[self._pos:end].tobytes()
+        self._pos = max(self._pos, end)
+        return data
+
+    def readinto(self, b) -> int:
+        data = self.read(len(b))
+        b[: len(data)] = data
+        return len(data)
+
+
+class _DraftJpeg:
+    """A JPEG decoded at reduced size for detection.
+
+    `image` is a libjpeg DCT-scaled decode (1/2, 1/4 or 1/8) that still covers
+    the detector input; `size` is the full (width, height). Detections are
+    scaled up to full-size coordinates, and line crops come from the most
+    reduced decode in which the thinnest line keeps _CROP_MIN_THICKNESS px.
+    """
+
+    def __init__(self, data: bytes | memoryview, image: np.ndarray, size: tuple[int, int]) -> None:
+        self._data = data
+        self.image = image
+        self.size = size
+        self.reduction = round(size[0] / image.shape[1])
+
+    def to_full(self, detections: list[dict]) -> list[dict]:
+        """Detections with boxes in full-size coordinates."""
+        img_h, img_w = self.image.shape[:2]
+        scale = np.array([self.size[0] / img_w, self.size[1] / img_h] * 2)
+        return [{**det, "box": np.rint(np.asarray(det["box"]) * scale).astype(np.int32)} for det in detections]
+
+    def crop_source(self, min_thickness: int) -> np.ndarray:
+        """Pixels to cut line crops from, for lines at least `min_thickness` px thick at full size."""
+        reduction = 8
+        while reduction > 1 and min_thickness / reduction < _CROP_MIN_THICKNESS:
+            reduction //= 2
+        if reduction >= self.reduction:
+            return self.image
+        with Image.open(_BufferReader(self._data)) as img:
+            if reduction > 1:
+                img.draft("RGB", (self.size[0] // reduction, self.size[1] // reduction))
+            return np.asarray(img.convert("RGB"))
+
+
+# ---------------------------------------------------------------------------
+# Model loading
+# ---------------------------------------------------------------------------
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def _create_detector(model_path: Path, device: str, intra_op_threads: int, cache_dir: str | None = None) -> DEIM:
+    return DEIM(
+        model_path=str(model_path),
+        class_mapping_path=str(_NDLOCR_SRC / "config" / "ndl.yaml"),
+        device=device,
+        intra_op_num_threads=intra_op_threads,
+        cache_dir=cache_dir,
+        **_DETECTOR_THRESHOLDS,
+    )
+
+
+def _create_recognizer(model_path: Path, charlist: list[str], device: str, cache_dir: str | None = None) -> PARSEQ:
+    return PARSEQ(model_path=str(model_path), charlist=charlist, device=device, cache_dir=cache_dir)
+
+
+def _cuda_usable() -> bool:
+    """Whether CUDA actually works here, not just whether the package lists it.
+
+    Probes with the smallest model (PARSEQ-30) and checks that the session
+    really kept the CUDA provider instead of silently falling back to CPU.
+    """
+    import onnxruntime
+
+    if "CUDAExecutionProvider" not in onnxruntime.get_available_providers():
+        return False
+    try:
+        session = onnxruntime.InferenceSession(
+            str(_PARSEQ30_MODEL),
+            providers=["CUDAExecutionProvider", "CPUExecutionProvider"],
+        )
+    except Exception:
+        return False
+    return "CUDAExecutionProvider" in session.get_providers()
+
+
+def _load_charlist(cache_dir: str | None = None) -> list[str]:
+    """PARSEQ character set from NDLmoji.yaml.
+
+    The YAML is large and slow to parse, so with `cache_dir` the list is kept
+    there as JSON keyed by the YAML's hash.
+    """
+    yaml_path = _NDLOCR_SRC / "config" / "NDLmoji.yaml"
+    cached = None
+    if cache_dir:
+        cached = Path(cache_dir) / f"NDLmoji.{model_sha256(str(yaml_path))[:16]}.json"
+        try:
+            return json.loads(cached.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            pass
+    with open(yaml_path, encoding="utf-8") as f:
+        charobj = yaml.load(f, Loader=_YamlLoader)
+    charlist = list(charobj["model"]["charset_train"])
+    if cached is not None:
+        try:
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cached.with_name(f"{cached.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(charlist, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, cached)
+        except OSError as e:
+            logger.warning("Could not cache the PARSEQ charset in %s: %s", cache_dir, e)
+    return charlist
+
+
+# ---------------------------------------------------------------------------
+# Warm-up inputs
+# ---------------------------------------------------------------------------
+def _synthetic_page(width: int = 1240, height: int = 1754) -> np.ndarray:
+    """White page (A4 at 150 dpi by default) with dark bars where text lines would be."""
+    page = np.full((height, width, 3), 255, dtype=np.uint8)
+    for y in range(height // 10, height * 9 // 10, 48):
+        page[y: y + 24, width // 10: width * 9 // 10] = 32
+    return page
+
+
+def _synthetic_line(num_chars: int, height: int = 32) -> np.ndarray:
+    """Horizontal line crop with `num_chars` dark glyph-sized blocks."""
+    crop = np.full((height, height * num_chars, 3), 255, dtype=np.uint8)
+    for x in range(0, crop.shape[1], height):
+        crop[height // 8: height * 7 // 8, x + height // 8: x + height * 7 // 8] = 32
+    return crop
+
+
+# ---------------------------------------------------------------------------
+# _EngineReplica — one independent set of ONNX sessions
+# ---------------------------------------------------------------------------
+class _EngineReplica:
+    """DEIM detectors (one per input size) + 3 PARSEQ recognizers owned by one request at a time."""
+
+    def __init__(
+        self,
+        detectors: dict[int, DEIM | DetectionBatcher],
+        recognizer30: PARSEQ,
+        recognizer50: PARSEQ,
+        recognizer100: PARSEQ,
+        parseq_workers: int,
+    ) -> None:
+        # Detectors may be DetectionBatchers shared by every replica
+        self.detectors = detectors
+        self.detector_sizes = sorted(detectors)
+        # Full resolution, used unless a smaller size is selected
+        self.detector = detectors[self.detector_sizes[-1]]
+        self.recognizer30 = recognizer30
+        self.recognizer50 = recognizer50
+        self.recognizer100 = recognizer100
+        self.parseq_workers = parseq_workers
+
+    def detect(
+        self, img: np.ndarray | _DraftJpeg, size: int | None = None, cancel: CancelToken | None = None
+    ) -> tuple[np.ndarray | _DraftJpeg, list[dict], list[str]]:
+        """Detect with the `size` detector; by default one is selected from the image.
+
+        `cancel` stops the wait for a shared batcher's round.
+        """
+        img_np = img.image if isinstance(img, _DraftJpeg) else img
+        if size is None:
+            size = _select_detector_size(img_np, self.detector_sizes)
+        metrics.DETECTOR_SIZE.labels(str(size)).inc()
+        detector = self.detectors[size]
+        if isinstance(detector, DetectionBatcher):
+            detections = detector.detect(img_np, cancel)
+        else:
+            detections = detector.detect(img_np)
+        return img, detections, list(detector.classes.values())
+
+    def detect_many(
+        self, imgs: list[np.ndarray], size: int | None = None, cancel: CancelToken | None = None
+    ) -> list[tuple[np.ndarray, list[dict], list[str]]]:
+        """Detect several images in one batched DEIM run (or one batcher round).
+
+        The batch shares one detector: `size`, or full resolution by default.
+        """
+        detector = self.detectors[size] if size is not None else self.detector
+        if isinstance(detector, DetectionBatcher):
+            results = detector.wait([detector.submit(img_np) for img_np in imgs], cancel)
+        else:
+            results = detector.detect_batch(imgs)
+        classeslist = list(detector.classes.values())
+        return [(img_np, detections, classeslist) for img_np, detections in zip(imgs, results)]
+
+    def recognize(
+        self,
+        alllineobj: list[RecogLine],
+        time_keeper: TimeKeeper | None = None,
+        cancel: CancelToken | None = None,
+    ) -> list[str]:
+        return _process_cascade(
+            alllineobj,
+            self.recognizer30,
+            self.recognizer50,
+            self.recognizer100,
+            num_workers=self.parseq_workers,
+            time_keeper=time_keeper,
+            cancel=cancel,
+        )
+
+    def recognize_tiers(
+        self,
+        alllineobj: list[RecogLine],
+        time_keeper: TimeKeeper | None = None,
+        cancel: CancelToken | None = None,
+    ) -> Iterator[tuple[int, list[RecogLine]]]:
+        return _cascade_tiers(
+            alllineobj,
+            self.recognizer30,
+            self.recognizer50,
+            self.recognizer100,
+            num_workers=self.parseq_workers,
+            time_keeper=time_keeper,
+            cancel=cancel,
+        )
+
+
 # ---------------------------------------------------------------------------
 # NdlOCREngine — main engine class
 # ---------------------------------------------------------------------------
 class NdlOCREngine:
     def __init__(self) -> None:
-        self._detector: DEIM | None = None
-        self._recognizer30: PARSEQ | None = None
-        self._recognizer50: PARSEQ | None = None
-        self._recognizer100: PARSEQ | None = None
-        self._lock = threading.Lock()
+        self._replicas: list[_EngineReplica] = []
+        self._free: queue.Queue[_EngineReplica] = queue.Queue()
+        self._batchers: dict[int, DetectionBatcher] = {}
+        self._detector_sizes: list[int] = []
         self._device = "cpu"
+        self._config_fingerprint = ""
+        self._jpeg_draft_size = 0
 
     # ------------------------------------------------------------------
     # Initialization
     # ------------------------------------------------------------------
-    def initialize(self, device: str | None = None) -> None:
-        """Load DEIM detector and 3 PARSEQ recognizers. Call once at startup."""
-        import onnxruntime
+    def initialize(
+        self,
+        device: str | None = None,
+        num_replicas: int = 1,
+        intra_op_threads: int | None = None,
+        detect_batch_window_ms: float = 0.0,
+        detect_max_batch: int = 8,
+        jpeg_draft: bool = False,
+        model_cache_dir: str | None = None,
+        detector_sizes: Iterable[int] | None = None,
+    ) -> None:
+        """Load `num_replicas` detector+recognizer sets. Call once at startup.
+
+        `intra_op_threads` is the DEIM thread count per replica; by default the
+        host cores are split evenly between replicas.
+
+        `detector_sizes` picks which exported DEIM input sizes to load (all
+        found in the model directory by default). With more than one, each
+        image is detected at the smallest size its dimensions and text
+        density allow, unless the request asks for a size.
+
+        With `detect_batch_window_ms` > 0 the replicas share the DEIM detectors
+        behind DetectionBatchers that coalesce concurrent requests (up to
+        `detect_max_batch` images) into a single batched run.
 
+        With `jpeg_draft`, JPEGs are decoded at a reduced size (libjpeg DCT
+        scaling) for detection, and line crops at the resolution the detected
+        line heights need rather than at full size.
+
+        All ONNX sessions are created concurrently. With `model_cache_dir`,
+        the optimized graphs (and the parsed charset) are kept there, so later
+        starts skip most graph optimization.
+        """
+        start = time.perf_counter()
         if device is None:
-            # Check if CUDA is actually usable (not just listed by the package)
-            self._device = "cpu"
-            if "CUDAExecutionProvider" in onnxruntime.get_available_providers():
-                try:
-                    _test_sess = onnxruntime.InferenceSession(
-                        str(_NDLOCR_SRC / "model" / "deim-s-1024x1024.onnx"),
-                        providers=["CUDAExecutionProvider"],
-                    )
-                    del _test_sess
-                    self._device = "cuda"
-                except Exception:
-                    logger.info("CUDAExecutionProvider listed but not usable, falling back to cpu")
+            self._device = "cuda" if _cuda_usable() else "cpu"
+            if self._device == "cpu":
+                logger.info("CUDAExecutionProvider not usable, running on cpu")
         else:
             self._device = device
 
-        base_dir = _NDLOCR_SRC
-        logger.info("Initializing ndlocr-lite on device=%s ...", self._device)
-
-        # DEIM detector
-        self._detector = DEIM(
-            model_path=str(base_dir / "model" / "deim-s-1024x1024.onnx"),
-            class_mapping_path=str(base_dir / "config" / "ndl.yaml"),
-            score_threshold=0.2,
-            conf_threshold=0.25,
-            iou_threshold=0.2,
-            device=self._device,
-        )
-        logger.info("DEIM detector loaded.")
-
-        # Character set for PARSEQ
-        with open(base_dir / "config" / "NDLmoji.yaml", encoding="utf-8") as f:
-            charobj = safe_load(f)
-        charlist = list(charobj["model"]["charset_train"])
-
-        # 3 cascade PARSEQ recognizers
-        self._recognizer30 = PARSEQ(
-            model_path=str(base_dir / "model" / "parseq-ndl-16x256-30-tiny-192epoch-tegaki3.onnx"),
-            charlist=charlist,
-            device=self._device,
-        )
-        self._recognizer50 = PARSEQ(
-            model_path=str(base_dir / "model" / "parseq-ndl-16x384-50-tiny-146epoch-tegaki2.onnx"),
-            charlist=charlist,
-            device=self._device,
+        available = _detector_models()
+        if detector_sizes is None:
+            detector_models = available
+        else:
+            missing = sorted(set(detector_sizes) - set(available))
+            if missing:
+                raise ValueError(f"No DEIM model for detector size(s) {missing}; found {sorted(available)}")
+            detector_models = {size: available[size] for size in sorted(set(detector_sizes))}
+        if not detector_models:
+            raise FileNotFoundError(f"No deim-s-<size>x<size>.onnx model in {_DEIM_MODEL_DIR}")
+        self._detector_sizes = list(detector_models)
+
+        num_replicas = max(1, num_replicas)
+        cores_per_replica = max(1, (os.cpu_count() or 1) // num_replicas)
+        if intra_op_threads is None:
+            intra_op_threads = cores_per_replica
+        logger.info(
+            "Initializing ndlocr-lite on device=%s with %d replica(s), %d intra-op thread(s) each, "
+            "detector size(s) %s ...",
+            self._device,
+            num_replicas,
+            intra_op_threads,
+            self._detector_sizes,
         )
-        self._recognizer100 = PARSEQ(
-            model_path=str(base_dir / "model" / "parseq-ndl-16x768-100-tiny-165epoch-tegaki2.onnx"),
-            charlist=charlist,
-            device=self._device,
+
+        device = self._device
+        recognizer_paths = (_PARSEQ30_MODEL, _PARSEQ50_MODEL, _PARSEQ100_MODEL)
+        num_sessions = num_replicas * (len(recognizer_paths) + len(detector_models)) + 1
+        with ThreadPoolExecutor(max_workers=min(32, num_sessions), thread_name_prefix="ort-init") as pool:
+            charlist_future = pool.submit(_load_charlist, model_cache_dir)
+            if detect_batch_window_ms > 0:
+                # The shared detectors serve every replica, so they get all cores
+                shared = {
+                    size: pool.submit(_create_detector, path, device, 0, model_cache_dir)
+                    for size, path in detector_models.items()
+                }
+                detectors = [shared] * num_replicas
+            else:
+                shared = None
+                detectors = [
+                    {
+                        size: pool.submit(_create_detector, path, device, intra_op_threads, model_cache_dir)
+                        for size, path in detector_models.items()
+                    }
+                    for _ in range(num_replicas)
+                ]
+            charlist = charlist_future.result()
+            recognizers = [
+                [pool.submit(_create_recognizer, path, charlist, device, model_cache_dir) for path in recognizer_paths]
+                for _ in range(num_replicas)
+            ]
+
+            if shared is not None:
+                self._batchers = {
+                    size: DetectionBatcher(
+                        future.result(),
+                        window_ms=detect_batch_window_ms,
+                        max_batch=detect_max_batch,
+                    )
+                    for size, future in shared.items()
+                }
+                logger.info(
+                    "DEIM micro-batching enabled (window=%.1f ms, max_batch=%d).",
+                    detect_batch_window_ms,
+                    detect_max_batch,
+                )
+            for i in range(num_replicas):
+                replica = _EngineReplica(
+                    self._batchers or {size: future.result() for size, future in detectors[i].items()},
+                    *(future.result() for future in recognizers[i]),
+                    parseq_workers=cores_per_replica,
+                )
+                self._replicas.append(replica)
+                self._free.put(replica)
+                logger.info("Replica %d/%d loaded (DEIM + PARSEQ 30/50/100).", i + 1, num_replicas)
+        if jpeg_draft:
+            detector = self._replicas[0].detector
+            self._jpeg_draft_size = max(detector.input_width, detector.input_height)
+        self._config_fingerprint = json.dumps(
+            {
+                "device": self._device,
+                "models": {
+                    path.name: model_sha256(str(path))
+                    for path in (*detector_models.values(), _PARSEQ30_MODEL, _PARSEQ50_MODEL, _PARSEQ100_MODEL)
+                },
+                "detector": _DETECTOR_THRESHOLDS,
+                "jpeg_draft": jpeg_draft,
+            },
+            sort_keys=True,
         )
-        logger.info("PARSEQ recognizers (30/50/100) loaded. ndlocr-lite ready.")
+        logger.info("ndlocr-lite ready in %.1f s.", time.perf_counter() - start)
+
+    def close(self) -> None:
+        """Stop background workers. Call once at shutdown."""
+        for batcher in self._batchers.values():
+            batcher.close()
+        self._batchers = {}
 
     @property
     def device(self) -> str:
         return self._device
 
+    @property
+    def config_fingerprint(self) -> str:
+        """Identifies the loaded models and thresholds; part of result cache keys."""
+        return self._config_fingerprint
+
+    @property
+    def num_replicas(self) -> int:
+        return len(self._replicas)
+
+    @property
+    def detector_sizes(self) -> list[int]:
+        """Loaded DEIM input sizes, ascending; the last one is full resolution."""
+        return self._detector_sizes
+
+    # ------------------------------------------------------------------
+    # Warm-up
+    # ------------------------------------------------------------------
+    def warm_up(self, rounds: int = 1, detect_batch_sizes: Iterable[int] = ()) -> None:
+        """Run synthetic pages and line crops through every replica's models.
+
+        ONNX Runtime grows its memory arenas and initializes kernels on first
+        use, which otherwise slows down the first real requests. Each round
+        runs every detector size at batch size 1, at every size in
+        `detect_batch_sizes` and at the micro-batchers' max batch, and each
+        recognizer with one crop and with a full batch of its line length.
+        """
+        start = time.perf_counter()
+        batch_sizes = {1, *detect_batch_sizes}
+        batch_sizes.update(batcher.max_batch for batcher in self._batchers.values())
+        page = _synthetic_page()
+
+        def warm_replica(_) -> None:
+            with self._checkout() as replica:
+                for _ in range(rounds):
+                    for detector_size in replica.detector_sizes:
+                        for batch_size in sorted(batch_sizes):
+                            replica.detect_many([page] * batch_size, detector_size)
+                    for recognizer, num_chars in (
+                        (replica.recognizer30, 25),
+                        (replica.recognizer50, 45),
+                        (replica.recognizer100, 90),
+                    ):
+                        crop = _synthetic_line(num_chars)
+                        for batch_size in sorted({1, recognizer.max_batch_size}):
+                            recognizer.read_batch([crop] * batch_size)
+
+        # Replicas own separate sessions, so they warm up side by side
+        with ThreadPoolExecutor(max_workers=len(self._replicas), thread_name_prefix="warm-up") as pool:
+            list(pool.map(warm_replica, range(len(self._replicas))))
+        logger.info(
+            "Warm-up done in %.1f s (%d round(s), detector batch sizes %s).",
+            time.perf_counter() - start,
+            rounds,
+            sorted(batch_sizes),
+        )
+
+    @contextmanager
+    def _checkout(
+        self, time_keeper: TimeKeeper | None = None, cancel: CancelToken | None = None
+    ) -> Iterator[_EngineReplica]:
+        """Borrow a free replica, blocking until one is returned (or `cancel` fires)."""
+        with (time_keeper or TimeKeeper()).measure_time("replica_wait"):
+            if cancel is None:
+                replica = self._free.get()
+            else:
+                while True:
+                    cancel.check()
+                    try:
+                        replica = self._free.get(timeout=0.05)
+                        break
+                    except queue.Empty:
+                        pass
+        try:
+            yield replica
+        finally:
+            self._free.put(replica)
+
     # ------------------------------------------------------------------
     # Prediction
     # ------------------------------------------------------------------
-    def predict(self, image_bytes: bytes) -> list[dict]:
-        """Run OCR on raw image bytes. Returns list of line dicts."""
-        img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        img_np = np.array(img)
-        img_h, img_w = img_np.shape[:2]
-
-        with self._lock:
-            # --- Detection ---
-            detections = self._detector.detect(img_np)
-            classeslist = list(self._detector.classes.values())
-
-            # Build resultobj for convert_to_xml_string3
-            # resultobj[0] = {0: [[x1,y1,x2,y2], ...]}  (text_block polygons)
-            # resultobj[1] = {cls_id: [[x1,y1,x2,y2,conf,char_count], ...]}
-            resultobj: list[dict] = [dict(), dict()]
-            resultobj[0][0] = []
-            for i in range(17):
-                resultobj[1][i] = []
-            for det in detections:
-                xmin, ymin, xmax, ymax = det["box"]
-                conf = float(det["confidence"])
-                char_count = float(det.get("pred_char_count", 0))
-                if det["class_index"] == 0:
-                    resultobj[0][0].append([xmin, ymin, xmax, ymax])
-                resultobj[1][det["class_index"]].append(
-                    [xmin, ymin, xmax, ymax, conf, char_count]
-                )
+    def _decode(self, image: bytes | memoryview | np.ndarray) -> np.ndarray | _DraftJpeg:
+        return _decode_image(image, draft_size=self._jpeg_draft_size)
 
-            # --- XML conversion & reading order ---
-            xmlstr = convert_to_xml_string3(img_w, img_h, "input.jpg", classeslist, resultobj)
-            xmlstr = "<OCRDATASET>" + xmlstr + "</OCRDATASET>"
-            root = ET.fromstring(xmlstr)
-            eval_xml(root, logger=None)
-
-            # --- Extract line images ---
-            line_elems = root.findall(".//LINE")
-            alllineobj: list[RecogLine] = []
-            for idx, le in enumerate(line_elems):
-                xmin = int(le.get("X"))
-                ymin = int(le.get("Y"))
-                line_w = int(le.get("WIDTH"))
-                line_h = int(le.get("HEIGHT"))
-                try:
-                    pred_char_cnt = float(le.get("PRED_CHAR_CNT"))
-                except (TypeError, ValueError):
-                    pred_char_cnt = 100.0
-                # Clamp to image bounds
-                lineimg = img_np[
-                    max(0, ymin): min(img_h, ymin + line_h),
-                    max(0, xmin): min(img_w, xmin + line_w),
-                    :,
-                ]
-                if lineimg.size == 0:
-                    continue
-                alllineobj.append(RecogLine(lineimg, idx, pred_char_cnt))
+    def _check_detector_size(self, detector_size: int | None) -> None:
+        if detector_size is not None and detector_size not in self._detector_sizes:
+            raise ValueError(f"detector_size must be one of {self._detector_sizes}")
 
-            # --- Cascade recognition ---
-            resultlinesall = _process_cascade(
-                alllineobj, self._recognizer30, self._recognizer50, self._recognizer100
-            )
+    def predict(
+        self,
+        image: bytes | memoryview | np.ndarray,
+        time_keeper: TimeKeeper | None = None,
+        cancel: CancelToken | None = None,
+        detector_size: int | None = None,
+    ) -> list[dict]:
+        """Run OCR on encoded image bytes or a decoded RGB/grayscale frame.
+        Returns list of line dicts.
+
+        Stage times are recorded in `time_keeper` (a fresh one by default)
+        and reported to the metrics. Raises OCRCancelled once `cancel` fires.
+        The detector input size is selected per image unless `detector_size`
+        is given.
+        """
+        self._check_detector_size(detector_size)
+        time_keeper = time_keeper or TimeKeeper()
+        cancel = cancel or CancelToken()
+        with time_keeper.measure_time("decode"):
+            img = self._decode(image)
+        with self._checkout(time_keeper, cancel) as replica:
+            with time_keeper.measure_time("detect"):
+                detected = replica.detect(img, detector_size, cancel)
+            cancel.check()
+            page, alllineobj = _layout(detected, time_keeper)
+            replica.recognize(alllineobj, time_keeper, cancel)
+        with time_keeper.measure_time("response"):
+            lines = _build_response(page, alllineobj)
+        metrics.observe_stages(time_keeper)
+        return lines
+
+    @staticmethod
+    def document_pages_in_flight(detect_batch: int = 4, queue_size: int = 2) -> int:
+        """Most pages `predict_document` holds at once.
+
+        One chunk being rendered, `queue_size` chunks queued for detection,
+        one being detected, `queue_size` queued for layout and one being laid
+        out.
+        """
+        return (2 * queue_size + 3) * detect_batch
+
+    def predict_document(
+        self,
+        pages: Iterable[np.ndarray],
+        detect_batch: int = 4,
+        queue_size: int = 2,
+        time_keeper: TimeKeeper | None = None,
+        cancel: CancelToken | None = None,
+        detector_size: int | None = None,
+    ) -> list[dict]:
+        """Run OCR on every page of a document. Returns one dict per page.
 
-        # --- Build response ---
-        # Map recognized text back to line elements by order
-        recog_idx = 0
-        lines: list[dict] = []
-        for le in line_elems:
-            xmin = int(le.get("X"))
-            ymin = int(le.get("Y"))
-            line_w = int(le.get("WIDTH"))
-            line_h = int(le.get("HEIGHT"))
-            try:
-                conf = float(le.get("CONF"))
-            except (TypeError, ValueError):
-                conf = 0.0
-            is_vertical = line_h > line_w
-            text = resultlinesall[recog_idx] if recog_idx < len(resultlinesall) else ""
-            recog_idx += 1
-            lines.append(
+        Pages are pulled from `pages` lazily and detected `detect_batch` at a
+        time while later pages are still being rendered; only line crops are
+        kept afterwards. Lines from all pages then go through one shared
+        recognizer cascade, so batches stay full regardless of page size.
+        Detection and layout times are recorded per chunk / page; `cancel`
+        is checked per chunk and recognizer batch. Pages are detected at
+        full resolution unless `detector_size` is given.
+        """
+        self._check_detector_size(detector_size)
+        time_keeper = time_keeper or TimeKeeper()
+        cancel = cancel or CancelToken()
+        with self._checkout(time_keeper, cancel) as replica:
+
+            def detect_pages(imgs: list[np.ndarray]) -> list[tuple[np.ndarray, list[dict], list[str]]]:
+                cancel.check()
+                with time_keeper.measure_time("detect"):
+                    return replica.detect_many(imgs, detector_size, cancel)
+
+            def layout_pages(detected_pages: list[tuple[np.ndarray, list[dict], list[str]]]) -> list[tuple]:
+                cancel.check()
+                out = []
+                for detected in detected_pages:
+                    img_h, img_w = detected[0].shape[:2]
+                    page, alllineobj = _layout(detected, time_keeper)
+                    for lineobj in alllineobj:
+                        # Own the crop so the page image can be freed
+                        lineobj.npimg = lineobj.npimg.copy()
+                    out.append((img_w, img_h, page, alllineobj))
+                return out
+
+            pipeline = StagedPipeline(
+                [detect_pages, layout_pages],
+                maxsize=queue_size,
+                name="ocr-document",
+            )
+            laid_out: list[tuple[int, int, Page, list[RecogLine], int]] = []
+            pooled: list[RecogLine] = []
+            base = 0
+            for chunk in pipeline.run(_chunked(pages, detect_batch)):
+                for img_w, img_h, page, alllineobj in chunk:
+                    # Line indices must be unique across the pooled cascade
+                    for lineobj in alllineobj:
+                        lineobj.idx += base
+                    pooled.extend(alllineobj)
+                    laid_out.append((img_w, img_h, page, alllineobj, base))
+                    base += len(page)
+            replica.recognize(pooled, time_keeper, cancel)
+        with time_keeper.measure_time("response"):
+            result = [
                 {
-                    "text": text,
-                    "confidence": conf,
-                    "box": [
-                        [xmin, ymin],
-                        [xmin + line_w, ymin],
-                        [xmin + line_w, ymin + line_h],
-                        [xmin, ymin + line_h],
-                    ],
-                    "is_vertical": is_vertical,
+                    "page": i + 1,
+                    "width": img_w,
+                    "height": img_h,
+                    "lines": _build_response(page, alllineobj, index_offset=offset),
                 }
+                for i, (img_w, img_h, page, alllineobj, offset) in enumerate(laid_out)
+            ]
+        metrics.observe_stages(time_keeper)
+        return result
+
+    def predict_stream(
+        self,
+        image_bytes: bytes,
+        time_keeper: TimeKeeper | None = None,
+        cancel: CancelToken | None = None,
+        detector_size: int | None = None,
+    ) -> Iterator[dict]:
+        """Run OCR on raw image bytes, yielding events as results become available.
+
+        - ``{"event": "layout", "lines": [...]}`` once reading order is known:
+          box, confidence and is_vertical of every line, indexed by position
+        - ``{"event": "line", "index": i, "text": ..., "tier": 30 | 50 | 100}``
+          for each line, as soon as the recognizer tier that settles it finishes
+        - ``{"event": "done", "num_lines": n}``
+
+        Lines whose crop is empty get no "line" event (their text is "").
+        Closing the generator early, or `cancel` firing (OCRCancelled),
+        returns the replica. Stage times of a completed stream are reported
+        to the metrics.
+        """
+        self._check_detector_size(detector_size)
+        time_keeper = time_keeper or TimeKeeper()
+        cancel = cancel or CancelToken()
+        with time_keeper.measure_time("decode"):
+            img = self._decode(image_bytes)
+        with self._checkout(time_keeper, cancel) as replica:
+            with time_keeper.measure_time("detect"):
+                detected = replica.detect(img, detector_size, cancel)
+            cancel.check()
+            page, alllineobj = _layout(detected, time_keeper)
+            yield {"event": "layout", "lines": [dict(index=i, **line) for i, line in enumerate(_line_dicts(page))]}
+            for tier, settled in replica.recognize_tiers(alllineobj, time_keeper, cancel):
+                for lineobj in settled:
+                    yield {"event": "line", "index": lineobj.idx, "text": lineobj.pred_str, "tier": tier}
+        metrics.observe_stages(time_keeper)
+        yield {"event": "done", "num_lines": len(page)}
+
+    def predict_many(self, images: Iterable[bytes], queue_size: int = 2) -> Iterator[list[dict] | Exception]:
+        """Run OCR on a stream of images, yielding one result per image in order.
+
+        Decode, detection, layout/reading order and recognition run as separate
+        pipeline stages on one replica, so its detector and recognizers work on
+        different images at the same time. A failed image yields its exception.
+        Stage times are reported to the metrics once the stream ends.
+        """
+        # Each stage thread records under its own keys
+        time_keeper = TimeKeeper()
+        with self._checkout(time_keeper) as replica:
+
+            def decode(image: bytes) -> np.ndarray | _DraftJpeg:
+                with time_keeper.measure_time("decode"):
+                    return self._decode(image)
+
+            def detect(img: np.ndarray | _DraftJpeg) -> tuple[np.ndarray | _DraftJpeg, list[dict], list[str]]:
+                with time_keeper.measure_time("detect"):
+                    return replica.detect(img)
+
+            def recognize(layout: tuple[Page, list[RecogLine]]) -> list[dict]:
+                page, alllineobj = layout
+                replica.recognize(alllineobj, time_keeper)
+                return _build_response(page, alllineobj)
+
+            pipeline = StagedPipeline(
+                [
+                    decode,
+                    detect,
+                    lambda detected: _layout(detected, time_keeper),
+                    recognize,
+                ],
+                maxsize=queue_size,
+                name="ocr-pipeline",
             )
-        return lines
+            yield from pipeline.run(images, return_exceptions=True)
+        metrics.observe_stages(time_keeper)
+
+
+# ---------------------------------------------------------------------------
+# Pipeline stages
+# ---------------------------------------------------------------------------
+def _chunked(items: Iterable[np.ndarray], size: int) -> Iterator[list[np.ndarray]]:
+    chunk: list[np.ndarray] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _decode_image(image: bytes | memoryview | np.ndarray, draft_size: int = 0) -> np.ndarray | _DraftJpeg:
+    """Decode an upload to RGB pixels.
+
+    With `draft_size` > 0, JPEGs large enough to allow it are decoded reduced
+    so that their longer side is still at least `draft_size` (see _DraftJpeg).
+    """
+    if isinstance(image, np.ndarray):
+        # Pre-decoded frame: RGB is used as is, grayscale is expanded
+        if image.ndim == 2:
+            return np.repeat(image[:, :, None], 3, axis=2)
+        if image.ndim == 3 and image.shape[2] == 1:
+            return np.repeat(image, 3, axis=2)
+        return image
+    with Image.open(_BufferReader(image)) as img:
+        if draft_size > 0 and img.format == "JPEG":
+            full_w, full_h = img.size
+            max_wh = max(full_w, full_h)
+            img.draft("RGB", (math.ceil(full_w * draft_size / max_wh), math.ceil(full_h * draft_size / max_wh)))
+            if img.size != (full_w, full_h):
+                return _DraftJpeg(image, np.asarray(img.convert("RGB")), (full_w, full_h))
+        return np.asarray(img.convert("RGB"))
+
+
+def _layout(
+    detected: tuple[np.ndarray | _DraftJpeg, list[dict], list[str]], time_keeper: TimeKeeper | None = None
+) -> tuple[Page, list[RecogLine]]:
+    """Page model, reading order and line crops for one detected page.
+
+    Records layout / reading_order / crop times in `time_keeper`, plus the
+    xy-cut and sorting steps inside reading_order.
+    """
+    time_keeper = time_keeper or TimeKeeper()
+    img, detections, classeslist = detected
+    with time_keeper.measure_time("layout"):
+        page = _build_layout(img, detections, classeslist)
+    with time_keeper.measure_time("reading_order"):
+        page.apply_reading_order(time_keeper)
+    with time_keeper.measure_time("crop"):
+        alllineobj = _crop_lines(img, page)
+    return page, alllineobj
+
+
+def _build_layout(img: np.ndarray | _DraftJpeg, detections: list[dict], classeslist: list[str]) -> Page:
+    """Page model of the detections, in full-image coordinates."""
+    if isinstance(img, _DraftJpeg):
+        detections = img.to_full(detections)
+        img_w, img_h = img.size
+    else:
+        img_h, img_w = img.shape[:2]
+
+    # Build resultobj for build_page
+    # resultobj[0] = {0: [[x1,y1,x2,y2], ...]}  (text_block polygons)
+    # resultobj[1] = {cls_id: [[x1,y1,x2,y2,conf,char_count], ...]}
+    resultobj: list[dict] = [dict(), dict()]
+    resultobj[0][0] = []
+    for i in range(17):
+        resultobj[1][i] = []
+    for det in detections:
+        xmin, ymin, xmax, ymax = det["box"]
+        conf = float(det["confidence"])
+        char_count = float(det.get("pred_char_count", 0))
+        if det["class_index"] == 0:
+            resultobj[0][0].append([xmin, ymin, xmax, ymax])
+        resultobj[1][det["class_index"]].append(
+            [xmin, ymin, xmax, ymax, conf, char_count]
+        )
+
+    # --- Layout (no XML round trip) ---
+    return build_page(img_w, img_h, "input.jpg", classeslist, resultobj)
+
+
+def _crop_lines(img: np.ndarray | _DraftJpeg, page: Page) -> list[RecogLine]:
+    """Line images in reading order, for recognition."""
+    lines = page.ordered_lines()
+    if isinstance(img, _DraftJpeg):
+        img_w, img_h = img.size
+        thickness = np.minimum(lines["width"], lines["height"])
+        img_np = img.crop_source(int(thickness.min()) if len(thickness) else 0)
+    else:
+        img_np = img
+        img_h, img_w = img.shape[:2]
+    # Crops may come from a reduced decode; line boxes are in full-size coordinates
+    src_h, src_w = img_np.shape[:2]
+    scale_x, scale_y = src_w / img_w, src_h / img_h
+    alllineobj: list[RecogLine] = []
+    for idx, (xmin, ymin, line_w, line_h, pred_char_cnt, scored) in enumerate(
+        zip(
+            lines["x"].tolist(),
+            lines["y"].tolist(),
+            lines["width"].tolist(),
+            lines["height"].tolist(),
+            lines["pred_char_cnt"].tolist(),
+            lines["scored"].tolist(),
+        )
+    ):
+        if not scored:
+            pred_char_cnt = 100.0
+        # Clamp to image bounds
+        if src_w != img_w or src_h != img_h:
+            xmin, xmax = math.floor(xmin * scale_x), math.ceil((xmin + line_w) * scale_x)
+            ymin, ymax = math.floor(ymin * scale_y), math.ceil((ymin + line_h) * scale_y)
+        else:
+            xmax, ymax = xmin + line_w, ymin + line_h
+        lineimg = img_np[
+            max(0, ymin): min(src_h, ymax),
+            max(0, xmin): min(src_w, xmax),
+            :,
+        ]
+        if lineimg.size == 0:
+            continue
+        alllineobj.append(RecogLine(lineimg, idx, pred_char_cnt))
+    return alllineobj
+
+
+def _line_dicts(page: Page) -> list[dict]:
+    """Box, confidence and orientation of every line, in reading order."""
+    lines = page.ordered_lines()
+    out: list[dict] = []
+    for xmin, ymin, line_w, line_h, conf, scored in zip(
+        lines["x"].tolist(),
+        lines["y"].tolist(),
+        lines["width"].tolist(),
+        lines["height"].tolist(),
+        lines["conf"].tolist(),
+        lines["scored"].tolist(),
+    ):
+        out.append(
+            {
+                "confidence": conf if scored else 0.0,
+                "box": [
+                    [xmin, ymin],
+                    [xmin + line_w, ymin],
+                    [xmin + line_w, ymin + line_h],
+                    [xmin, ymin + line_h],
+                ],
+                "is_vertical": line_h > line_w,
+            }
+        )
+    return out
+
+
+def _build_response(page: Page, alllineobj: list[RecogLine], index_offset: int = 0) -> list[dict]:
+    # Map recognized text back to lines by reading order index
+    texts = {lineobj.idx - index_offset: lineobj.pred_str for lineobj in alllineobj}
+    return [{"text": texts.get(i, ""), **line} for i, line in enumerate(_line_dicts(page))]
@@ -8,8 +8,45 @@ class OCRLine(BaseModel):
     is_vertical: bool
 
 
+class OCRStageTiming(BaseModel):
+    count: int
+    total_ms: float
+    max_ms: float
+
+
+class OCRTrace(BaseModel):
+    total_ms: float
+    stages: dict[str, OCRStageTiming]  # in the order the stages first ran
+    profile: str | None = None  # cProfile dump under OCR_PROFILE_DIR
+
+
 class OCRResponse(BaseModel):
     lines: list[OCRLine]
+    trace: OCRTrace | None = None  # only with ?trace= / X-OCR-Trace
+
+
+class OCRPage(BaseModel):
+    page: int  # 1-based
+    width: int
+    height: int
+    lines: list[OCRLine]
+
+
+class OCRDocumentResponse(BaseModel):
+    pages: list[OCRPage]
+    trace: OCRTrace | None = None
+
+
+class JobResponse(BaseModel):
+    id: str
+    kind: str  # "image" | "document"
+    status: str  # "queued" | "running" | "done" | "failed"
+    created: float  # unix time
+    started: float | None = None
+    finished: float | None = None
+    result: OCRResponse | OCRDocumentResponse | None = None
+    error: str | None = None
+    attempts: int = 0  # times a worker has started the job
 
 
 class OCRRequestBase64(BaseModel):
@@ -20,7 +57,44 @@ class OCRRequestURL(BaseModel):
     url: str
 
 
+class OCRRequestURLs(BaseModel):
+    urls: list[str]
+
+
+class OCRURLResult(BaseModel):
+    url: str
+    lines: list[OCRLine] | None = None
+    error: str | None = None  # set instead of lines when this URL failed
+
+
+class OCRURLsResponse(BaseModel):
+    results: list[OCRURLResult]  # same order as the request
+
+
+class CacheStats(BaseModel):
+    hits: int
+    misses: int
+    disk_hits: int
+    entries: int
+    size_bytes: int
+
+
+class AdmissionStats(BaseModel):
+    active: int
+    queued: int
+    inflight_bytes: int
+    rejected: int
+
+
 class HealthResponse(BaseModel):
     status: str
     model: str
     device: str
+    replicas: int
+    ready: bool
+    cache: CacheStats | None = None
+    admission: AdmissionStats | None = None
+
+
+class ProbeResponse(BaseModel):
+    status: str
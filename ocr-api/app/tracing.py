@@ -0,0 +1,78 @@
+import cProfile
+import logging
+import os
+import threading
+import time
+import uuid
+from collections.abc import Callable, Iterable, Iterator
+from typing import TypeVar
+
+from .ocr_engine import TimeKeeper
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_END = object()
+
+# cProfile cannot run in two threads at once on every Python version
+_PROFILE_LOCK = threading.Lock()
+
+
+# ---------------------------------------------------------------------------
+# RequestTrace — opt-in per-request timings and profile
+# ---------------------------------------------------------------------------
+class RequestTrace:
+    """Stage timings of one traced request, optionally with a cProfile dump.
+
+    The engine records its stages (and the reading order's xy-cut and
+    sorting steps) in `time_keeper`. With `profile_dir`, the engine call is
+    also profiled and the stats are written there as ``<id>.prof``; the
+    profile covers the request's own thread, not the recognizer pool.
+    `profile` stays None when the dump could not be written.
+    """
+
+    def __init__(self, profile_dir: str | None = None) -> None:
+        self.time_keeper = TimeKeeper()
+        self._profile_dir = profile_dir
+        self.profile: str | None = None
+        self.total_ms = 0.0
+
+    def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Call `fn(*args, time_keeper=..., **kwargs)`, timing (and profiling) it."""
+        start = time.perf_counter()
+        try:
+            if self._profile_dir is None:
+                return fn(*args, time_keeper=self.time_keeper, **kwargs)
+            with _PROFILE_LOCK:
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    return fn(*args, time_keeper=self.time_keeper, **kwargs)
+                finally:
+                    profiler.disable()
+                    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.prof"
+                    # A failed dump must not turn the request into an error
+                    try:
+                        profiler.dump_stats(os.path.join(self._profile_dir, name))
+                    except OSError as e:
+                        logger.warning("Could not write request profile %s: %s", name, e)
+                    else:
+                        self.profile = name
+                        logger.info("Wrote request profile %s", self.profile)
+        finally:
+            self.total_ms = (time.perf_counter() - start) * 1e3
+
+    def timed(self, items: Iterable[T], key: str) -> Iterator[T]:
+        """Yield from `items`, recording the time spent producing each one under `key`."""
+        it = iter(items)
+        while True:
+            start = time.perf_counter()
+            item = next(it, _END)
+            if item is _END:
+                return
+            self.time_keeper.record(key, time.perf_counter() - start)
+            yield item
+
+    def to_dict(self) -> dict:
+        return {"total_ms": self.total_ms, "stages": self.time_keeper.to_dict(), "profile": self.profile}
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+from PIL import Image
+
+import ocr
+from session_cache import file_sha256
+
+
+def config_fingerprint(args) -> str:
+    """
+    Identifies the models and thresholds; a change invalidates finished rows.
+    """
+    config = {
+        "det_weights": file_sha256(args.det_weights),
+        "rec_weights30": file_sha256(args.rec_weights30),
+        "rec_weights50": file_sha256(args.rec_weights50),
+        "rec_weights": file_sha256(args.rec_weights),
+        "rec_classes": file_sha256(args.rec_classes),
+        "det_score_threshold": args.det_score_threshold,
+        "det_conf_threshold": args.det_conf_threshold,
+        "det_iou_threshold": args.det_iou_threshold,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+class Manifest:
+    """
+    SQLite record of every input: content hash, status, timing and the hashes
+    of the written outputs. Only the parent process writes to it.
+
+    status: running -> done | failed
+    A row left in `running` by an interrupted run is simply processed again.
+    """
+
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime REAL, content_hash TEXT, config TEXT, "
+            "status TEXT NOT NULL, started REAL, finished REAL, elapsed REAL, "
+            "outputs TEXT, error TEXT)"
+        )
+        self.db.commit()
+
+    def content_hash(self, path: str) -> str:
+        """
+        sha256 of the file, reusing the recorded hash while size and mtime are unchanged
+        """
+        st = os.stat(path)
+        row = self.db.execute("SELECT size, mtime, content_hash FROM files WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == st.st_size and row[1] == st.st_mtime and row[2]:
+            return row[2]
+        return file_sha256(path)
+
+    def is_done(self, path: str, content_hash: str, config: str) -> bool:
+        row = self.db.execute(
+            "SELECT status, content_hash, config, outputs FROM files WHERE path = ?", (path,)
+        ).fetchone()
+        if row is None or row[0] != "done" or row[1] != content_hash or row[2] != config:
+            return False
+        return all(os.path.isfile(p) for p in json.loads(row[3] or "{}"))
+
+    def mark_running(self, path: str, content_hash: str, config: str):
+        st = os.stat(path)
+        self.db.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime, content_hash, config, status, started) "
+            "VALUES (?, ?, ?, ?, ?, 'running', ?)",
+            (path, st.st_size, st.st_mtime, content_hash, config, time.time()),
+        )
+
+    def mark_done(self, path: str, elapsed: float, outputs: dict):
+        self.db.execute(
+            "UPDATE files SET status = 'done', finished = ?, elapsed = ?, outputs = ?, error = NULL WHERE path = ?",
+            (time.time(), elapsed, json.dumps(outputs), path),
+        )
+
+    def mark_failed(self, path: str, error: str):
+        self.db.execute(
+            "UPDATE files SET status = 'failed', finished = ?, error = ? WHERE path = ?",
+            (time.time(), error, path),
+        )
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+# Per worker process state, set by _init_worker
+_worker = {}
+
+
+def _init_worker(args, intra_op_num_threads: int):
+    _worker["args"] = args
+    _worker["detector"] = ocr.get_detector(args, intra_op_num_threads=intra_op_num_threads)
+    _worker["recognizer100"] = ocr.get_recognizer(args=args, intra_op_num_threads=intra_op_num_threads)
+    _worker["recognizer30"] = ocr.get_recognizer(args=args, weights_path=args.rec_weights30,
+                                                 intra_op_num_threads=intra_op_num_threads)
+    _worker["recognizer50"] = ocr.get_recognizer(args=args, weights_path=args.rec_weights50,
+                                                 intra_op_num_threads=intra_op_num_threads)
+
+
+def _process_file(inputpath: str):
+    """
+    OCR one image with the worker's models and write XML/JSON/TXT.
+    return: (elapsed seconds, {output path: sha256})
+    """
+    args = _worker["args"]
+    start = time.time()
+    img = np.array(Image.open(inputpath).convert("RGB"))
+    img_h, img_w = img.shape[:2]
+    imgname = os.path.basename(inputpath)
+    detections, classeslist = ocr.process_detector(_worker["detector"], inputname=imgname, npimage=img,
+                                                   outputpath=args.output, issaveimg=args.viz)
+    root, alllineobj, tatelinecnt, alllinecnt = ocr.layout_page(imgname, img, detections, classeslist)
+    resultlinesall = ocr.process_cascade(alllineobj, _worker["recognizer30"], _worker["recognizer50"],
+                                         _worker["recognizer100"], is_cascade=True, batched=True)
+    outputs = ocr.save_results(args.output, inputpath, img_w, img_h, root, resultlinesall, tatelinecnt, alllinecnt)
+    return time.time() - start, {p: file_sha256(p) for p in outputs}
+
+
+def run(args, inputpathlist):
+    """
+    OCR `inputpathlist` with a pool of worker processes, each holding its own
+    detector and recognizers, recording progress in the manifest at `args.manifest`.
+    Inputs already done with the same content and models are skipped.
+    """
+    workers = args.workers or os.cpu_count() or 1
+    # Split the cores between the workers' sessions. Each worker runs detection
+    # and batched recognition one after the other on its calling thread, so a
+    # worker never uses more than its share.
+    intra_op_num_threads = max(1, (os.cpu_count() or 1) // workers)
+    config = config_fingerprint(args)
+    manifest = Manifest(args.manifest)
+
+    todo = []
+    skipped = 0
+    for inputpath in inputpathlist:
+        content_hash = manifest.content_hash(inputpath)
+        if manifest.is_done(inputpath, content_hash, config):
+            skipped += 1
+        else:
+            todo.append((inputpath, content_hash))
+    print(f"[INFO] {len(todo)} images to process, {skipped} unchanged images skipped, {workers} workers")
+
+    done = failed = 0
+    next_report = 100
+    batch_start = time.time()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(args, intra_op_num_threads)) as executor:
+            pending = {}
+            it = iter(todo)
+            while True:
+                # Keep a bounded number of files in flight
+                for inputpath, content_hash in it:
+                    manifest.mark_running(inputpath, content_hash, config)
+                    pending[executor.submit(_process_file, inputpath)] = inputpath
+                    if len(pending) >= workers * 2:
+                        break
+                manifest.commit()
+                if not pending:
+                    break
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    inputpath = pending.pop(future)
+                    try:
+                        elapsed, outputs = future.result()
+                    except Exception as e:
+                        failed += 1
+                        manifest.mark_failed(inputpath, f"{type(e).__name__}: {e}")
+                        print(f"[ERROR] {inputpath}: {e}")
+                        continue
+                    done += 1
+                    manifest.mark_done(inputpath, elapsed, outputs)
+                manifest.commit()
+                if done + failed >= next_report:
+                    next_report += 100
+                    elapsed = time.time() - batch_start
+                    print(f"[INFO] {done + failed}/{len(todo)} images ({done / max(elapsed, 1e-9):.2f} images/s)")
+    finally:
+        manifest.close()
+    elapsed = time.time() - batch_start
+    print(f"[INFO] Processed {done} images in {elapsed:.2f} s ({done / max(elapsed, 1e-9):.2f} images/s), "
+          f"{failed} failed, {skipped} skipped")
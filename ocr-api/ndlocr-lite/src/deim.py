@@ -6,6 +6,8 @@ import numpy as np
 from typing import Tuple, List
 import xml.etree.ElementTree as ET
 
+from session_cache import create_session
+
 class DEIM:
     def __init__(self,
                  model_path: str,
@@ -14,7 +16,9 @@ class DEIM:
                  score_threshold: float = 0.1,
                  conf_threshold: float = 0.1,
                  iou_threshold: float = 0.4,
-                 device: str = "CPU") -> None:
+                 device: str = "CPU",
+                 intra_op_num_threads: int = 0,
+                 cache_dir: str = None) -> None:
         self.model_path = model_path
         self.class_mapping_path = class_mapping_path
         self.image_width, self.image_height = original_size
@@ -22,6 +26,15 @@ class DEIM:
         self.score_threshold = score_threshold
         self.conf_threshold = conf_threshold
         self.iou_threshold = iou_threshold
+        self.intra_op_num_threads = intra_op_num_threads
+        # Optimized graphs are kept here across starts (None = no cache)
+        self.cache_dir = cache_dir
+        mean = np.array([0.485, 0.456, 0.406], dtype=np.float32).reshape(3, 1, 1)
+        std = np.array([0.229, 0.224, 0.225], dtype=np.float32).reshape(3, 1, 1)
+        self.norm_scale = (1.0 / (255.0 * std)).astype(np.float32)
+        self.norm_offset = (mean / std).astype(np.float32)
+        self.pad_value = -self.norm_offset
+        self.input_buffer = None
         self.colorlist=[(0, 0, 0), (255, 0, 0), (0, 0, 142), (0, 0, 230), (106, 0, 228),
                         (0, 60, 100), (0, 80, 100), (0, 0, 70), (0, 0, 192), (250, 170, 30),
                         (100, 170, 30), (220, 220, 0), (175, 116, 175), (250, 0, 30),(165, 42, 42), (255, 77, 255),(255,0,0)]
@@ -30,13 +43,15 @@ class DEIM:
     def create_session(self) -> None:
         opt_session = onnxruntime.SessionOptions()
         opt_session.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # 0 lets onnxruntime use every physical core
+        opt_session.intra_op_num_threads = self.intra_op_num_threads
         #opt_session.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
         #ExecutionMode.ORT_PARALLEL
         #opt_session.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
         providers = ['CPUExecutionProvider']
         if self.device.casefold() == "cuda":
             providers = ['CUDAExecutionProvider','CPUExecutionProvider']
-        session = onnxruntime.InferenceSession(self.model_path,opt_session, providers=providers)
+        session = create_session(self.model_path, opt_session, providers, device=self.device, cache_dir=self.cache_dir)
         self.session = session
         self.model_inputs = self.session.get_inputs()
         self.input_names = [self.model_inputs[i].name for i in range(len(self.model_inputs))]
@@ -44,6 +59,8 @@ class DEIM:
         self.model_output = self.session.get_outputs()
         self.output_names = [self.model_output[i].name for i in range(len(self.model_output))]
         self.input_height, self.input_width = self.input_shape[2:]
+        # A symbolic batch dimension (e.g. "N") means several images can share one run
+        self.is_dynamic_batch = not isinstance(self.input_shape[0], int)
 
         if self.class_mapping_path is not None:
             with open(self.class_mapping_path, 'r') as file:
@@ -51,25 +68,37 @@ class DEIM:
                 self.classes = yaml_file['names']
                 self.color_palette = np.random.uniform(0, 255, size=(len(self.classes), 3))
 
-    def preprocess(self, img: np.ndarray) -> np.ndarray:
-        max_wh=max(img.shape[0],img.shape[1])
-        paddedimg=np.zeros((max_wh,max_wh,3)).astype(np.uint8)
-        paddedimg[:img.shape[0],:img.shape[1],:]=img.copy()
-        pil_image = Image.fromarray(paddedimg)
-        self.image_width,self.image_height = pil_image.size
-        pil_resized = pil_image.resize((self.input_width, self.input_height))
-        resized=np.array(pil_resized)
-        #resized=resized[:,:,::-1]
-        
-        # Scale input pixel value to 0 to 1
-        resized = resized / 255.0
-        mean = np.array([0.485, 0.456, 0.406], dtype=np.float32)
-        std = np.array([0.229, 0.224, 0.225], dtype=np.float32)
-        input_image= (resized-mean) / std
-        input_image = input_image.transpose(2,0,1)
-        input_tensor = input_image[np.newaxis, :, :, :].astype(np.float32)
-        return input_tensor
-    
+    def get_input_buffer(self, batch_size: int) -> np.ndarray:
+        # Reused across calls; grows to the largest batch seen
+        if self.input_buffer is None or self.input_buffer.shape[0] < batch_size:
+            self.input_buffer = np.empty((batch_size, 3, self.input_height, self.input_width), dtype=np.float32)
+        return self.input_buffer[:batch_size]
+
+    def preprocess(self, img: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        """
+        Resize `img` (uint8 RGB) so that its longer side fits the model input, then
+        pad it to the bottom/right. This matches padding to a max_wh square and
+        resizing, without materializing the full-size square canvas.
+        The normalized [1,3,H,W] float32 tensor is written into `out` (default: the
+        reusable input buffer), so the result is only valid until the next call.
+        """
+        img_h, img_w = img.shape[:2]
+        max_wh = max(img_h, img_w)
+        self.image_width, self.image_height = max_wh, max_wh
+        new_w = min(self.input_width, max(1, round(img_w * self.input_width / max_wh)))
+        new_h = min(self.input_height, max(1, round(img_h * self.input_height / max_wh)))
+        pil_resized = Image.fromarray(img).resize((new_w, new_h))
+        resized = np.asarray(pil_resized)
+
+        if out is None:
+            out = self.get_input_buffer(1)
+        # (x / 255 - mean) / std == x * scale - offset, applied straight into the CHW layout
+        out[0] = self.pad_value
+        region = out[0, :, :new_h, :new_w]
+        np.multiply(resized.transpose(2, 0, 1), self.norm_scale, out=region)
+        np.subtract(region, self.norm_offset, out=region)
+        return out
+
     def xywh2xyxy(self, x):
         # Convert bounding box (x, y, w, h) to bounding box (x1, y1, x2, y2)
         y = np.copy(x)
@@ -79,8 +108,10 @@ class DEIM:
         y[..., 3] = x[..., 1] + x[..., 3] / 2
         return y 
     
-    def postprocess(self, outputs):
-        
+    def postprocess(self, outputs, image_size=None):
+        # image_size: (width, height) of the padded square image; defaults to the last preprocess() call
+        image_width, image_height = image_size if image_size is not None else (self.image_width, self.image_height)
+
         if len(outputs)==4:
             class_ids,bboxes,scores,char_counts=outputs
             class_ids=np.squeeze(class_ids)
@@ -97,10 +128,10 @@ class DEIM:
         predictions = predictions[scores > self.conf_threshold, :]
         scores = scores[scores > self.conf_threshold]
         scales = np.array([
-            self.image_width / self.input_width, 
-            self.image_height / self.input_width, 
-            self.image_width / self.input_width, 
-            self.image_height / self.input_width
+            image_width / self.input_width, 
+            image_height / self.input_width, 
+            image_width / self.input_width, 
+            image_height / self.input_width
         ], dtype=np.float32)
         boxes = (predictions[:, :4] * scales).astype(np.int32)
         detections = []
@@ -125,6 +156,23 @@ class DEIM:
         #print(self.input_shape)
         outputs = self.session.run(self.output_names, {self.input_names[0]: input_tensor,self.input_names[1]:np.array([[self.input_height, self.input_width]],np.int64)})
         return self.postprocess(outputs)
+
+    def detect_batch(self, imgs: List[np.ndarray]) -> List[List]:
+        """
+        Detect several images with one session.run and split the outputs per image.
+        Falls back to one run per image when the model has a fixed batch size.
+        """
+        if not self.is_dynamic_batch:
+            return [self.detect(img) for img in imgs]
+        input_tensor = self.get_input_buffer(len(imgs))
+        image_sizes = []
+        for i, img in enumerate(imgs):
+            self.preprocess(img, out=input_tensor[i:i + 1])
+            image_sizes.append((self.image_width, self.image_height))
+        target_sizes = np.array([[self.input_height, self.input_width]] * len(imgs), np.int64)
+        outputs = self.session.run(self.output_names, {self.input_names[0]: input_tensor,self.input_names[1]:target_sizes})
+        return [self.postprocess([output[i:i + 1] for output in outputs], image_size=image_size)
+                for i, image_size in enumerate(image_sizes)]
     
     def draw_detections(self, npimg: np.ndarray, detections: List):
         pil_image = Image.fromarray(npimg)
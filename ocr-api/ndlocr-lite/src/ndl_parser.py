@@ -711,53 +711,125 @@ def get_relationship(res_bbox, tb_polygons, classes, use_block_ad: bool = True,
 
     return tb_info, ad_info, independ_lines
 
+class RectIndex:
+    """
+    Uniform grid over axis-aligned rectangles answering "which is the first
+    (lowest index) rectangle containing this point" for many points at once.
+    rects: [N, 4] (xmin, ymin, xmax, ymax); boundaries count as inside.
+    Rectangles covering more than `max_cells` cells are not gridded but kept
+    in a short list tested against every point, which bounds the grid at
+    N * max_cells cells whatever the size mix.
+    """
+
+    def __init__(self, rects, cell_size=None, max_cells=64):
+        self.rects = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+        self.cells = {}
+        self.large = np.zeros(0, dtype=np.int64)
+        if len(self.rects) == 0:
+            return
+        lo = np.minimum(self.rects[:, :2], self.rects[:, 2:])
+        hi = np.maximum(self.rects[:, :2], self.rects[:, 2:])
+        if cell_size is None:
+            # About one rectangle per cell on average
+            cell_size = max(1.0, float(np.median(np.maximum(hi - lo, 1.0))))
+        self.cell_size = cell_size
+        self.origin = lo.min(axis=0)
+        lo_cell = ((lo - self.origin) // cell_size).astype(np.int64)
+        hi_cell = ((hi - self.origin) // cell_size).astype(np.int64)
+        ncells = np.prod(hi_cell - lo_cell + 1, axis=1)
+        self.large = np.flatnonzero(ncells > max_cells)
+        for i in np.flatnonzero(ncells <= max_cells).tolist():
+            for cx in range(lo_cell[i, 0], hi_cell[i, 0] + 1):
+                for cy in range(lo_cell[i, 1], hi_cell[i, 1] + 1):
+                    self.cells.setdefault((cx, cy), []).append(i)
+        self.cells = {key: np.array(idx, dtype=np.int64) for key, idx in self.cells.items()}
+
+    def query(self, points):
+        """
+        points: [M, 2] (x, y)
+        return: [M] index of the first rectangle containing each point, or -1
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        result = np.full(len(points), -1, dtype=np.int64)
+        if len(points) == 0 or (not self.cells and len(self.large) == 0):
+            return result
+        point_cells = ((points - self.origin) // self.cell_size).astype(np.int64)
+        keys, inverse = np.unique(point_cells, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        for k, (cx, cy) in enumerate(keys.tolist()):
+            candidates = self.cells.get((cx, cy))
+            if candidates is None:
+                continue
+            pidx = np.flatnonzero(inverse == k)
+            px = points[pidx, 0:1]
+            py = points[pidx, 1:2]
+            r = self.rects[candidates]
+            inside = (r[:, 0] <= px) & (px <= r[:, 2]) & (r[:, 1] <= py) & (py <= r[:, 3])
+            hit = inside.any(axis=1)
+            # candidates are ascending, so argmax picks the lowest matching index
+            result[pidx[hit]] = candidates[inside.argmax(axis=1)[hit]]
+        if len(self.large) > 0:
+            px = points[:, 0:1]
+            py = points[:, 1:2]
+            r = self.rects[self.large]
+            inside = (r[:, 0] <= px) & (px <= r[:, 2]) & (r[:, 1] <= py) & (py <= r[:, 3])
+            hit = inside.any(axis=1)
+            large_first = self.large[inside.argmax(axis=1)]
+            # keep the lower index where both a gridded and a large rectangle match
+            take = hit & ((result < 0) | (large_first < result))
+            result[take] = large_first[take]
+        return result
+
+
 def get_relationship_rect(res_bbox, tb_polygons, classes, use_block_ad: bool = True, score_thr: float = 0.1):
-    #import cv2
     tb_cls_id = classes.index('text_block')
     ba_cls_id = classes.index('block_ad')
     table_cls_id = classes.index('block_table')
-    tb_info = [[] for i in range(len(tb_polygons))]
+    tb_info = [[] if poly is not None else None for poly in tb_polygons]
     independ_lines = []
     table_info=[[] for i in range(len(res_bbox[table_cls_id]))]
     ad_info = [[] for i in range(len(res_bbox[ba_cls_id]))]
+
+    # Line centers, in the order the lines are assigned. The text_block test
+    # floors the float center, the block tests use the truncated corners
+    # (see is_in_block_ad); they differ for non-integer boxes.
+    line_refs = []
+    tb_centers = []
+    centers = []
     for c in range(len(classes)):
         cls = classes[c]
         if not cls.startswith('line_'):
             continue
         for j, line in enumerate(res_bbox[c]):
-            
             if float(line[4]) < score_thr:
                 continue
-            in_any_block = False
-            # elems belonging to text_block
-            for i, poly in enumerate(tb_polygons):
-                if tb_polygons[i] is None:
-                    tb_info[i] = None
-                    continue
-                cx, cy = (line[0]+line[2])//2, (line[1]+line[3])//2
-                poly=np.array([p[0] for p in poly])
-                #print(poly)
-                #if cv2.pointPolygonTest(poly, (int(cx), int(cy)), False) >= 0:
-                if point_in_polygon((int(cx), int(cy)),poly,False)>=0:
-                    tb_info[i].append([c, j])
-                    in_any_block = True
-                    break
-            # elems belonging to ad_block
-            if not in_any_block:
-                for i, block_ad in enumerate(res_bbox[ba_cls_id]):
-                    if is_in_block_ad(block_ad, line):
-                        ad_info[i].append([c, j])
-                        in_any_block = True
-                        break
-            if not in_any_block:
-                for i, block_table in enumerate(res_bbox[table_cls_id]):
-                    if is_in_block_ad(block_table, line):
-                        table_info[i].append([c, j])
-                        in_any_block = True
-                        break
+            line_refs.append([c, j])
+            tb_centers.append((int((line[0]+line[2])//2), int((line[1]+line[3])//2)))
+            centers.append(((int(line[0])+int(line[2]))//2, (int(line[1])+int(line[3]))//2))
+    if len(line_refs) == 0:
+        return tb_info, ad_info, table_info, independ_lines
+
+    # elems belonging to text_block (a rect polygon contains its boundary, cf. point_in_polygon >= 0)
+    tb_ids = [i for i, poly in enumerate(tb_polygons) if poly is not None]
+    tb_rects = []
+    for i in tb_ids:
+        pts = np.asarray(tb_polygons[i]).reshape(-1, 2)
+        tb_rects.append([pts[:, 0].min(), pts[:, 1].min(), pts[:, 0].max(), pts[:, 1].max()])
+    tb_hit = RectIndex(tb_rects).query(tb_centers)
+    # elems belonging to ad_block, then to table_block (see is_in_block_ad)
+    ad_hit = RectIndex([b[:4] for b in res_bbox[ba_cls_id]]).query(centers)
+    table_hit = RectIndex([b[:4] for b in res_bbox[table_cls_id]]).query(centers)
+
+    for k, ref in enumerate(line_refs):
+        if tb_hit[k] >= 0:
+            tb_info[tb_ids[tb_hit[k]]].append(ref)
+        elif ad_hit[k] >= 0:
+            ad_info[ad_hit[k]].append(ref)
+        elif table_hit[k] >= 0:
+            table_info[table_hit[k]].append(ref)
+        else:
             # Line elements not belonging to any text_block or ad_block
-            if not in_any_block:
-                independ_lines.append([c, j])
+            independ_lines.append(ref)
     return tb_info, ad_info,table_info, independ_lines
 
 def refine_tb_relationship(tb_polygons, tb_info, classes, margin: int = 50):
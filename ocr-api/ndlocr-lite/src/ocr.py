@@ -1,5 +1,3 @@
-import sys
-sys.setrecursionlimit(5000)
 import os
 import numpy as np
 from PIL import Image
@@ -16,6 +14,7 @@ import json
 import glob
 from reading_order.xy_cut.eval import eval_xml
 from ndl_parser import convert_to_xml_string3
+from pipeline import StagedPipeline
 
 class RecogLine:
     def __init__(self,npimg:np.ndarray,idx:int,pred_char_cnt:int,pred_str:str=""):
@@ -26,7 +25,11 @@ class RecogLine:
     def __lt__(self, other):  
         return self.idx < other.idx
 
-def process_cascade(alllineobj,recognizer30,recognizer50,recognizer100,is_cascade=True):
+def process_cascade(alllineobj,recognizer30,recognizer50,recognizer100,is_cascade=True,batched=False):
+    """
+    batched=True: 各段をread_batchで呼び出し元スレッドのみで認識する
+    (プロセス並列で実行する場合にスレッドを増やさないため)
+    """
     targetdflist30=[]
     targetdflist50=[]
     targetdflist100=[]
@@ -38,11 +41,16 @@ def process_cascade(alllineobj,recognizer30,recognizer50,recognizer100,is_cascad
         else:
             targetdflist100.append(lineobj)
     targetdflistall=[]
-    with ThreadPoolExecutor(thread_name_prefix="thread") as executor:
+    executor=None if batched else ThreadPoolExecutor(thread_name_prefix="thread")
+    def readlines(recognizer,lineobjs):
+        imgs=[t.npimg for t in lineobjs]
+        if executor is None:
+            return recognizer.read_batch(imgs)
+        return list(executor.map(recognizer.read, imgs))
+    try:
         resultlines30,resultlines50,resultlines100=[],[],[]
         if len(targetdflist30)>0:
-            resultlines30 = executor.map(recognizer30.read, [t.npimg for t in targetdflist30])
-            resultlines30 = list(resultlines30)
+            resultlines30 = readlines(recognizer30, targetdflist30)
         for i in range(len(targetdflist30)):
             pred_str=resultlines30[i]
             lineobj=targetdflist30[i]
@@ -52,8 +60,7 @@ def process_cascade(alllineobj,recognizer30,recognizer50,recognizer100,is_cascad
                 lineobj.pred_str=pred_str
                 targetdflistall.append(lineobj)
         if len(targetdflist50)>0:
-            resultlines50 = executor.map(recognizer50.read, [t.npimg for t in targetdflist50])
-            resultlines50 = list(resultlines50)
+            resultlines50 = readlines(recognizer50, targetdflist50)
         for i in range(len(targetdflist50)):
             pred_str=resultlines50[i]
             lineobj=targetdflist50[i]
@@ -63,8 +70,7 @@ def process_cascade(alllineobj,recognizer30,recognizer50,recognizer100,is_cascad
                 lineobj.pred_str=pred_str
                 targetdflistall.append(lineobj)
         if len(targetdflist100)>0:
-            resultlines100 = executor.map(recognizer100.read, [t.npimg for t in targetdflist100])
-            resultlines100 = list(resultlines100)
+            resultlines100 = readlines(recognizer100, targetdflist100)
         for i in range(len(targetdflist100)):
             pred_str=resultlines100[i]
             lineobj=targetdflist100[i]
@@ -72,9 +78,12 @@ def process_cascade(alllineobj,recognizer30,recognizer50,recognizer100,is_cascad
             targetdflistall.append(lineobj)                    
         targetdflistall=sorted(targetdflistall)
         resultlinesall=[t.pred_str for t in targetdflistall]
+    finally:
+        if executor is not None:
+            executor.shutdown()
     return resultlinesall
 
-def get_detector(args):
+def get_detector(args,intra_op_num_threads:int=0):
     weights_path = args.det_weights
     classes_path = args.det_classes
     assert os.path.isfile(weights_path), f"There's no weight file with name {weights_path}"
@@ -84,9 +93,10 @@ def get_detector(args):
                       score_threshold=args.det_score_threshold,
                       conf_threshold=args.det_conf_threshold,
                       iou_threshold=args.det_iou_threshold,
-                      device=args.device)
+                      device=args.device,
+                      intra_op_num_threads=intra_op_num_threads)
     return detector
-def get_recognizer(args,weights_path=None):
+def get_recognizer(args,weights_path=None,intra_op_num_threads:int=1):
     if weights_path is None:
         weights_path = args.rec_weights
     classes_path = args.rec_classes
@@ -99,7 +109,7 @@ def get_recognizer(args,weights_path=None):
         charobj=safe_load(f)
     charlist=list(charobj["model"]["charset_train"])
     
-    recognizer = PARSEQ(model_path=weights_path,charlist=charlist,device=args.device)
+    recognizer = PARSEQ(model_path=weights_path,charlist=charlist,device=args.device,intra_op_num_threads=intra_op_num_threads)
     return recognizer
 
 
@@ -134,6 +144,93 @@ def process_detector(detector,inputname:str,npimage:np.ndarray,outputpath:str,is
         pil_image.save(output_path)
     return detections,classeslist
 
+def layout_page(imgname:str,img:np.ndarray,detections,classeslist):
+    img_h,img_w=img.shape[:2]
+    resultobj=[dict(),dict()]
+    resultobj[0][0]=list()
+    for i in range(17):
+        resultobj[1][i]=[]
+    for det in detections:
+        xmin,ymin,xmax,ymax=det["box"]
+        conf=det["confidence"]
+        if det["class_index"]==0:
+            resultobj[0][0].append([xmin,ymin,xmax,ymax])
+        resultobj[1][det["class_index"]].append([xmin,ymin,xmax,ymax,conf])
+    xmlstr=convert_to_xml_string3(img_w, img_h, imgname, classeslist, resultobj)
+    xmlstr="<OCRDATASET>"+xmlstr+"</OCRDATASET>"
+    #print(xmlstr)
+    root = ET.fromstring(xmlstr)
+    eval_xml(root, logger=None)
+    alllineobj = []
+    tatelinecnt=0
+    alllinecnt=0
+
+    for idx, lineobj in enumerate(root.findall(".//LINE")):
+        xmin = int(lineobj.get("X"))
+        ymin = int(lineobj.get("Y"))
+        line_w = int(lineobj.get("WIDTH"))
+        line_h = int(lineobj.get("HEIGHT"))
+        try:
+            pred_char_cnt = float(lineobj.get("PRED_CHAR_CNT"))
+        except:
+            pred_char_cnt = 100.0
+        
+        if line_h > line_w:
+            tatelinecnt += 1
+        alllinecnt += 1
+        # 部分画像の切り出し
+        lineimg = img[ymin:ymin+line_h, xmin:xmin+line_w, :]
+        linerecogobj = RecogLine(lineimg, idx, pred_char_cnt)
+        alllineobj.append(linerecogobj)
+    return root,alllineobj,tatelinecnt,alllinecnt
+
+def save_results(outputdir:str,inputpath:str,img_w:int,img_h:int,root,resultlinesall,tatelinecnt:int,alllinecnt:int):
+    """
+    XML/JSON/TXTを書き出し、書き出したファイルのパスを返す
+    """
+    allxmlstr="<OCRDATASET>\n"
+    alltextlist=[]
+    resjsonarray=[]
+    alltextlist.append("\n".join(resultlinesall))
+    for idx,lineobj in enumerate(root.findall(".//LINE")):
+        lineobj.set("STRING",resultlinesall[idx])
+        xmin=int(lineobj.get("X"))
+        ymin=int(lineobj.get("Y"))
+        line_w=int(lineobj.get("WIDTH"))
+        line_h=int(lineobj.get("HEIGHT"))
+        try:
+            conf=float(lineobj.get("CONF"))
+        except:
+            conf=0
+        jsonobj={"boundingBox": [[xmin,ymin],[xmin,ymin+line_h],[xmin+line_w,ymin],[xmin+line_w,ymin+line_h]],
+            "id": idx,"isVertical": "true","text": resultlinesall[idx],"isTextline": "true","confidence": conf}
+        resjsonarray.append(jsonobj)
+    allxmlstr+=(ET.tostring(root.find("PAGE"), encoding='unicode')+"\n")
+    allxmlstr+="</OCRDATASET>"
+    if alllinecnt>0 and tatelinecnt/alllinecnt>0.5:
+        alltextlist=alltextlist[::-1]
+    stem=os.path.basename(inputpath).split(".")[0]
+    xmlpath=os.path.join(outputdir,stem+".xml")
+    jsonpath=os.path.join(outputdir,stem+".json")
+    txtpath=os.path.join(outputdir,stem+".txt")
+    with open(xmlpath,"w",encoding="utf-8") as wf:
+        wf.write(allxmlstr)
+    with open(jsonpath,"w",encoding="utf-8") as wf:
+        alljsonobj={
+            "contents":[resjsonarray],
+            "imginfo": {
+                "img_width": img_w,
+                "img_height": img_h,
+                "img_path":inputpath,
+                "img_name":os.path.basename(inputpath)
+            }
+        }
+        alljsonstr=json.dumps(alljsonobj,ensure_ascii=False,indent=2)
+        wf.write(alljsonstr)
+    with open(txtpath,"w",encoding="utf-8") as wtf:
+        wtf.write("\n".join(alltextlist))
+    return [xmlpath,jsonpath,txtpath]
+
 def process(args):
     rawinputpathlist=[]
     inputpathlist=[]
@@ -153,99 +250,56 @@ def process(args):
     if not os.path.exists(args.output):
         print("Output Directory is not found.")
         return
+    if args.manifest is not None:
+        # プロセス並列・再開可能なバッチ処理
+        import batch_runner
+        batch_runner.run(args,inputpathlist)
+        return
     
+    # モデルは一度だけ読み込み、全画像で使い回す
+    print("[INFO] Intialize Model")
+    detector=get_detector(args)
     recognizer100=get_recognizer(args=args)
     recognizer30=get_recognizer(args=args,weights_path=args.rec_weights30)
     recognizer50=get_recognizer(args=args,weights_path=args.rec_weights50)
-    tatelinecnt=0
-    alllinecnt=0
-    for inputpath in inputpathlist:
-        ext=inputpath.split(".")[-1]
+
+    # 各画像を デコード → 検出 → レイアウト/読み順 → 認識・出力 の各段に流し、
+    # 画像N+1の検出と画像Nの認識を並行させる
+    def decode_stage(inputpath):
         pil_image = Image.open(inputpath).convert('RGB')
         img = np.array(pil_image)
-        start = time.time()
-        allxmlstr="<OCRDATASET>\n"
-        alltextlist=[]
-        resjsonarray=[]
+        return inputpath,img,time.time()
+
+    def detect_stage(job):
+        inputpath,img,start=job
         imgname=os.path.basename(inputpath)
-        img_h,img_w=img.shape[:2]
-        detections,classeslist=inference_on_detector(args=args,inputname=imgname,npimage=img,outputpath=args.output,issaveimg=args.viz)
-        e1=time.time()
-        resultobj=[dict(),dict()]
-        resultobj[0][0]=list()
-        for i in range(17):
-            resultobj[1][i]=[]
-        for det in detections:
-            xmin,ymin,xmax,ymax=det["box"]
-            conf=det["confidence"]
-            if det["class_index"]==0:
-                resultobj[0][0].append([xmin,ymin,xmax,ymax])
-            resultobj[1][det["class_index"]].append([xmin,ymin,xmax,ymax,conf])
-        xmlstr=convert_to_xml_string3(img_w, img_h, imgname, classeslist, resultobj)
-        xmlstr="<OCRDATASET>"+xmlstr+"</OCRDATASET>"
-        #print(xmlstr)
-        root = ET.fromstring(xmlstr)
-        eval_xml(root, logger=None)
-        alllineobj = []
-        alltextlist = []
+        detections,classeslist=process_detector(detector,inputname=imgname,npimage=img,outputpath=args.output,issaveimg=args.viz)
+        return inputpath,img,start,detections,classeslist
 
-        for idx, lineobj in enumerate(root.findall(".//LINE")):
-            xmin = int(lineobj.get("X"))
-            ymin = int(lineobj.get("Y"))
-            line_w = int(lineobj.get("WIDTH"))
-            line_h = int(lineobj.get("HEIGHT"))
-            try:
-                pred_char_cnt = float(lineobj.get("PRED_CHAR_CNT"))
-            except:
-                pred_char_cnt = 100.0
-            
-            if line_h > line_w:
-                tatelinecnt += 1
-            alllinecnt += 1
-            # 部分画像の切り出し
-            lineimg = img[ymin:ymin+line_h, xmin:xmin+line_w, :]
-            linerecogobj = RecogLine(lineimg, idx, pred_char_cnt)
-            alllineobj.append(linerecogobj)
+    def layout_stage(job):
+        inputpath,img,start,detections,classeslist=job
+        img_h,img_w=img.shape[:2]
+        root,alllineobj,tatelinecnt,alllinecnt=layout_page(os.path.basename(inputpath),img,detections,classeslist)
+        return inputpath,img_w,img_h,start,root,alllineobj,tatelinecnt,alllinecnt
 
+    def recognize_stage(job):
+        inputpath,img_w,img_h,start,root,alllineobj,tatelinecnt,alllinecnt=job
         # 認識プロセス
         resultlinesall = process_cascade(
             alllineobj, recognizer30, recognizer50, recognizer100, is_cascade=True
         )
-        alltextlist.append("\n".join(resultlinesall))
-        for idx,lineobj in enumerate(root.findall(".//LINE")):
-            lineobj.set("STRING",resultlinesall[idx])
-            xmin=int(lineobj.get("X"))
-            ymin=int(lineobj.get("Y"))
-            line_w=int(lineobj.get("WIDTH"))
-            line_h=int(lineobj.get("HEIGHT"))
-            try:
-                conf=float(lineobj.get("CONF"))
-            except:
-                conf=0
-            jsonobj={"boundingBox": [[xmin,ymin],[xmin,ymin+line_h],[xmin+line_w,ymin],[xmin+line_w,ymin+line_h]],
-                "id": idx,"isVertical": "true","text": resultlinesall[idx],"isTextline": "true","confidence": conf}
-            resjsonarray.append(jsonobj)
-        allxmlstr+=(ET.tostring(root.find("PAGE"), encoding='unicode')+"\n")
-        allxmlstr+="</OCRDATASET>"
-        if tatelinecnt/alllinecnt>0.5:
-            alltextlist=alltextlist[::-1]
-        with open(os.path.join(args.output,os.path.basename(inputpath).split(".")[0]+".xml"),"w",encoding="utf-8") as wf:
-            wf.write(allxmlstr)
-        with open(os.path.join(args.output,os.path.basename(inputpath).split(".")[0]+".json"),"w",encoding="utf-8") as wf:
-            alljsonobj={
-                "contents":[resjsonarray],
-                "imginfo": {
-                    "img_width": img_w,
-                    "img_height": img_h,
-                    "img_path":inputpath,
-                    "img_name":os.path.basename(inputpath)
-                }
-            }
-            alljsonstr=json.dumps(alljsonobj,ensure_ascii=False,indent=2)
-            wf.write(alljsonstr)
-        with open(os.path.join(args.output,os.path.basename(inputpath).split(".")[0]+".txt"),"w",encoding="utf-8") as wtf:
-            wtf.write("\n".join(alltextlist))
+        # 縦書き判定はバッチ処理(--manifest)と同じくページ単位の行数で行う
+        save_results(args.output,inputpath,img_w,img_h,root,resultlinesall,tatelinecnt,alllinecnt)
         print("Total calculation time (Detection + Recognition):",time.time()-start)
+        return inputpath
+
+    pipeline=StagedPipeline([decode_stage,detect_stage,layout_stage,recognize_stage],maxsize=args.queue_size,name="ocr")
+    batch_start=time.time()
+    numimages=0
+    for _ in pipeline.run(inputpathlist):
+        numimages+=1
+    elapsed=time.time()-batch_start
+    print(f"[INFO] Processed {numimages} images in {elapsed:.2f} s ({numimages/max(elapsed,1e-9):.2f} images/s)")
 
 def main():
     import argparse
@@ -268,6 +322,9 @@ def main():
     parser.add_argument("--rec-weights", type=str, required=False, help="Path to parseq-tiny onnx file", default=str(base_dir / "model" / "parseq-ndl-16x768-100-tiny-165epoch-tegaki2.onnx"))
     parser.add_argument("--rec-classes", type=str, required=False, help="Path to list of class in yaml file", default=str(base_dir / "config" / "NDLmoji.yaml"))
     parser.add_argument("--device", type=str, required=False, help="Device use (cpu or cuda)", choices=["cpu", "cuda"], default="cpu")
+    parser.add_argument("--queue-size", type=int, required=False, help="Number of images buffered between pipeline stages", default=2)
+    parser.add_argument("--manifest", type=str, required=False, help="Path to SQLite manifest; enables the parallel, resumable batch runner", default=None)
+    parser.add_argument("--workers", type=int, required=False, help="Number of worker processes for the batch runner (default: number of CPUs)", default=None)
     args = parser.parse_args()
     process(args)
 
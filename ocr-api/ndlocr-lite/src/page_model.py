@@ -0,0 +1,298 @@
+import os
+import xml.etree.ElementTree as ET
+from typing import List
+
+import numpy as np
+
+from ndl_parser import (get_relationship_rect, make_bbox_from_poly, name_to_org_name,
+                        refine_tb_relationship, textblock_to_rect)
+from reading_order.xy_cut.eval import eval_xml
+
+
+# Line records. CONF / PRED_CHAR_CNT keep the 3-decimal precision of the XML
+# attributes so reading order and cascade routing see the same values.
+LINE_DTYPE = np.dtype([
+    ("x", np.int32),
+    ("y", np.int32),
+    ("width", np.int32),
+    ("height", np.int32),
+    ("conf", np.float64),
+    ("pred_char_cnt", np.float64),
+    ("category", np.int16),   # class id of the line (line_main for text block fallbacks)
+    ("block", np.int32),      # index into Page.blocks, -1 when directly under PAGE
+    ("scored", np.bool_),     # False for fallback lines written without CONF/PRED_CHAR_CNT
+])
+
+BLOCK_TEXTBLOCK = 0
+BLOCK_BLOCK = 1
+
+BLOCK_DTYPE = np.dtype([
+    ("kind", np.int8),        # BLOCK_TEXTBLOCK or BLOCK_BLOCK
+    ("category", np.int16),   # class id of the block
+    ("x", np.int32),
+    ("y", np.int32),
+    ("width", np.int32),
+    ("height", np.int32),
+    ("conf", np.float64),
+])
+
+
+def _round3(v) -> float:
+    return float(f"{float(v):0.3f}")
+
+
+class Line:
+    """
+    Lightweight view of one line record of a Page.
+    """
+    __slots__ = ("page", "index")
+
+    def __init__(self, page, index: int):
+        self.page = page
+        self.index = index
+
+    def _get(self, field):
+        return self.page.lines[field][self.index].item()
+
+    x = property(lambda self: self._get("x"))
+    y = property(lambda self: self._get("y"))
+    width = property(lambda self: self._get("width"))
+    height = property(lambda self: self._get("height"))
+    conf = property(lambda self: self._get("conf"))
+    pred_char_cnt = property(lambda self: self._get("pred_char_cnt"))
+
+    @property
+    def type(self) -> str:
+        return self.page.classes[self._get("category")]
+
+    @property
+    def is_vertical(self) -> bool:
+        return self.height > self.width
+
+    def __repr__(self):
+        return f"Line({self.type}, x={self.x}, y={self.y}, w={self.width}, h={self.height})"
+
+
+class Page:
+    """
+    Array-backed layout of one page: line and block records plus the reading
+    order. XML is only produced on request (`to_element` / `to_xml`).
+
+    lines : structured array of LINE_DTYPE, in layout (document) order
+    blocks: structured array of BLOCK_DTYPE
+    order : indices into `lines` in reading order; lines dropped as duplicates
+            by the reading order step are not included
+    """
+    __slots__ = ("image_name", "width", "height", "classes", "lines", "blocks",
+                 "polygons", "order", "_items", "_tree")
+
+    def __init__(self, image_name: str, width: int, height: int, classes: List[str],
+                 lines: np.ndarray, blocks: np.ndarray, polygons: dict, items: list):
+        self.image_name = image_name
+        self.width = width
+        self.height = height
+        self.classes = classes
+        self.lines = lines
+        self.blocks = blocks
+        self.polygons = polygons      # block index -> [K, 2] points of TEXTBLOCK shapes
+        self.order = np.arange(len(lines))
+        self._items = items           # document order: ("line", i) / ("block", b, [line ids])
+        self._tree = None
+
+    def __len__(self):
+        return len(self.order)
+
+    def __iter__(self):
+        for i in self.order.tolist():
+            yield Line(self, i)
+
+    def ordered_lines(self) -> np.ndarray:
+        return self.lines[self.order]
+
+    # ------------------------------------------------------------------
+    # Reading order
+    # ------------------------------------------------------------------
+    def apply_reading_order(self, time_keeper=None) -> None:
+        """
+        Run the xy-cut reading order on an element tree built straight from
+        the records, then read the resulting line order back as indices.
+        `time_keeper` receives the timings of the xy-cut and sorting steps.
+        """
+        root = ET.Element("OCRDATASET")
+        page_elem, line_elems = self._build_tree()
+        root.append(page_elem)
+        eval_xml(root, time_keeper=time_keeper, logger=None)
+        index_of = {id(elem): i for i, elem in enumerate(line_elems)}
+        self.order = np.array([index_of[id(elem)] for elem in page_elem.iter("LINE")], dtype=np.int64)
+        self._tree = page_elem
+
+    # ------------------------------------------------------------------
+    # XML output
+    # ------------------------------------------------------------------
+    def to_element(self, texts: List[str] = None) -> ET.Element:
+        """
+        PAGE element in reading order (after `apply_reading_order`). `texts`
+        are written as STRING attributes, one per line of `order`.
+        """
+        if self._tree is None:
+            self._tree, _ = self._build_tree()
+        if texts is not None:
+            for elem, text in zip(self._tree.iter("LINE"), texts):
+                elem.set("STRING", text)
+        return self._tree
+
+    def to_xml(self, texts: List[str] = None) -> str:
+        return ET.tostring(self.to_element(texts), encoding="unicode")
+
+    def _line_element(self, i: int) -> ET.Element:
+        rec = self.lines[i]
+        elem = ET.Element("LINE")
+        elem.set("TYPE", name_to_org_name(self.classes[rec["category"]]))
+        elem.set("X", str(rec["x"]))
+        elem.set("Y", str(rec["y"]))
+        elem.set("WIDTH", str(rec["width"]))
+        elem.set("HEIGHT", str(rec["height"]))
+        if rec["scored"]:
+            elem.set("CONF", f"{rec['conf']:0.3f}")
+            elem.set("PRED_CHAR_CNT", f"{rec['pred_char_cnt']:0.3f}")
+        return elem
+
+    def _block_element(self, b: int) -> ET.Element:
+        rec = self.blocks[b]
+        if rec["kind"] == BLOCK_TEXTBLOCK:
+            elem = ET.Element("TEXTBLOCK")
+            elem.set("CONF", f"{rec['conf']:0.3f}")
+            shape = ET.SubElement(elem, "SHAPE")
+            points = ",".join(str(int(v)) for v in self.polygons[b].reshape(-1))
+            ET.SubElement(shape, "POLYGON").set("POINTS", points)
+            return elem
+        elem = ET.Element("BLOCK")
+        elem.set("TYPE", name_to_org_name(self.classes[rec["category"]]))
+        elem.set("X", str(rec["x"]))
+        elem.set("Y", str(rec["y"]))
+        elem.set("WIDTH", str(rec["width"]))
+        elem.set("HEIGHT", str(rec["height"]))
+        elem.set("CONF", f"{rec['conf']:0.3f}")
+        return elem
+
+    def _build_tree(self):
+        page_elem = ET.Element("PAGE")
+        page_elem.set("IMAGENAME", self.image_name)
+        page_elem.set("WIDTH", str(self.width))
+        page_elem.set("HEIGHT", str(self.height))
+        line_elems = [self._line_element(i) for i in range(len(self.lines))]
+        for item in self._items:
+            if item[0] == "line":
+                page_elem.append(line_elems[item[1]])
+            else:
+                block_elem = self._block_element(item[1])
+                for i in item[2]:
+                    block_elem.append(line_elems[i])
+                page_elem.append(block_elem)
+        return page_elem, line_elems
+
+
+def build_page(img_w, img_h, img_path, classes, result,
+               score_thr: float = 0.1,
+               min_bbox_size: int = 5,
+               use_block_ad: bool = True) -> Page:
+    """
+    Same layout assembly as `ndl_parser.convert_to_xml_string3`, producing
+    line/block records instead of an XML string.
+    result: [{0: text block boxes}, {class id: [[x1, y1, x2, y2, conf(, pred_char_cnt)], ...]}]
+    """
+    res_textblockes = result[0]
+    res_bbox = result[1]
+    tb_polygons = textblock_to_rect(classes, res_textblockes, min_bbox_size)
+    tb_info, ad_info, table_info, independ_lines = get_relationship_rect(res_bbox, tb_polygons, classes, score_thr=score_thr)
+    tb_info = refine_tb_relationship(tb_polygons, tb_info, classes, margin=50)
+    tb_cls_id = classes.index('text_block')
+    ba_cls_id = classes.index('block_ad')
+    table_cls_id = classes.index('block_table')
+    line_main_id = classes.index('line_main')
+
+    lines = []
+    blocks = []
+    polygons = {}
+    items = []
+
+    def add_line(x, y, w, h, category, block, conf=0.0, pred_char_cnt=100.0, scored=True):
+        lines.append((x, y, w, h, _round3(conf), _round3(pred_char_cnt), category, block, scored))
+        return len(lines) - 1
+
+    def add_detected_line(c, j, block):
+        line = res_bbox[c][j]
+        conf = float(line[4])
+        if conf < score_thr:
+            return None
+        pred_char_cnt = float(line[5]) if len(line) == 6 else 0
+        x, y = int(line[0]), int(line[1])
+        w, h = int(line[2] - line[0]), int(line[3] - line[1])
+        return add_line(x, y, w, h, c, block, conf, pred_char_cnt)
+
+    def add_block(kind, category, box, conf):
+        x, y = int(box[0]), int(box[1])
+        w, h = int(box[2] - box[0]), int(box[3] - box[1])
+        blocks.append((kind, category, x, y, w, h, _round3(conf)))
+        return len(blocks) - 1
+
+    # Tables and ad blocks containing lines
+    containers = [(table_cls_id, table_info)]
+    if use_block_ad:
+        containers.append((ba_cls_id, ad_info))
+    for cls_id, info in containers:
+        for i_b, box in enumerate(res_bbox[cls_id]):
+            if info[i_b] is None:
+                continue
+            b = add_block(BLOCK_BLOCK, cls_id, box, box[4])
+            children = [add_detected_line(c, j, b) for c, j in info[i_b] if c != tb_cls_id]
+            items.append(("block", b, [i for i in children if i is not None]))
+
+    # Text blocks and the lines inside them
+    for j in range(len(tb_info)):
+        if tb_info[j] is None or tb_polygons[j] is None:
+            continue
+        x, y, w, h = make_bbox_from_poly(tb_polygons[j])
+        b = len(blocks)
+        blocks.append((BLOCK_TEXTBLOCK, tb_cls_id, x, y, w, h, _round3(res_bbox[tb_cls_id][j][4])))
+        polygons[b] = np.asarray(tb_polygons[j]).reshape(-1, 2)
+        children = []
+        if len(tb_info[j]) == 0:
+            # create a line_main elem at least one
+            if w >= min_bbox_size and h >= min_bbox_size:
+                children.append(add_line(int(x), int(y), int(w), int(h), line_main_id, b, scored=False))
+        else:
+            for c_id, i in tb_info[j]:
+                if c_id == tb_cls_id:  # nested text block written as line_main
+                    line = res_bbox[c_id][i]
+                    conf = float(line[4])
+                    if conf < score_thr:
+                        continue
+                    pred_char_cnt = float(line[5]) if len(line) == 6 else 0
+                    lx, ly, lw, lh = make_bbox_from_poly(tb_polygons[i])
+                    if lw >= min_bbox_size and lh >= min_bbox_size:
+                        children.append(add_line(int(lx), int(ly), int(lw), int(lh), line_main_id, b, conf, pred_char_cnt))
+                else:
+                    k = add_detected_line(c_id, i, b)
+                    if k is not None:
+                        children.append(k)
+        items.append(("block", b, children))
+
+    # Lines outside text_block and block_ad
+    for c, j in independ_lines:
+        k = add_detected_line(c, j, -1)
+        if k is not None:
+            items.append(("line", k))
+
+    # Block elms other than block_table
+    for c in range(len(classes)):
+        cls = classes[c]
+        if cls.startswith('block_') and cls != 'block_table':
+            for box in res_bbox[c]:
+                if float(box[4]) < score_thr:
+                    continue
+                items.append(("block", add_block(BLOCK_BLOCK, c, box, box[4]), []))
+
+    return Page(os.path.basename(img_path), img_w, img_h, classes,
+                np.array(lines, dtype=LINE_DTYPE), np.array(blocks, dtype=BLOCK_DTYPE),
+                polygons, items)
@@ -5,14 +5,23 @@ import onnxruntime
 import numpy as np
 from typing import Tuple, List
 
+from session_cache import create_session
+
 class PARSEQ:
     def __init__(self,
                  model_path: str,
                  charlist: [str],
                  original_size: Tuple[int, int] = (384, 32),
-                 device: str = "CPU") -> None:
+                 device: str = "CPU",
+                 max_batch_size: int = 32,
+                 intra_op_num_threads: int = 1,
+                 cache_dir: str = None) -> None:
         self.model_path = model_path
         self.charlist = charlist
+        self.max_batch_size = max_batch_size
+        self.intra_op_num_threads = intra_op_num_threads
+        # Optimized graphs are kept here across starts (None = no cache)
+        self.cache_dir = cache_dir
 
         self.device = device
         self.image_width, self.image_height = original_size
@@ -26,11 +35,11 @@ class PARSEQ:
         #opt_session.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
         providers = ['CPUExecutionProvider']
         if self.device.casefold() == "cpu":
-            opt_session.intra_op_num_threads = 1
+            opt_session.intra_op_num_threads = self.intra_op_num_threads
             opt_session.inter_op_num_threads = 1
         elif self.device.casefold() == "cuda":
             providers = ['CUDAExecutionProvider','CPUExecutionProvider']
-        session = onnxruntime.InferenceSession(self.model_path,opt_session, providers=providers)
+        session = create_session(self.model_path, opt_session, providers, device=self.device, cache_dir=self.cache_dir)
         self.session = session
         self.model_inputs = self.session.get_inputs()
         self.input_names = [self.model_inputs[i].name for i in range(len(self.model_inputs))]
@@ -38,6 +47,10 @@ class PARSEQ:
         self.model_output = self.session.get_outputs()
         self.output_names = [self.model_output[i].name for i in range(len(self.model_output))]
         self.input_height, self.input_width = self.input_shape[2:]
+        # A symbolic batch dimension (e.g. "batch") means any N is accepted
+        self.static_batch_size = self.input_shape[0] if isinstance(self.input_shape[0], int) else None
+        if self.static_batch_size is not None:
+            self.max_batch_size = self.static_batch_size
 
     def postprocess(self, outputs):
         predictions = np.squeeze(outputs).T
@@ -60,17 +73,38 @@ class PARSEQ:
         input_tensor = input_image[np.newaxis, :, :, :].astype(np.float32)
         return input_tensor
     
+    def decode(self, outputs: np.ndarray) -> List[str]:
+        # Suppress ' and " to prevent dakuten/handakuten misrecognition
+        # token_id 3 = " (U+0022), token_id 8 = ' (U+0027)
+        outputs[:, :, [3, 8]] = -np.inf
+        indices = np.argmax(outputs, axis=2)
+        # token_id 0 = [E] (EOS); rows without EOS are read to the end
+        is_eos = indices == 0
+        end_pos = np.where(is_eos.any(axis=1), is_eos.argmax(axis=1), indices.shape[1])
+        return ["".join([self.charlist[i - 1] for i in row[:end]])
+                for row, end in zip(indices.tolist(), end_pos.tolist())]
+
     def read(self, img: np.ndarray) -> List:
         if img is None:
             return None
         input_tensor = self.preprocess(img)
         outputs = self.session.run(self.output_names, {self.input_names[0]: input_tensor})[0]
-        # Suppress ' and " to prevent dakuten/handakuten misrecognition
-        # token_id 3 = " (U+0022), token_id 8 = ' (U+0027)
-        outputs[:, :, [3, 8]] = -np.inf
-        indices = np.argmax(outputs, axis=2)[0]
-        stop_idx = np.where(indices == 0)[0]
-        end_pos = stop_idx[0] if stop_idx.size > 0 else len(indices)
-        resval = indices[:end_pos].tolist()
-        resstr = "".join([self.charlist[i - 1] for i in resval])
-        return resstr
\ No newline at end of file
+        return self.decode(outputs)[0]
+
+    def read_batch(self, imgs: List[np.ndarray]) -> List[str]:
+        """
+        Recognize several line images with as few session.run calls as possible.
+        Images are stacked into [N,3,H,W] tensors of at most `max_batch_size` rows.
+        """
+        resstrlist = []
+        for start in range(0, len(imgs), self.max_batch_size):
+            chunk = imgs[start:start + self.max_batch_size]
+            input_tensor = np.concatenate([self.preprocess(img) for img in chunk], axis=0)
+            num = input_tensor.shape[0]
+            if self.static_batch_size is not None and num < self.static_batch_size:
+                # Models exported with a fixed batch dimension need a full tensor
+                padding = np.zeros((self.static_batch_size - num,) + input_tensor.shape[1:], dtype=np.float32)
+                input_tensor = np.concatenate([input_tensor, padding], axis=0)
+            outputs = self.session.run(self.output_names, {self.input_names[0]: input_tensor})[0]
+            resstrlist.extend(self.decode(outputs[:num]))
+        return resstrlist
@@ -0,0 +1,101 @@
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator, List
+
+
+class _Failed:
+    """Carries an exception raised by a stage down to the consumer."""
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+_DONE = object()
+
+
+class StagedPipeline:
+    """
+    Run items through a fixed sequence of stage functions with one worker thread
+    per stage and bounded queues in between, so that e.g. detection of image N+1
+    overlaps with recognition of image N.
+
+    stages : list of callables, each taking the previous stage's output
+    maxsize: capacity of each inter-stage queue (bounds memory held in flight)
+    """
+
+    def __init__(self, stages: List[Callable[[Any], Any]], maxsize: int = 2, name: str = "stage"):
+        if len(stages) == 0:
+            raise ValueError("StagedPipeline needs at least one stage")
+        self.stages = stages
+        self.maxsize = maxsize
+        self.name = name
+
+    def run(self, items: Iterable[Any], return_exceptions: bool = False) -> Iterator[Any]:
+        """
+        Yield the final stage's output for every item, in input order.
+        An exception in any stage is re-raised here, or yielded in place of the
+        result when `return_exceptions` is True; later items keep flowing.
+        """
+        stop = threading.Event()
+        queues = [queue.Queue(maxsize=self.maxsize) for _ in range(len(self.stages) + 1)]
+
+        def put(q, obj):
+            while not stop.is_set():
+                try:
+                    q.put(obj, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(q):
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return _DONE
+
+        def feed():
+            try:
+                for item in items:
+                    if not put(queues[0], item):
+                        return
+            except BaseException as e:
+                put(queues[0], _Failed(e))
+            put(queues[0], _DONE)
+
+        def work(stage, q_in, q_out):
+            while True:
+                obj = get(q_in)
+                if obj is _DONE:
+                    put(q_out, _DONE)
+                    return
+                if not isinstance(obj, _Failed):
+                    try:
+                        obj = stage(obj)
+                    except BaseException as e:
+                        obj = _Failed(e)
+                if not put(q_out, obj):
+                    return
+
+        threads = [threading.Thread(target=feed, name=f"{self.name}-feed", daemon=True)]
+        for i, stage in enumerate(self.stages):
+            threads.append(threading.Thread(target=work, args=(stage, queues[i], queues[i + 1]),
+                                            name=f"{self.name}-{i}", daemon=True))
+        for t in threads:
+            t.start()
+        try:
+            while True:
+                obj = get(queues[-1])
+                if obj is _DONE:
+                    break
+                if isinstance(obj, _Failed):
+                    if not return_exceptions:
+                        raise obj.exc
+                    obj = obj.exc
+                yield obj
+        finally:
+            # Also reached when the consumer stops iterating early
+            stop.set()
+            for t in threads:
+                t.join()
@@ -0,0 +1,95 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+"""
+Compare the path enumeration and the banded DP solver used by smooth_order
+on synthetic pages.
+
+    python -m reading_order.order.benchmark_smooth_order --sizes 10,20,50,100,200,500
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from reading_order.order.smooth_order import find_minimum_banded_path, find_minimum_hamiltonian_path
+
+
+def make_page_weight(num, rng, width=2000, height=3000):
+    """
+    Edge weights of a synthetic vertical-text page: `num` lines in columns
+    from right to left, with jittered positions and slightly shuffled orders,
+    weighted like `smooth_order_page`.
+    """
+    per_col = max(1, int(np.sqrt(num)))
+    cols = np.arange(num) // per_col
+    rows = np.arange(num) % per_col
+    line_w = width / (num // per_col + 1)
+    x = width - (cols + 1) * line_w + rng.uniform(-5, 5, num)
+    y = rows * (height / per_col) + rng.uniform(-20, 20, num)
+    h = rng.uniform(0.3, 0.9, num) * height / per_col
+    orders = np.arange(num) + rng.normal(0, 0.7, num)
+    order_range = orders.max() - orders.min() if num > 1 else 1.0
+    diam = np.sqrt(width * width + height * height)
+    beg = np.stack([x + line_w / 2, y], axis=1)
+    end = np.stack([x + line_w / 2, y + h], axis=1)
+
+    def weight(i, j):
+        order_d = abs(orders[i] - orders[j]) / order_range
+        dist = np.sqrt(((beg[j] - end[i]) ** 2).sum())
+        return dist / diam + order_d
+    return weight
+
+
+def make_graph(num, weight, max_step):
+    import networkx as nx
+
+    graph = nx.DiGraph()
+    for i in range(num):
+        graph.add_node(i)
+    for step in range(1, max_step):
+        for i in range(num-step):
+            graph.add_edge(i, i+step, weight=weight(i, i+step))
+            graph.add_edge(i+step, i, weight=weight(i+step, i))
+    return graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark smooth_order path solvers")
+    parser.add_argument("--sizes", default="10,20,50,100,200,500")
+    parser.add_argument("--max-step", type=int, default=None,
+                        help="band width; default follows smooth_order (3 below 20 lines, else 2)")
+    parser.add_argument("--exhaustive-limit", type=int, default=20,
+                        help="skip path enumeration above this size when max_step is 3")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'lines':>6} {'step':>4} {'enumerate[ms]':>14} {'dp[ms]':>9} {'same':>5}")
+    for num in [int(s) for s in args.sizes.split(",")]:
+        max_step = args.max_step or (3 if num < 20 else 2)
+        t_enum = t_dp = 0.0
+        same = True
+        run_enum = max_step < 3 or num <= args.exhaustive_limit
+        for _ in range(args.repeat):
+            weight = make_page_weight(num, rng)
+            t0 = time.perf_counter()
+            dp_path, dp_weight = find_minimum_banded_path(num, weight, max_step)
+            t_dp += time.perf_counter() - t0
+            if run_enum:
+                t0 = time.perf_counter()
+                graph = make_graph(num, weight, max_step)
+                enum_path, enum_weight = find_minimum_hamiltonian_path(graph)
+                t_enum += time.perf_counter() - t0
+                same &= enum_path == dp_path and np.isclose(enum_weight, dp_weight)
+        enum_ms = f"{t_enum / args.repeat * 1000:14.2f}" if run_enum else f"{'-':>14}"
+        print(f"{num:>6} {max_step:>4} {enum_ms} {t_dp / args.repeat * 1000:9.2f} "
+              f"{str(same) if run_enum else '-':>5}")
+
+
+if __name__ == "__main__":
+    main()
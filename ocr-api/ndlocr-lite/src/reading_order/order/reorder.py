@@ -11,6 +11,7 @@ import functools
 from reading_order.utils.xml import ConstantNumberOfTags
 from reading_order.order.smooth_order import smooth_order
 from reading_order.order.warichu_block import GroupWarichu
+from reading_order.utils.time import TimeKeeper
 
 
 def check_iou(a, b):
@@ -149,7 +150,7 @@ def sort_lines_local(root):
     return root, median
 
 
-def sort_lines(root, smoothing=True):
+def sort_lines(root, smoothing=True, time_keeper=None):
     """
     An example of acceptable XML as input or intermediate states.
     <PAGE>                 - One or more PAGE tags should exist in a file.
@@ -205,7 +206,10 @@ def sort_lines(root, smoothing=True):
         if smoothing:
             smooth_order(root)
     """
-    with GroupWarichu(root):
-        traverse(root)
+    time_keeper = time_keeper or TimeKeeper()
+    with time_keeper.measure_time("block sorting"):
+        with GroupWarichu(root):
+            traverse(root)
     if smoothing:
-        smooth_order(root)
+        with time_keeper.measure_time("smoothing"):
+            smooth_order(root)
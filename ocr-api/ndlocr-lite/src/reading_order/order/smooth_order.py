@@ -4,14 +4,19 @@
 # https://creativecommons.org/licenses/by/4.0/
 
 
+import math
+
 import numpy as np
-import networkx as nx
 
 
 def find_minimum_hamiltonian_path(graph):
     """
     Return the minimum weight hamiltonian path in `graph`.
+    Enumerates every simple path, so it is exponential in the number of nodes;
+    kept as the reference for `find_minimum_banded_path`.
     """
+    import networkx as nx
+
     min_weight = 99999
     min_path = None
     num_nodes = len(graph.nodes())
@@ -24,6 +29,62 @@ def find_minimum_hamiltonian_path(graph):
     return min_path, min_weight
 
 
+def find_minimum_banded_path(num, weight, max_step=3):
+    """
+    Return the minimum weight hamiltonian path from node 0 to node `num`-1 of
+    a graph whose edges only join nodes less than `max_step` apart, in both
+    directions, with `weight(i, j)` as the weight of edge i -> j.
+
+    With max_step <= 3 such a path is a sequence of forward steps i -> i+1
+    and detours i -> i+2 -> i+1 -> i+3, so the optimum is found by dynamic
+    programming over the band in O(num) instead of enumerating paths.
+    Paths through NaN weights are rejected, as in
+    `find_minimum_hamiltonian_path`.
+    """
+    if max_step > 3:
+        import networkx as nx
+
+        graph = nx.DiGraph()
+        graph.add_nodes_from(range(num))
+        for step in range(1, max_step):
+            for i in range(num-step):
+                graph.add_edge(i, i+step, weight=weight(i, i+step))
+                graph.add_edge(i+step, i, weight=weight(i+step, i))
+        return find_minimum_hamiltonian_path(graph)
+    if num == 0:
+        return None, 99999
+
+    def w(i, j):
+        v = float(weight(i, j))
+        return math.inf if math.isnan(v) else v
+
+    # cost[i]: minimum weight from node i to the last node, all nodes < i visited
+    cost = [math.inf] * num
+    detour = [False] * num
+    cost[num-1] = 0.0
+    for i in range(num-2, -1, -1):
+        cost[i] = w(i, i+1) + cost[i+1]
+        if max_step == 3 and i+3 < num:
+            c = w(i, i+2) + w(i+2, i+1) + w(i+1, i+3) + cost[i+3]
+            # ties keep the forward step, which is enumerated first
+            if c < cost[i]:
+                cost[i], detour[i] = c, True
+
+    min_weight = cost[0]
+    if not min_weight < 99999:
+        return None, 99999
+    path = [0]
+    i = 0
+    while i < num-1:
+        if detour[i]:
+            path += [i+2, i+1, i+3]
+            i += 3
+        else:
+            path.append(i+1)
+            i += 1
+    return path, min_weight
+
+
 def smooth_order_page(page):
     w = float(page.get("WIDTH"))
     h = float(page.get("HEIGHT"))
@@ -69,8 +130,6 @@ def smooth_order_page(page):
             else:
                 unsorted.append(element)
 
-        # Build graph.
-        graph = nx.DiGraph()
         num = len(tobe_sorted)
         orders = [o for o, _, _, _ in tobe_sorted]
         if 0 < num:
@@ -84,20 +143,11 @@ def smooth_order_page(page):
                 x1, y1 = beg
                 dist = np.sqrt((x1-x0) ** 2 + (y1-y0) ** 2)
                 return dist / diam + order_d
-            for i in range(num):
-                graph.add_node(i)
             max_step = 3 if num < 20 else 2
-            for step in range(1, max_step):
-                for i in range(num-step):
-                    graph.add_edge(
-                        i, i+step, weight=calc_weight(i, i+step))
-                    graph.add_edge(
-                        i+step, i, weight=calc_weight(i+step, i))
-            if 0 < graph.number_of_nodes():
-                min_path, _ = find_minimum_hamiltonian_path(graph)
-                if min_path:
-                    page_or_block[:] = [tobe_sorted[i][-1]
-                                        for i in min_path] + unsorted
+            min_path, _ = find_minimum_banded_path(num, calc_weight, max_step)
+            if min_path:
+                page_or_block[:] = [tobe_sorted[i][-1]
+                                    for i in min_path] + unsorted
 
     traverse(page)
 
@@ -34,6 +34,9 @@ class TimeKeeper:
         return TimeMeasuredScope(self, key)
 
     def record(self, key, time):
+        if key not in self.times:
+            self.keys.append(key)
+            self.times[key] = list()
         self.times[key].append(time)
 
     def num(self, key):
@@ -48,6 +51,19 @@ class TimeKeeper:
     def median(self, key):
         return sorted(self.times[key])[self.num(key) // 2]
 
+    def to_dict(self):
+        """
+        {key: {"count", "total_ms", "max_ms"}} in the order keys were first measured
+        """
+        return {
+            key: {
+                "count": self.num(key),
+                "total_ms": self.total(key) * 1e3,
+                "max_ms": max(self.times[key]) * 1e3,
+            }
+            for key in self.keys if self.times[key]
+        }
+
     def print(self, logger=None):
         if not logger:
             from .logger import get_logger
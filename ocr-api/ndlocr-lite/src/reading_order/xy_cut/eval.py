@@ -30,10 +30,10 @@ def eval_xml(root, time_keeper=None, logger=None, plot_path=None, line_width_sca
             new_plot_path = plot_path.with_suffix(
                 ".%d.jpg" % i) if plot_path else None
             ranks = solve(lines, plot_path=new_plot_path,
-                          logger=logger, scale=line_width_scale)
+                          logger=logger, scale=line_width_scale, time_keeper=time_keeper)
             for line, rank in zip(page.findall(".//LINE"), ranks):
                 line.set("ORDER", str(rank))
-            sort_lines(page, smoothing=smoothing)
+            sort_lines(page, smoothing=smoothing, time_keeper=time_keeper)
             num += 1
     return num
 
@@ -0,0 +1,74 @@
+import functools
+import hashlib
+import os
+import threading
+import uuid
+from collections import defaultdict
+
+import onnxruntime
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _sha256_of_version(path: str, size: int, mtime_ns: int) -> str:
+    return file_sha256(path)
+
+
+def model_sha256(path: str) -> str:
+    """
+    file_sha256, computed once per file version in this process
+    """
+    st = os.stat(path)
+    return _sha256_of_version(os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+
+# One builder per cached graph; concurrent sessions of the same model wait for it
+_build_locks = defaultdict(threading.Lock)
+
+
+def cached_model_path(model_path: str, device: str, cache_dir: str) -> str:
+    """
+    Where the optimized graph of `model_path` is kept: keyed by the model hash,
+    the onnxruntime version and the device, so any change rebuilds it.
+    """
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    key = f"{model_sha256(model_path)[:16]}-ort{onnxruntime.__version__}-{device.casefold()}"
+    return os.path.join(cache_dir, f"{stem}.{key}.onnx")
+
+
+def create_session(model_path: str, opt_session, providers, device: str = "cpu", cache_dir: str = None):
+    """
+    InferenceSession for `model_path`, reusing a graph optimized by an earlier start.
+
+    Without `cache_dir` this is a plain InferenceSession. Otherwise the graph is
+    optimized once up to ORT_ENABLE_EXTENDED (the hardware independent level)
+    and saved in `cache_dir`; later sessions load the saved graph, so only the
+    layout optimizations of ORT_ENABLE_ALL are left to run at startup.
+    """
+    if not cache_dir:
+        return onnxruntime.InferenceSession(model_path, opt_session, providers=providers)
+    os.makedirs(cache_dir, exist_ok=True)
+    cached_path = cached_model_path(model_path, device, cache_dir)
+    with _build_locks[cached_path]:
+        if not os.path.isfile(cached_path):
+            save_options = onnxruntime.SessionOptions()
+            save_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+            # Unique name so other processes never read a half written graph
+            tmp_path = f"{cached_path}.{os.getpid()}-{uuid.uuid4().hex[:8]}.tmp"
+            save_options.optimized_model_filepath = tmp_path
+            try:
+                onnxruntime.InferenceSession(model_path, save_options, providers=providers)
+                os.replace(tmp_path, cached_path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                # Fall back to the original graph; the cache is only an optimization
+                return onnxruntime.InferenceSession(model_path, opt_session, providers=providers)
+    return onnxruntime.InferenceSession(cached_path, opt_session, providers=providers)
@@ -0,0 +1,80 @@
+"""The --manifest batch runner against the serial pipeline, with stand-in models."""
+
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import yaml
+from PIL import Image
+
+import batch_runner
+import ocr
+
+CLASSES = yaml.safe_load((Path(__file__).resolve().parent.parent / "src" / "config" / "ndl.yaml").read_text())["names"]
+LINE_MAIN = 1
+
+
+class _FakeDetector:
+    """Three tall lines on portrait pages, three wide lines on landscape ones."""
+
+    classes = CLASSES
+
+    def detect(self, img):
+        h, w = img.shape[:2]
+        if h > w:
+            boxes = [[20 + 60 * i, 20, 60 + 60 * i, h - 20] for i in range(3)]
+        else:
+            boxes = [[20, 20 + 50 * i, w - 20, 50 + 50 * i] for i in range(3)]
+        return [{"box": box, "confidence": 0.9, "class_index": LINE_MAIN} for box in boxes]
+
+
+class _FakeRecognizer:
+    max_batch_size = 4
+
+    def read(self, img):
+        h, w = img.shape[:2]
+        return f"{w}x{h}:{int(img.mean())}"
+
+    def read_batch(self, imgs):
+        return [self.read(img) for img in imgs]
+
+
+def _args(tmp_path, sourcedir, output, manifest=None):
+    weights = tmp_path / "weights.onnx"
+    weights.write_bytes(b"weights")
+    return argparse.Namespace(
+        sourcedir=str(sourcedir), sourceimg=None, output=str(output), viz=False,
+        det_weights=str(weights), det_classes=str(weights), det_score_threshold=0.2,
+        det_conf_threshold=0.25, det_iou_threshold=0.2, rec_weights30=str(weights),
+        rec_weights50=str(weights), rec_weights=str(weights), rec_classes=str(weights),
+        device="cpu", queue_size=2, manifest=manifest, workers=2 if manifest else None,
+    )
+
+
+def test_manifest_runner_matches_the_serial_pipeline(tmp_path, monkeypatch):
+    monkeypatch.setattr(ocr, "get_detector", lambda args, **kwargs: _FakeDetector())
+    monkeypatch.setattr(ocr, "get_recognizer", lambda args, **kwargs: _FakeRecognizer())
+    # Workers run as threads so they see the stand-in models
+    monkeypatch.setattr(batch_runner, "ProcessPoolExecutor", ThreadPoolExecutor)
+
+    sourcedir = tmp_path / "images"
+    sourcedir.mkdir()
+    rng = np.random.default_rng(0)
+    # Vertical and horizontal pages interleaved
+    for i, (h, w) in enumerate([(300, 220), (220, 300), (220, 300), (300, 220), (220, 300)]):
+        pixels = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(sourcedir / f"page{i}.png")
+
+    serial, parallel = tmp_path / "serial", tmp_path / "parallel"
+    serial.mkdir()
+    parallel.mkdir()
+    ocr.process(_args(tmp_path, sourcedir, serial))
+    ocr.process(_args(tmp_path, sourcedir, parallel, manifest=str(tmp_path / "manifest.db")))
+
+    names = sorted(os.listdir(serial))
+    assert len(names) == 15
+    assert sorted(os.listdir(parallel)) == names
+    for name in names:
+        assert (parallel / name).read_text(encoding="utf-8") == (serial / name).read_text(encoding="utf-8"), name
@@ -0,0 +1,117 @@
+"""Grid-indexed line-to-block assignment against brute-force scans."""
+
+import random
+from pathlib import Path
+
+import numpy as np
+import pytest
+import yaml
+
+from ndl_parser import RectIndex, get_relationship_rect, is_in_block_ad, point_in_polygon, textblock_to_rect
+
+CLASSES = list(
+    yaml.safe_load((Path(__file__).resolve().parent.parent / "src" / "config" / "ndl.yaml").read_text())[
+        "names"
+    ].values()
+)
+
+
+def _first_containing(rects, x, y):
+    for i, (x0, y0, x1, y1) in enumerate(rects):
+        if x0 <= x <= x1 and y0 <= y <= y1:
+            return i
+    return -1
+
+
+@pytest.mark.parametrize("max_cells", [1, 4, 64])
+def test_rect_index_matches_linear_scan(max_cells):
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        n = int(rng.integers(1, 40))
+        xy = rng.uniform(0, 1000, (n, 2))
+        # Mix small boxes with ones spanning far more than max_cells cells
+        wh = rng.uniform(0, rng.choice([20, 300, 1000]), (n, 2))
+        rects = np.concatenate([xy, xy + wh], axis=1)
+        points = rng.uniform(-50, 1100, (200, 2))
+        # Points exactly on rectangle edges count as inside
+        points[:n, 0] = rects[:, 2]
+        points[:n, 1] = rects[:, 1]
+        index = RectIndex(rects, max_cells=max_cells)
+        expected = [_first_containing(rects, x, y) for x, y in points]
+        assert index.query(points).tolist() == expected
+
+
+def test_rect_index_keeps_large_rects_off_the_grid():
+    index = RectIndex([[0, 0, 6, 6], [10, 10, 16, 16], [20, 20, 26, 26], [0, 0, 4000, 6000]])
+    assert index.large.tolist() == [3]
+    assert len(index.cells) < 100
+    assert index.query([[3, 3], [13, 13], [3000, 3000], [5000, 3000]]).tolist() == [0, 1, 3, -1]
+
+
+def _reference_relationship(res_bbox, tb_polygons, classes, score_thr=0.1):
+    """The per-line linear scan get_relationship_rect replaced."""
+    tb_cls_id = classes.index("text_block")
+    ba_cls_id = classes.index("block_ad")
+    table_cls_id = classes.index("block_table")
+    tb_info = [[] for _ in range(len(tb_polygons))]
+    independ_lines = []
+    table_info = [[] for _ in range(len(res_bbox[table_cls_id]))]
+    ad_info = [[] for _ in range(len(res_bbox[ba_cls_id]))]
+    for c, cls in enumerate(classes):
+        if not cls.startswith("line_"):
+            continue
+        for j, line in enumerate(res_bbox[c]):
+            if float(line[4]) < score_thr:
+                continue
+            in_any_block = False
+            for i, poly in enumerate(tb_polygons):
+                cx, cy = (line[0] + line[2]) // 2, (line[1] + line[3]) // 2
+                poly = np.array([p[0] for p in poly])
+                if point_in_polygon((int(cx), int(cy)), poly, False) >= 0:
+                    tb_info[i].append([c, j])
+                    in_any_block = True
+                    break
+            if not in_any_block:
+                for i, block_ad in enumerate(res_bbox[ba_cls_id]):
+                    if is_in_block_ad(block_ad, line):
+                        ad_info[i].append([c, j])
+                        in_any_block = True
+                        break
+            if not in_any_block:
+                for i, block_table in enumerate(res_bbox[table_cls_id]):
+                    if is_in_block_ad(block_table, line):
+                        table_info[i].append([c, j])
+                        in_any_block = True
+                        break
+            if not in_any_block:
+                independ_lines.append([c, j])
+    return tb_info, ad_info, table_info, independ_lines
+
+
+def _random_page(rng: random.Random):
+    res_bbox = {i: [] for i in range(len(CLASSES))}
+    blocks = []
+    for _ in range(rng.randint(0, 30)):
+        x, y = rng.randint(0, 2000), rng.randint(0, 3000)
+        w, h = rng.randint(0, 2000), rng.randint(0, 3000)
+        blocks.append([x, y, x + w, y + h])
+    for name in ("block_ad", "block_table"):
+        for _ in range(rng.randint(0, 4)):
+            x, y = rng.randint(0, 2000), rng.randint(0, 3000)
+            res_bbox[CLASSES.index(name)].append([x, y, x + rng.randint(-50, 600), y + rng.randint(0, 600), 0.5])
+    line_classes = [i for i, name in enumerate(CLASSES) if name.startswith("line_")]
+    for _ in range(rng.randint(0, 200)):
+        x, y = rng.randint(0, 2400), rng.randint(0, 3400)
+        # Float boxes: the text_block test floors the center, the block tests truncate the corners
+        w, h = rng.uniform(1, 300), rng.uniform(1, 80)
+        res_bbox[rng.choice(line_classes)].append([x + 0.5, y, x + w, y + h, rng.random(), 3.0])
+    return res_bbox, textblock_to_rect(CLASSES, {0: blocks})
+
+
+def test_relationship_matches_linear_scan():
+    rng = random.Random(0)
+    for _ in range(100):
+        res_bbox, tb_polygons = _random_page(rng)
+        assert get_relationship_rect(res_bbox, tb_polygons, CLASSES) == _reference_relationship(
+            res_bbox, tb_polygons, CLASSES
+        )
@@ -0,0 +1,43 @@
+"""find_minimum_banded_path against the exhaustive path enumeration."""
+
+import math
+import random
+
+import networkx as nx
+import pytest
+
+from reading_order.order.smooth_order import find_minimum_banded_path, find_minimum_hamiltonian_path
+
+
+def _band_graph(num, weight, max_step):
+    graph = nx.DiGraph()
+    graph.add_nodes_from(range(num))
+    for step in range(1, max_step):
+        for i in range(num - step):
+            graph.add_edge(i, i + step, weight=weight(i, i + step))
+            graph.add_edge(i + step, i, weight=weight(i + step, i))
+    return graph
+
+
+@pytest.mark.parametrize("max_step", [2, 3])
+def test_banded_path_matches_enumeration(max_step):
+    rng = random.Random(0)
+    for _ in range(300):
+        num = rng.randint(1, 9)
+        weights = {}
+        for i in range(num):
+            for j in range(num):
+                if i != j:
+                    # Some NaN edges, as smooth_order produces for lines without ORDER
+                    weights[i, j] = math.nan if rng.random() < 0.05 else rng.random()
+
+        def weight(i, j):
+            return weights[i, j]
+
+        expected = find_minimum_hamiltonian_path(_band_graph(num, weight, max_step))
+        path, total = find_minimum_banded_path(num, weight, max_step)
+        assert path == expected[0]
+        if path is None:
+            assert total == expected[1]
+        else:
+            assert total == pytest.approx(expected[1])
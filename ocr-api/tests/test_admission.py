@@ -0,0 +1,171 @@
+"""AdmissionController limits, AdmissionMiddleware and per-URL admission on /ocr/urls."""
+
+import asyncio
+
+import httpx
+import pytest
+
+from app import main
+from app.admission import AdmissionController, AdmissionMiddleware, AdmissionRejected, rejection_response
+
+
+async def _hold(controller: AdmissionController, nbytes: int, release: asyncio.Event) -> None:
+    async with controller.admit(nbytes):
+        await release.wait()
+
+
+def test_rejects_when_the_queue_is_full():
+    async def scenario():
+        controller = AdmissionController(max_active=1, max_queued=1, max_bytes=1 << 30)
+        release = asyncio.Event()
+        holders = [asyncio.create_task(_hold(controller, 1, release)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert controller.stats() == {"active": 1, "queued": 1, "inflight_bytes": 2, "rejected": 0}
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with controller.admit(1):
+                pass
+        release.set()
+        await asyncio.gather(*holders)
+        return controller, rejected.value
+
+    controller, e = asyncio.run(scenario())
+    assert e.reason == "queue_full"
+    # Two requests ahead, one slot, each held for the initial 1 s estimate
+    assert e.retry_after == 2
+    assert controller.stats() == {"active": 0, "queued": 0, "inflight_bytes": 0, "rejected": 1}
+
+
+def test_rejects_on_bytes_unless_nothing_else_is_in_flight():
+    async def scenario():
+        controller = AdmissionController(max_active=4, max_queued=4, max_bytes=100)
+        # Alone in the service: admitted however large
+        async with controller.admit(1000):
+            pass
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(controller, 60, release))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with controller.admit(50):
+                pass
+        async with controller.admit(40):
+            pass
+        release.set()
+        await holder
+        return rejected.value
+
+    assert asyncio.run(scenario()).reason == "bytes"
+
+
+def test_retry_after_is_capped():
+    async def scenario():
+        controller = AdmissionController(max_active=1, max_queued=0, max_bytes=1 << 30)
+        controller._hold_seconds = 500.0
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(controller, 1, release))
+        await asyncio.sleep(0)
+        try:
+            async with controller.admit(1):
+                pass
+        except AdmissionRejected as e:
+            return e
+        finally:
+            release.set()
+            await holder
+
+    e = asyncio.run(scenario())
+    assert e.retry_after == 60
+    response = rejection_response(e)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "60"
+
+
+async def _call(asgi_app, path: str, content_length: int) -> list[dict]:
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    headers = [(b"content-length", str(content_length).encode())]
+    scope = {"type": "http", "method": "POST", "path": path, "headers": headers}
+    await asgi_app(scope, receive, send)
+    return messages
+
+
+def test_middleware_releases_bytes_when_the_handler_raises():
+    controller = AdmissionController(max_active=1, max_queued=0, max_bytes=1 << 30)
+    charged = []
+
+    async def endpoint(scope, receive, send):
+        charged.append(controller.stats()["inflight_bytes"])
+        raise RuntimeError("handler failed")
+
+    middleware = AdmissionMiddleware(endpoint, controller, path_prefix="/ocr/", unknown_size=1 << 20)
+    with pytest.raises(RuntimeError):
+        asyncio.run(_call(middleware, "/ocr/image", 1234))
+    assert charged == [1234]
+    assert controller.stats() == {"active": 0, "queued": 0, "inflight_bytes": 0, "rejected": 0}
+
+
+def test_middleware_answers_rejections_with_429():
+    controller = AdmissionController(max_active=1, max_queued=0, max_bytes=1 << 30)
+
+    async def endpoint(scope, receive, send):
+        raise AssertionError("must not run")
+
+    middleware = AdmissionMiddleware(endpoint, controller, path_prefix="/ocr/", unknown_size=1 << 20)
+
+    async def scenario():
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(controller, 1, release))
+        await asyncio.sleep(0)
+        try:
+            return await _call(middleware, "/ocr/image", 10)
+        finally:
+            release.set()
+            await holder
+
+    start = asyncio.run(scenario())[0]
+    assert start["status"] == 429
+    assert (b"retry-after", b"1") in start["headers"]
+    assert controller.stats()["inflight_bytes"] == 0
+
+
+class _FakeFetcher:
+    def __init__(self, controller: AdmissionController) -> None:
+        self._controller = controller
+        self.charged: list[int] = []
+
+    async def fetch(self, url: str) -> bytes:
+        self.charged.append(self._controller.stats()["inflight_bytes"])
+        await asyncio.sleep(0.01)
+        return url.encode()
+
+
+def test_url_batches_admit_every_url(monkeypatch):
+    # Room for the bytes of two downloads at the size limit
+    controller = AdmissionController(max_active=1, max_queued=8, max_bytes=2 * main.MAX_FILE_SIZE)
+    fetcher = _FakeFetcher(controller)
+    monkeypatch.setattr(main, "admission", controller)
+    monkeypatch.setattr(main, "fetcher", fetcher)
+
+    async def predict(data, cancel=None):
+        return []
+
+    monkeypatch.setattr(main, "_predict", predict)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/ocr/urls", json={"urls": [f"http://img/{i}" for i in range(4)]})
+
+    resp = asyncio.run(scenario())
+    assert resp.status_code == 200
+    results = resp.json()["results"]
+    assert [r["error"] for r in results] == [None, None] + ["Server busy (bytes), retry later"] * 2
+    # Two URLs held the byte budget, so the other two were turned away;
+    # each download ran charged the size limit
+    assert fetcher.charged == [main.MAX_FILE_SIZE] * 2
+    assert controller.stats() == {"active": 0, "queued": 0, "inflight_bytes": 0, "rejected": 2}
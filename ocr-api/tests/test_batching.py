@@ -0,0 +1,114 @@
+"""DetectionBatcher with a stand-in detector."""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.batching import DetectionBatcher
+from app.ocr_engine import CancelToken, OCRCancelled
+
+
+class _FakeDetector:
+    classes = {0: "text"}
+    input_width = input_height = 64
+
+    def __init__(self, fail: bool = False, delay: float = 0.0) -> None:
+        self.batches: list[list[int]] = []
+        self.fail = fail
+        self.delay = delay
+
+    def detect_batch(self, imgs):
+        time.sleep(self.delay)
+        self.batches.append([int(img[0, 0]) for img in imgs])
+        if self.fail:
+            raise RuntimeError("detector failed")
+        return [[{"id": int(img[0, 0])}] for img in imgs]
+
+
+def _img(i: int) -> np.ndarray:
+    return np.full((4, 4), i, dtype=np.uint8)
+
+
+def test_requests_within_the_window_share_a_batch():
+    detector = _FakeDetector()
+    batcher = DetectionBatcher(detector, window_ms=200, max_batch=8)
+    try:
+        futures = [batcher.submit(_img(i)) for i in range(3)]
+        assert [f.result(5) for f in futures] == [[{"id": i}] for i in range(3)]
+    finally:
+        batcher.close()
+    assert detector.batches == [[0, 1, 2]]
+
+
+def test_window_flushes_a_partial_batch():
+    detector = _FakeDetector()
+    batcher = DetectionBatcher(detector, window_ms=20, max_batch=8)
+    try:
+        assert batcher.detect(_img(1)) == [{"id": 1}]
+        assert batcher.detect(_img(2)) == [{"id": 2}]
+    finally:
+        batcher.close()
+    assert detector.batches == [[1], [2]]
+
+
+def test_batches_are_cut_at_max_batch():
+    detector = _FakeDetector()
+    batcher = DetectionBatcher(detector, window_ms=200, max_batch=2)
+    try:
+        futures = [batcher.submit(_img(i)) for i in range(5)]
+        assert [f.result(5)[0]["id"] for f in futures] == list(range(5))
+    finally:
+        batcher.close()
+    assert detector.batches == [[0, 1], [2, 3], [4]]
+
+
+def test_a_failed_batch_fails_every_request_in_it():
+    batcher = DetectionBatcher(_FakeDetector(fail=True), window_ms=200, max_batch=8)
+    try:
+        futures = [batcher.submit(_img(i)) for i in range(3)]
+        for future in futures:
+            with pytest.raises(RuntimeError, match="detector failed"):
+                future.result(5)
+        # The worker survives a failed batch
+        futures = [batcher.submit(_img(i)) for i in range(2)]
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result(5)
+    finally:
+        batcher.close()
+
+
+def test_close_drains_requests_submitted_before_it():
+    detector = _FakeDetector(delay=0.05)
+    batcher = DetectionBatcher(detector, window_ms=0, max_batch=1)
+    futures = [batcher.submit(_img(i)) for i in range(4)]
+    batcher.close()
+    assert [f.result(0)[0]["id"] for f in futures] == list(range(4))
+
+
+def test_cancelled_requests_are_left_out_of_the_batch():
+    detector = _FakeDetector()
+    batcher = DetectionBatcher(detector, window_ms=300, max_batch=8)
+    cancel = CancelToken()
+    errors = []
+
+    def waiter():
+        try:
+            batcher.detect(_img(7), cancel)
+        except OCRCancelled as e:
+            errors.append(e.reason)
+
+    try:
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        kept = batcher.submit(_img(1))
+        time.sleep(0.05)
+        cancel.cancel("client_disconnected")
+        thread.join(5)
+        assert errors == ["client_disconnected"]
+        assert kept.result(5) == [{"id": 1}]
+    finally:
+        batcher.close()
+    assert detector.batches == [[1]]
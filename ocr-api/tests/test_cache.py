@@ -0,0 +1,90 @@
+"""ResultCache memory LRU and SQLite disk tier."""
+
+import json
+
+from app.cache import ResultCache
+
+
+def _lines(text: str) -> list[dict]:
+    return [{"text": text}]
+
+
+def _size(lines: list[dict]) -> int:
+    return len(json.dumps(lines, ensure_ascii=False, separators=(",", ":")).encode())
+
+
+def test_memory_tier_evicts_least_recently_used():
+    entry = _size(_lines("a"))
+    cache = ResultCache(max_bytes=3 * entry)
+    for key in "abc":
+        cache.put(key, _lines(key))
+    assert cache.get("a") == _lines("a")  # a is now the most recent
+    cache.put("d", _lines("d"))
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in "acd"] == [_lines(key) for key in "acd"]
+    assert cache.stats()["size_bytes"] == 3 * entry
+
+
+def test_entries_larger_than_the_memory_tier_are_not_kept():
+    cache = ResultCache(max_bytes=4)
+    cache.put("a", _lines("too large"))
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_disk_hit_after_memory_miss(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResultCache(max_bytes=1 << 20, disk_path=path)
+    cache.put("a", _lines("a"))
+    cache.close()
+
+    reopened = ResultCache(max_bytes=1 << 20, disk_path=path)
+    try:
+        assert reopened.get("a") == _lines("a")
+        assert reopened.stats()["disk_hits"] == 1
+        # Promoted into memory: the next hit does not go to disk
+        assert reopened.get("a") == _lines("a")
+        assert reopened.stats()["disk_hits"] == 1
+    finally:
+        reopened.close()
+
+
+def _disk_rows(cache: ResultCache) -> int:
+    (count,) = cache._db.execute("SELECT COUNT(*) FROM results").fetchone()
+    return count
+
+
+def test_disk_tier_stays_within_its_row_limit(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResultCache(max_bytes=0, disk_path=path, disk_max_entries=5)
+    try:
+        for i in range(12):
+            cache.put(str(i), _lines(str(i)))
+            cache.put(str(i), _lines(str(i)))  # overwriting does not add a row
+            assert _disk_rows(cache) == min(i + 1, 5)
+        assert cache._disk_entries == 5
+        # The least recently accessed rows went first
+        assert cache.get("0") is None
+        assert cache.get("11") == _lines("11")
+    finally:
+        cache.close()
+
+    reopened = ResultCache(max_bytes=0, disk_path=path, disk_max_entries=5)
+    try:
+        assert reopened._disk_entries == 5
+    finally:
+        reopened.close()
+
+
+def test_disk_eviction_follows_access_time(tmp_path):
+    cache = ResultCache(max_bytes=0, disk_path=str(tmp_path / "cache.db"), disk_max_entries=2)
+    try:
+        cache.put("a", _lines("a"))
+        cache.put("b", _lines("b"))
+        assert cache.get("a") == _lines("a")  # refreshes a's access time
+        cache.put("c", _lines("c"))
+        assert cache.get("b") is None
+        assert cache.get("a") == _lines("a")
+        assert cache.get("c") == _lines("c")
+    finally:
+        cache.close()
@@ -0,0 +1,148 @@
+"""ImageFetcher against a local stand-in HTTP server.
+
+Run from ocr-api/: python -m pytest tests
+"""
+
+import asyncio
+import gzip
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.fetch import FetchTooLargeError, ImageFetcher
+
+LIMIT = 64 * 1024
+CHUNK = b"x" * 16 * 1024
+# Far more than fits in socket buffers, so only an aborted download stops the server early
+HUGE_CHUNKS = 4096
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        server = self.server
+        with server.lock:
+            server.peers.append(self.client_address)
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            getattr(self, "_" + self.path.strip("/"))()
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def _small(self) -> None:
+        self._send(b"ok")
+
+    def _slow(self) -> None:
+        time.sleep(0.2)
+        self._send(b"ok")
+
+    def _declared_large(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Length", str(LIMIT * 2))
+        self.end_headers()
+        self._stream()
+
+    def _no_length(self) -> None:
+        # No Content-Length: the body runs until the connection closes
+        self.send_response(200)
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        self._stream()
+
+    def _gzip(self) -> None:
+        # Content-Length is the compressed size, well under the limit
+        body = gzip.compress(b"\0" * LIMIT * 16)
+        assert len(body) < LIMIT
+        self.send_response(200)
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send(self, body: bytes) -> None:
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self) -> None:
+        try:
+            for _ in range(HUGE_CHUNKS):
+                self.wfile.write(CHUNK)
+        except OSError:
+            self.server.aborted.set()
+            self.close_connection = True
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.daemon_threads = True
+    httpd.lock = threading.Lock()
+    httpd.peers = []
+    httpd.active = 0
+    httpd.max_active = 0
+    httpd.aborted = threading.Event()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _url(server, path: str) -> str:
+    return f"http://127.0.0.1:{server.server_port}/{path}"
+
+
+async def _fetch_all(fetcher: ImageFetcher, urls: list[str]) -> list:
+    try:
+        return await asyncio.gather(*(fetcher.fetch(url) for url in urls), return_exceptions=True)
+    finally:
+        await fetcher.close()
+
+
+def test_declared_oversize_body_is_refused(server):
+    (result,) = asyncio.run(_fetch_all(ImageFetcher(LIMIT), [_url(server, "declared_large")]))
+    assert isinstance(result, FetchTooLargeError)
+
+
+def test_body_without_length_is_aborted_mid_stream(server):
+    (result,) = asyncio.run(_fetch_all(ImageFetcher(LIMIT), [_url(server, "no_length")]))
+    assert isinstance(result, FetchTooLargeError)
+    # The server was cut off long before it had written the whole body
+    assert server.aborted.wait(5)
+
+
+def test_body_larger_than_its_content_length_is_aborted(server):
+    (result,) = asyncio.run(_fetch_all(ImageFetcher(LIMIT), [_url(server, "gzip")]))
+    assert isinstance(result, FetchTooLargeError)
+
+
+def test_connection_is_reused(server):
+    async def sequential():
+        fetcher = ImageFetcher(LIMIT)
+        try:
+            return [await fetcher.fetch(_url(server, "small")) for _ in range(3)]
+        finally:
+            await fetcher.close()
+
+    assert asyncio.run(sequential()) == [b"ok"] * 3
+    assert len(set(server.peers)) == 1
+
+
+def test_per_host_concurrency_is_capped(server):
+    fetcher = ImageFetcher(LIMIT, max_per_host=2)
+    results = asyncio.run(_fetch_all(fetcher, [_url(server, "slow")] * 6))
+    assert results == [b"ok"] * 6
+    assert server.max_active == 2
+    # Idle hosts do not keep a limiter around
+    assert fetcher._hosts == {}
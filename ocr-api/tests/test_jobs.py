@@ -0,0 +1,224 @@
+"""JobStore and JobRunner against a temporary SQLite database."""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.jobs import JobRunner, JobStore
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "jobs.db")
+
+
+def test_crashed_jobs_are_retried_until_max_attempts(db_path):
+    store = JobStore(db_path, max_attempts=2)
+    job_id = store.enqueue("image", b"payload", {})["id"]
+    job, payload = store.claim()
+    assert (job["status"], job["attempts"], payload) == ("running", 1, b"payload")
+    store.close()  # the process dies with the job running
+
+    store = JobStore(db_path, max_attempts=2)
+    assert store.get(job_id)["status"] == "queued"
+    job, _ = store.claim()
+    assert job["attempts"] == 2
+    store.close()
+
+    store = JobStore(db_path, max_attempts=2)
+    try:
+        job = store.get(job_id)
+        assert job["status"] == "failed"
+        assert job["error"] == "Interrupted 2 time(s), giving up"
+        assert store.claim() is None
+    finally:
+        store.close()
+
+
+def test_purge_deletes_only_expired_finished_jobs(db_path):
+    store = JobStore(db_path)
+    try:
+        done = store.enqueue("image", b"", {})["id"]
+        failed = store.enqueue("image", b"", {})["id"]
+        queued = store.enqueue("image", b"", {})["id"]
+        store.claim()
+        store.complete(done, {"lines": []})
+        store.claim()
+        store.fail(failed, "bad image")
+        assert store.purge(3600) == 0
+        time.sleep(0.01)
+        assert store.purge(0) == 2
+        assert store.get(done) is None and store.get(failed) is None
+        assert store.get(queued)["status"] == "queued"
+    finally:
+        store.close()
+
+
+def _runner(store: JobStore, handlers: dict, **kwargs) -> JobRunner:
+    return JobRunner(store, handlers, num_workers=1, result_ttl=3600, webhook_hosts={"127.0.0.1"},
+                     poll_interval=0.01, **kwargs)
+
+
+async def _wait_for(predicate, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_stop_requeues_the_running_job_without_counting_it(db_path):
+    store = JobStore(db_path)
+
+    async def scenario():
+        running = asyncio.Event()
+
+        async def handler(payload, params):
+            running.set()
+            await asyncio.sleep(60)
+
+        runner = _runner(store, {"image": handler})
+        runner.start()
+        job = await runner.submit("image", b"payload", {})
+        await asyncio.wait_for(running.wait(), 5)
+        await runner.stop()
+        return job["id"]
+
+    try:
+        job = store.get(asyncio.run(scenario()))
+        assert (job["status"], job["attempts"], job["started"]) == ("queued", 0, None)
+        assert store.claim()[1] == b"payload"
+    finally:
+        store.close()
+
+
+def test_database_errors_do_not_stop_the_workers(db_path, monkeypatch):
+    store = JobStore(db_path)
+    claim, complete = store.claim, store.complete
+    errors = {"claim": 1, "complete": 1}
+
+    def flaky(name, method):
+        def call(*args):
+            if errors[name]:
+                errors[name] -= 1
+                raise sqlite3.OperationalError("database is locked")
+            return method(*args)
+
+        return call
+
+    monkeypatch.setattr(store, "claim", flaky("claim", claim))
+    monkeypatch.setattr(store, "complete", flaky("complete", complete))
+
+    async def handler(payload, params):
+        return {"text": payload.decode()}
+
+    async def scenario():
+        runner = _runner(store, {"image": handler})
+        runner.start()
+        try:
+            first = (await runner.submit("image", b"a", {}))["id"]
+            second = (await runner.submit("image", b"b", {}))["id"]
+            await _wait_for(lambda: store.get(second)["status"] == "done")
+        finally:
+            await runner.stop()
+        return first, second
+
+    try:
+        first, second = asyncio.run(scenario())
+        # The first outcome was lost with the failed write and waits for a restart
+        assert store.get(first)["status"] == "running"
+        assert store.get(second)["result"] == {"text": "b"}
+    finally:
+        store.close()
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.calls += 1
+        if self.server.calls <= self.server.failures:
+            self.send_response(503)
+        else:
+            self.server.received.append(json.loads(body))
+            self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def webhook_server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _WebhookHandler)
+    httpd.daemon_threads = True
+    httpd.calls = 0
+    httpd.failures = 0
+    httpd.received = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_webhooks_report_the_final_state(db_path, webhook_server):
+    url = f"http://127.0.0.1:{webhook_server.server_port}/hook"
+    store = JobStore(db_path)
+
+    async def ok(payload, params):
+        return {"text": "ok"}
+
+    async def broken(payload, params):
+        raise ValueError("unreadable image")
+
+    async def scenario():
+        runner = _runner(store, {"ok": ok, "broken": broken})
+        runner.start()
+        try:
+            with pytest.raises(ValueError, match="not allowed"):
+                await runner.submit("ok", b"", {}, callback_url="http://example.com/hook")
+            await runner.submit("ok", b"", {}, callback_url=url)
+            await runner.submit("broken", b"", {}, callback_url=url)
+            await _wait_for(lambda: len(webhook_server.received) == 2)
+        finally:
+            await runner.stop()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        store.close()
+    by_kind = {job["kind"]: job for job in webhook_server.received}
+    assert (by_kind["ok"]["status"], by_kind["ok"]["result"]) == ("done", {"text": "ok"})
+    assert (by_kind["broken"]["status"], by_kind["broken"]["error"]) == ("failed", "unreadable image")
+    assert all("callback_url" not in job for job in webhook_server.received)
+
+
+def test_webhooks_are_retried(db_path, webhook_server, monkeypatch):
+    webhook_server.failures = 2
+    url = f"http://127.0.0.1:{webhook_server.server_port}/hook"
+    store = JobStore(db_path)
+    real_sleep = asyncio.sleep
+    # Skip the backoff between attempts
+    monkeypatch.setattr("app.jobs.asyncio.sleep", lambda delay: real_sleep(min(delay, 0.01)))
+
+    async def ok(payload, params):
+        return {}
+
+    async def scenario():
+        runner = _runner(store, {"ok": ok})
+        runner.start()
+        try:
+            await runner.submit("ok", b"", {}, callback_url=url)
+            await _wait_for(lambda: webhook_server.received)
+        finally:
+            await runner.stop()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        store.close()
+    assert webhook_server.calls == 3
@@ -0,0 +1,57 @@
+"""Application middleware and endpoints, without loading the OCR models."""
+
+import asyncio
+
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, StreamingResponse
+
+from app import main, metrics
+
+
+def _in_flight() -> float:
+    return metrics.REQUESTS_IN_FLIGHT._value.get()
+
+
+async def _call(asgi_app, path: str) -> list[dict]:
+    messages = []
+
+    async def receive():
+        await asyncio.sleep(3600)  # the client never disconnects
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi_app({"type": "http", "method": "GET", "path": path, "headers": []}, receive, send)
+    return messages
+
+
+def test_in_flight_gauge_covers_the_whole_streamed_response():
+    seen = []
+
+    async def chunks():
+        for _ in range(3):
+            seen.append(_in_flight())
+            yield b"x"
+
+    async def endpoint(scope, receive, send):
+        assert Request(scope).state.arrived > 0
+        await StreamingResponse(chunks())(scope, receive, send)
+
+    before = _in_flight()
+    messages = asyncio.run(_call(main.InFlightMiddleware(endpoint), "/ocr/stream"))
+    assert seen == [before + 1] * 3
+    assert _in_flight() == before
+    assert [m["type"] for m in messages][-1] == "http.response.body"
+    assert not messages[-1].get("more_body", False)
+
+
+def test_probes_are_not_counted():
+    seen = []
+
+    async def endpoint(scope, receive, send):
+        seen.append(_in_flight())
+        await PlainTextResponse("ok")(scope, receive, send)
+
+    before = _in_flight()
+    asyncio.run(_call(main.InFlightMiddleware(endpoint), "/livez"))
+    assert seen == [before]
@@ -0,0 +1,50 @@
+"""Cascade tier reading with a stand-in recognizer."""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from app.ocr_engine import CancelToken, OCRCancelled, RecogLine, _read_tier
+
+
+class _FakeRecognizer:
+    max_batch_size = 4
+
+    def __init__(self, cancel: CancelToken | None = None, cancel_after: int = 0) -> None:
+        self.batches: list[list[int]] = []
+        self._lock = threading.Lock()
+        self._cancel = cancel
+        self._cancel_after = cancel_after
+
+    def read_batch(self, imgs):
+        with self._lock:
+            self.batches.append([int(img[0, 0]) for img in imgs])
+            if self._cancel is not None and len(self.batches) == self._cancel_after:
+                self._cancel.cancel("client_disconnected")
+        return [str(int(img[0, 0])) for img in imgs]
+
+
+def _lines(n: int) -> list[RecogLine]:
+    return [RecogLine(np.full((4, 4), i, dtype=np.uint8), i, 10) for i in range(n)]
+
+
+@pytest.mark.parametrize("num_workers", [1, 2, 3])
+def test_tier_is_read_in_model_sized_batches_in_order(num_workers):
+    recognizer = _FakeRecognizer()
+    with ThreadPoolExecutor(num_workers) as executor:
+        preds = _read_tier(executor, num_workers, recognizer, _lines(21))
+    assert preds == [str(i) for i in range(21)]
+    assert all(len(batch) <= recognizer.max_batch_size for batch in recognizer.batches)
+    assert sorted(i for batch in recognizer.batches for i in batch) == list(range(21))
+
+
+def test_cancel_stops_the_tier_between_batches():
+    cancel = CancelToken()
+    recognizer = _FakeRecognizer(cancel, cancel_after=2)
+    with ThreadPoolExecutor(1) as executor:
+        with pytest.raises(OCRCancelled):
+            _read_tier(executor, 1, recognizer, _lines(40), cancel)
+    # 10 batches were needed; the runs after the cancellation were skipped
+    assert len(recognizer.batches) == 2
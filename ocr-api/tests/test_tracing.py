@@ -0,0 +1,23 @@
+"""RequestTrace timings and profile dumps."""
+
+import os
+
+from app.tracing import RequestTrace
+
+
+def _work(x, time_keeper):
+    time_keeper.record("step", 0.001)
+    return x * 2
+
+
+def test_profile_is_written_to_the_profile_dir(tmp_path):
+    trace = RequestTrace(str(tmp_path))
+    assert trace.run(_work, 21) == 42
+    assert os.listdir(tmp_path) == [trace.profile]
+    assert trace.to_dict()["total_ms"] > 0
+
+
+def test_failed_profile_dump_does_not_fail_the_request(tmp_path):
+    trace = RequestTrace(str(tmp_path / "missing"))
+    assert trace.run(_work, 21) == 42
+    assert trace.profile is None